@@ -0,0 +1,164 @@
+"""
+Admission control for the OCR endpoints.
+
+A global cap on in-flight OCR jobs, a per-client concurrency cap and a
+per-client token bucket keep one noisy client from saturating every core.
+Rejected requests get a fast 429 (client over its share) or 503 (server
+full) with a Retry-After header instead of queueing behind everyone else.
+"""
+import math
+import os
+import threading
+import time
+
+from .utils import metrics
+
+# Endpoints that run OCR and are subject to admission control
+OCR_PATHS = ("/upload-report", "/full-analysis", "/full-analysis/stream", "/templates")
+
+CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "X-Client-ID")
+# Peer addresses (e.g. a reverse proxy) whose CLIENT_HEADER is believed;
+# anyone else could pick a fresh client ID per request to dodge the limits
+TRUSTED_PROXIES = {a.strip() for a in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if a.strip()}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is refused before or during admission."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    def headers(self):
+        if self.retry_after is None:
+            return {}
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float = None) -> float:
+        """Take one token; return 0 on success or the seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.rate <= 0:
+            return math.inf  # never refills
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Tracks in-flight OCR jobs globally and per client."""
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_per_client: int,
+        rate_per_minute: float,
+        burst: int,
+        max_pixels: int,
+        max_pages: int,
+        retry_after: float = 2.0,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_per_client = max_per_client
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_pixels = max_pixels
+        self.max_pages = max_pages
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._per_client = {}
+        self._buckets = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            # More jobs than OCR slots, so the fair queue (ocr_scheduler.py) orders their pages
+            max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(2 * (os.cpu_count() or 1)))),
+            max_per_client=int(os.getenv("ADMISSION_MAX_PER_CLIENT", "2")),
+            rate_per_minute=float(os.getenv("ADMISSION_RATE_PER_MINUTE", "30")),
+            burst=int(os.getenv("ADMISSION_BURST", "5")),
+            max_pixels=int(os.getenv("MAX_PIXELS_PER_REQUEST", "40000000")),
+            max_pages=int(os.getenv("MAX_PAGES_PER_REQUEST", "20")),
+            retry_after=float(os.getenv("ADMISSION_RETRY_AFTER", "2")),
+        )
+
+    def acquire(self, client_id: str):
+        """Admit one job for `client_id` or raise AdmissionRejected."""
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                metrics.incr("admission.rejected_global")
+                raise AdmissionRejected(503, "Server is busy, please retry shortly", self.retry_after)
+            if self._per_client.get(client_id, 0) >= self.max_per_client:
+                metrics.incr("admission.rejected_concurrency")
+                raise AdmissionRejected(429, "Too many concurrent requests for this client", self.retry_after)
+            # A rate of 0 turns the per-client rate limit off
+            if self.rate > 0:
+                bucket = self._buckets.get(client_id)
+                if bucket is None:
+                    bucket = self._buckets[client_id] = TokenBucket(self.rate, self.burst)
+                wait = bucket.take()
+                if wait > 0:
+                    metrics.incr("admission.rejected_rate")
+                    raise AdmissionRejected(429, "Rate limit exceeded for this client", wait)
+                self._prune(bucket.updated)
+            self._in_flight += 1
+            self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+            metrics.incr("admission.admitted")
+            metrics.set_value("admission.in_flight", self._in_flight)
+
+    def release(self, client_id: str):
+        with self._lock:
+            self._in_flight -= 1
+            count = self._per_client.get(client_id, 1) - 1
+            if count:
+                self._per_client[client_id] = count
+            else:
+                self._per_client.pop(client_id, None)
+            metrics.set_value("admission.in_flight", self._in_flight)
+
+    def check_budget(self, pages: int, pixels: int):
+        """Reject documents whose page count or pixel count exceeds the per-request budget."""
+        if pages > self.max_pages:
+            metrics.incr("admission.rejected_budget")
+            raise AdmissionRejected(413, f"Document has {pages} pages, limit is {self.max_pages}")
+        if pixels > self.max_pixels:
+            metrics.incr("admission.rejected_budget")
+            raise AdmissionRejected(413, f"Document has {pixels} pixels, limit is {self.max_pixels}")
+
+    def _prune(self, now: float):
+        # Drop buckets that have refilled completely and have no running jobs
+        if len(self._buckets) < 1024:
+            return
+        full_after = self.burst / self.rate
+        for cid in [c for c, b in self._buckets.items()
+                    if now - b.updated > full_after and c not in self._per_client]:
+            del self._buckets[cid]
+
+
+def get_client_id(request) -> str:
+    """
+    Identify the client by its address, or by CLIENT_HEADER when the request
+    comes through one of TRUSTED_PROXIES.
+    """
+    host = request.client.host if request.client else "unknown"
+    if host in TRUSTED_PROXIES:
+        return request.headers.get(CLIENT_HEADER) or host
+    return host
+
+
+controller = AdmissionController.from_env()
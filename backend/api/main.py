@@ -1,14 +1,27 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
 from pathlib import Path
+import asyncio
+import hmac
+import json
 import logging
+import math
 import os
+import time
 from dotenv import load_dotenv
 
 # Import services
-from .services import ocr_service, extract_service, ml_service
+from .services import ocr_service, ocr_profiles, ocr_scheduler, extract_service, ml_service, pipeline, history_service
 from .services.disease_service import predict_diseases
+from .services.deadline import Deadline, OCRCancelled
+from .services.pdf_sandbox import PDFSandboxError
+from .utils import metrics
+from .warmup import warm_up
+from . import responses
+from .admission import AdmissionRejected, OCR_PATHS, controller as admission, get_client_id
 
 load_dotenv()
 
@@ -16,20 +29,101 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm caches, the model and Tesseract before accepting traffic."""
+    if os.getenv("WARMUP_ON_STARTUP", "1") != "0":
+        app.state.warmup = await run_in_threadpool(warm_up)
+    from .services import ocr_pool, remote_ocr
+    if remote_ocr.enabled():
+        await run_in_threadpool(remote_ocr.get_tier)
+    yield
+    ocr_pool.shutdown()
+    if remote_ocr.enabled():
+        remote_ocr.get_tier().stop()
+
 app = FastAPI(
     title="Blood Report Analyzer API",
     description="Advanced AI-powered blood report analysis API with OCR, ML prediction, and disease diagnosis",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Add CORS middleware
+# Add CORS middleware (comma-separated CORS_ALLOW_ORIGINS, defaults to the Streamlit UI)
+CORS_ALLOW_ORIGINS = [
+    o.strip() for o in os.getenv(
+        "CORS_ALLOW_ORIGINS", "http://localhost:8501,http://127.0.0.1:8501"
+    ).split(",") if o.strip()
+]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
+    allow_origins=CORS_ALLOW_ORIGINS,
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
 )
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers())
+
+@app.exception_handler(PDFSandboxError)
+async def pdf_rejected_handler(request: Request, exc: PDFSandboxError):
+    """PDFs that broke the sandbox's CPU, wall-clock or memory limits."""
+    return JSONResponse(exc.as_dict(), status_code=422)
+
+class AdmissionControl:
+    """
+    Admit or reject OCR requests before their upload body is read.
+    
+    Plain ASGI rather than @app.middleware("http"), whose wrapping of the
+    request stream keeps request.is_disconnected() from ever seeing the
+    client go away.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in OCR_PATHS:
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        client_id = get_client_id(request)
+        try:
+            admission.acquire(client_id)
+        except AdmissionRejected as e:
+            response = await admission_rejected_handler(request, e)
+            return await response(scope, receive, send)
+        # The app returns once the body is fully sent, so streamed responses count too
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.release(client_id)
+
+class RecordLatency:
+    """Record per-endpoint latency up to the response headers, keeping the first request separately."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                metrics.observe(f"request.{scope['path']}", elapsed_ms)
+                if metrics.get_value("first_request_ms") is None:
+                    metrics.set_value("first_request_ms", round(elapsed_ms, 2))
+            await send(message)
+        
+        await self.app(scope, receive, send_and_record)
+
+app.add_middleware(AdmissionControl)
+app.add_middleware(RecordLatency)
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -40,12 +134,132 @@ async def root():
         "endpoints": {
             "upload": "/upload-report",
             "analyze": "/analyze",
+            "bulk_analyze": "/bulk-analyze",
+            "history": "/history/{patient_id}",
+            "rules": "/rules",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
 
+@app.get("/rules")
+async def get_rules(request: Request):
+    """
+    Disease rules, normal ranges and the text behind compact response codes.
+
+    Static for the life of the process, so it carries an ETag and can be cached.
+    """
+    return responses.rules_response(request)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Warm-up timings, request latencies and counters."""
+    return metrics.snapshot()
+
+@app.get("/ocr-workers")
+async def get_ocr_workers():
+    """Remote OCR worker membership and load (empty when OCR runs locally)."""
+    from .services import remote_ocr
+    return {"workers": remote_ocr.status(), "local_fallback": remote_ocr.LOCAL_FALLBACK}
+
+async def check_document_budget(content: bytes):
+    """Reject uploads whose page or pixel count is over the per-request budget."""
+    pages, pixels = await run_in_threadpool(ocr_service.inspect_document, content)
+    admission.check_budget(pages, pixels)
+
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "1") != "0"
+
+# Managing templates (they change how every later upload is read) and reading
+# stored reports and patient history take this token ("Authorization: Bearer
+# <token>"); unset, they are refused
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Server-side OCR deadline; kept below the frontend's 120s request timeout
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "110"))
+DISCONNECT_POLL_SECONDS = 0.5
+MIN_REQUEST_TIMEOUT_SECONDS = 0.1
+
+def request_deadline(request: Request, priority: str = None) -> Deadline:
+    """
+    Build the OCR deadline, letting clients tighten it with X-Request-Timeout.
+    
+    The header is clamped to [MIN_REQUEST_TIMEOUT_SECONDS, REQUEST_DEADLINE_SECONDS]:
+    zero, negative or non-finite values never lift the server's deadline.
+    """
+    timeout = REQUEST_DEADLINE_SECONDS
+    try:
+        requested = float(request.headers.get("X-Request-Timeout", timeout))
+    except ValueError:
+        requested = timeout
+    if math.isfinite(requested):
+        timeout = min(timeout, max(MIN_REQUEST_TIMEOUT_SECONDS, requested))
+    return Deadline(timeout, priority)
+
+def request_priority(request: Request) -> str:
+    """OCR scheduling class chosen with the X-OCR-Priority header; 400 if it is unknown."""
+    priority = request.headers.get("X-OCR-Priority") or None
+    try:
+        ocr_scheduler.check_priority(priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return priority
+
+def request_profile(request: Request) -> str:
+    """OCR profile chosen with the X-OCR-Profile header; 400 if it is unknown or a cell profile."""
+    profile = request.headers.get("X-OCR-Profile") or None
+    try:
+        ocr_profiles.check_page_profile(profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profile
+
+def dedup_scope(request: Request, patient_id: str = None) -> str:
+    """Near-duplicate pages are only shared between uploads of one client (and patient, if given)."""
+    client_id = get_client_id(request)
+    return f"{client_id}/{patient_id}" if patient_id else client_id
+
+def require_admin(request: Request):
+    """403 unless the request carries ADMIN_TOKEN as its bearer token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def check_report_date(report_date: str):
+    """400 unless the report_date form field is absent or an ISO date."""
+    try:
+        history_service.check_report_date(report_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def run_ocr(request: Request, content: bytes, patient_id: str = None) -> str:
+    """
+    Run OCR in the threadpool, cancelling it if the client disconnects or the
+    request deadline passes. Raises HTTPException (499/504) when cancelled.
+    """
+    deadline = request_deadline(request, request_priority(request))
+    profile = request_profile(request)
+    task = asyncio.ensure_future(
+        run_in_threadpool(ocr_service.image_to_text, content, deadline, profile=profile,
+                          dedup_scope=dedup_scope(request, patient_id))
+    )
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if not task.done() and await request.is_disconnected():
+                deadline.cancel("client_disconnected")
+        return task.result()
+    except OCRCancelled as e:
+        metrics.incr("ocr.cancelled")
+        metrics.incr(f"ocr.cancelled.{e.reason}")
+        logger.warning(f"OCR cancelled for {request.url.path}: {e.reason}")
+        if e.reason == "deadline":
+            raise HTTPException(status_code=504, detail="OCR deadline exceeded")
+        raise HTTPException(status_code=499, detail="Client closed request")
+
 @app.post("/upload-report")
-async def upload_report(file: UploadFile = File(...)):
+async def upload_report(request: Request, file: UploadFile = File(...)):
     """
     Upload and process a blood report file (image or PDF).
     
@@ -57,30 +271,35 @@ async def upload_report(file: UploadFile = File(...)):
         logger.info(f"Processing file: {file.filename}")
         content = await file.read()
         logger.info(f"File size: {len(content)} bytes")
+        await check_document_budget(content)
         
         # Extract text using OCR
-        text = ocr_service.image_to_text(content)
+        text = await run_ocr(request, content)
         logger.info(f"OCR extraction complete, text length: {len(text)}")
         
         # Extract key-value pairs
         values = extract_service.extract_key_values(text)
         logger.info(f"Extracted {len(values)} parameters")
         
-        return JSONResponse({
+        return responses.json_response(request, {
             "status": "success",
             "text": text,
             "values": values,
             "parameters_extracted": len(values)
         })
+    except (AdmissionRejected, HTTPException, PDFSandboxError):
+        raise
     except Exception as e:
         logger.error(f"Error in upload_report: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 @app.post("/analyze")
-async def analyze(values: dict):
+async def analyze(request: Request, values: dict, fields: str = None, exclude: str = None, compact: bool = False):
     """
     Analyze blood test parameters.
     
+    `fields`, `exclude` and `compact` shape the response (see responses.py).
+    
     Returns:
         - comparison: Values compared with normal ranges
         - prediction: Overall health risk assessment
@@ -103,56 +322,284 @@ async def analyze(values: dict):
         
         logger.info(f"Analysis complete: Overall risk = {prediction.get('overall_risk')}")
         
-        return JSONResponse({
+        return responses.shaped_response(request, {
             "status": "success",
             "comparison": comparison,
             "prediction": prediction,
             "diseases": diseases_data
-        })
+        }, fields, exclude, compact)
     except Exception as e:
         logger.error(f"Error in analyze: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error analyzing values: {str(e)}")
 
 @app.post("/full-analysis")
-async def full_analysis(file: UploadFile = File(...)):
+async def full_analysis(
+    request: Request,
+    file: UploadFile = File(...),
+    patient_id: str = Form(None),
+    report_date: str = Form(None),
+    fields: str = None,
+    exclude: str = None,
+    compact: bool = False
+):
     """
     Complete analysis pipeline: Upload report -> Extract -> Analyze.
     
+    Complete results are stored in the history database by content hash, so
+    uploading the same report again with the same OCR profile returns the
+    stored result without another OCR pass.
+    `fields`, `exclude` (e.g. `exclude=extracted_text`) and `compact` shape the
+    response; the full result is always what gets stored.
+    
     Returns:
         Combined results from extraction and analysis
     """
     try:
         logger.info(f"Starting full analysis for: {file.filename}")
         
-        # Step 1: Upload and extract
+        # Step 1: Upload and extract (or reuse a stored result)
+        check_report_date(report_date)
         content = await file.read()
-        text = ocr_service.image_to_text(content)
+        sha256 = pipeline.content_hash(content)
+        ocr_key = pipeline.ocr_key(request_profile(request))
+        if HISTORY_ENABLED:
+            stored = await run_in_threadpool(history_service.get_by_hash, sha256, ocr_key)
+            if stored is not None:
+                metrics.incr("history.hits")
+                await run_in_threadpool(history_service.link_report, sha256, patient_id, report_date)
+                stored["cached"] = True
+                return responses.shaped_response(request, stored, fields, exclude, compact)
+        await check_document_budget(content)
+        text = await run_ocr(request, content, patient_id)
         values = extract_service.extract_key_values(text)
         
         # Step 2: Analyze
-        comparison = ml_service.compare_with_ranges(values)
-        prediction = ml_service.predict_risk(values)
-        diseases_data = predict_diseases(values)
+        result = pipeline.build_full_result(file.filename, text, values)
+        if HISTORY_ENABLED and ocr_service.is_clean(text):
+            await run_in_threadpool(history_service.save_report, result, sha256, patient_id, report_date,
+                                    ocr_key)
         
         logger.info("Full analysis completed successfully")
         
-        return JSONResponse({
-            "status": "success",
-            "file_name": file.filename,
-            "extracted_text": text,
-            "parameters": {
-                "extracted": values,
-                "comparison": comparison
-            },
-            "health_assessment": {
-                "risk_prediction": prediction,
-                "disease_predictions": diseases_data
-            }
-        })
+        return responses.shaped_response(request, result, fields, exclude, compact)
+    except (AdmissionRejected, HTTPException, PDFSandboxError):
+        raise
     except Exception as e:
         logger.error(f"Error in full_analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error in full analysis: {str(e)}")
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/full-analysis/stream")
+async def full_analysis_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    patient_id: str = Form(None),
+    report_date: str = Form(None),
+    fields: str = None,
+    exclude: str = None,
+    compact: bool = False
+):
+    """
+    Streaming variant of /full-analysis using server-sent events.
+    
+    Emits one event per stage as it completes: pdf_text, page_rasterized,
+    page_ocr and partial_values (per page), then `result` with the same body as
+    /full-analysis (shaped the same way), or `error`. Closing the connection
+    cancels the OCR work.
+    """
+    check_report_date(report_date)
+    content = await file.read()
+    file_name = file.filename
+    sha256 = pipeline.content_hash(content)
+    profile = request_profile(request)
+    ocr_key = pipeline.ocr_key(profile)
+    priority = request_priority(request)
+    scope = dedup_scope(request, patient_id)
+    
+    async def events():
+        if HISTORY_ENABLED:
+            stored = await run_in_threadpool(history_service.get_by_hash, sha256, ocr_key)
+            if stored is not None:
+                metrics.incr("history.hits")
+                await run_in_threadpool(history_service.link_report, sha256, patient_id, report_date)
+                stored["cached"] = True
+                yield sse_event("result", responses.shape(stored, fields, exclude, compact))
+                return
+        try:
+            await check_document_budget(content)
+        except AdmissionRejected as e:
+            yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
+            return
+        except PDFSandboxError as e:
+            yield sse_event("error", {"status_code": 422, **e.as_dict()})
+            return
+        
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        deadline = request_deadline(request, priority)
+        page_texts = []
+        
+        def progress(event, data):
+            loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+        
+        task = asyncio.ensure_future(
+            run_in_threadpool(ocr_service.image_to_text, content, deadline, progress, profile=profile,
+                              dedup_scope=scope)
+        )
+        task.add_done_callback(lambda _: loop.call_soon_threadsafe(queue.put_nowait, None))
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                event, data = item
+                yield sse_event(event, data)
+                if event == "page_ocr":
+                    page_texts.append(data.get("text", ""))
+                    partial = extract_service.extract_key_values("\n".join(page_texts))
+                    yield sse_event("partial_values", {"page": data["page"], "values": partial})
+            
+            text = task.result()
+            values = extract_service.extract_key_values(text)
+            result = pipeline.build_full_result(file_name, text, values)
+            if HISTORY_ENABLED and ocr_service.is_clean(text):
+                await run_in_threadpool(history_service.save_report, result, sha256, patient_id, report_date,
+                                        ocr_key)
+            yield sse_event("result", responses.shape(result, fields, exclude, compact))
+        except OCRCancelled as e:
+            metrics.incr("ocr.cancelled")
+            metrics.incr(f"ocr.cancelled.{e.reason}")
+            yield sse_event("error", {"status_code": 504, "detail": f"OCR cancelled: {e.reason}"})
+        except PDFSandboxError as e:
+            yield sse_event("error", {"status_code": 422, **e.as_dict()})
+        except Exception as e:
+            logger.error(f"Error in full_analysis_stream: {str(e)}")
+            yield sse_event("error", {"status_code": 500, "detail": f"Error in full analysis: {str(e)}"})
+        finally:
+            # Runs when the client disconnects too: stop the OCR thread
+            if not task.done():
+                deadline.cancel("client_disconnected")
+                metrics.incr("ocr.cancelled")
+                metrics.incr("ocr.cancelled.client_disconnected")
+                # Nobody reads its OCRCancelled now; retrieve it so asyncio does not log it
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/reports/{sha256}")
+async def get_report(request: Request, sha256: str, fields: str = None, exclude: str = None, compact: bool = False):
+    """Return a stored analysis by the SHA-256 of the uploaded file (admin token required)."""
+    require_admin(request)
+    result = await run_in_threadpool(history_service.get_by_hash, sha256)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return responses.shaped_response(request, result, fields, exclude, compact)
+
+@app.get("/history/{patient_id}")
+async def get_history(request: Request, patient_id: str, limit: int = 50, before: str = None,
+                      before_id: int = None):
+    """
+    List a patient's stored reports, newest first (admin token required).
+    
+    A full page comes with `next`, the `before` and `before_id` query
+    parameters that fetch the page after it.
+    """
+    require_admin(request)
+    limit = max(1, min(limit, 500))
+    reports = await run_in_threadpool(history_service.get_history, patient_id, limit, before, before_id)
+    body = {"patient_id": patient_id, "reports": reports}
+    if len(reports) == limit:
+        body["next"] = {"before": reports[-1]["report_date"], "before_id": reports[-1]["id"]}
+    return body
+
+@app.get("/history/{patient_id}/trend/{parameter}")
+async def get_trend(request: Request, patient_id: str, parameter: str, start: str = None, end: str = None):
+    """Time series of one parameter for a patient, optionally limited to [start, end] (admin token required)."""
+    require_admin(request)
+    series = await run_in_threadpool(history_service.get_trend, patient_id, parameter, start, end)
+    return {"patient_id": patient_id, "parameter": parameter, "series": series}
+
+@app.get("/templates")
+async def list_templates():
+    """Enrolled lab templates used for region-targeted OCR."""
+    from .services import template_service
+    return {"templates": template_service.get_registry().list()}
+
+@app.post("/templates")
+async def enroll_template(
+    request: Request,
+    name: str = Form(...),
+    file: UploadFile = File(...),
+    profile: str = Form("numeric")
+):
+    """
+    Enrol the first page of a report as a lab template.
+
+    Later pages with the same layout only OCR the value cells found here,
+    using OCR `profile`.
+    """
+    from .services import template_service
+    require_admin(request)
+    try:
+        content = await file.read()
+        await check_document_budget(content)
+        template = await run_in_threadpool(
+            template_service.enroll_document, name, content, request_deadline(request), profile
+        )
+        return {"status": "success", "template": template}
+    except (AdmissionRejected, HTTPException, PDFSandboxError):
+        raise
+    except OCRCancelled:
+        raise HTTPException(status_code=504, detail="OCR deadline exceeded")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in enroll_template: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error enrolling template: {str(e)}")
+
+@app.delete("/templates/{template_id}")
+async def delete_template(request: Request, template_id: str):
+    from .services import template_service
+    require_admin(request)
+    if not template_service.get_registry().remove(template_id):
+        raise HTTPException(status_code=404, detail="Template not found")
+    return {"status": "success"}
+
+@app.post("/bulk-analyze")
+async def bulk_analyze(file: UploadFile = File(...), id_column: str = None):
+    """
+    Analyze a structured lab export (CSV, or Parquet/Arrow when pyarrow is installed).
+
+    Each row is one sample; parameter columns may use any alias from mapping.json,
+    and long exports (sample, test, value) are pivoted on `id_column`.
+
+    Returns:
+        The input table with status, risk and disease columns added, in the same format
+    """
+    try:
+        from .services import bulk_service
+        content = await file.read()
+        logger.info(f"Bulk analysis for {file.filename}: {len(content)} bytes")
+        data, fmt = await run_in_threadpool(bulk_service.analyze_bytes, content, file.filename, id_column)
+        return Response(
+            content=data,
+            media_type=bulk_service.MEDIA_TYPES[fmt],
+            headers={"Content-Disposition": f'attachment; filename="analysis.{fmt}"'}
+        )
+    except ImportError as e:
+        raise HTTPException(status_code=415, detail=f"Format not supported on this server: {str(e)}")
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid lab table: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error in bulk_analyze: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error in bulk analysis: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,226 @@
+"""
+Response shaping and encoding for the analysis endpoints.
+
+Clients pick what they get back with query parameters:
+
+    fields=parameters.extracted,health_assessment   keep only these (dotted) paths
+    exclude=extracted_text                          drop these paths
+    compact=true                                    codes instead of prose
+
+Compact results give each disease as confidence/risk/advice codes with the
+matched conditions, and each compared parameter as value/status only. The
+descriptions, symptoms, recommendation text, ranges and units behind the
+codes are served once by GET /rules, with an ETag.
+
+Bodies are serialized with orjson when it is installed (JSON_ENCODER=json
+forces the stdlib) and compressed with br (if `brotli` is installed) or
+gzip when the client accepts it and the body is large enough to benefit.
+"""
+import gzip
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from .services import ml_service
+from .services.disease_service import RISK_LEVEL_CODES, recommendation_code, rule_metadata
+from .utils import metrics
+
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto")
+# Smaller bodies fit in a packet or two; compressing them only costs CPU
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+RULES_MAX_AGE = int(os.getenv("RULES_MAX_AGE", "3600"))
+
+DISEASE_KEYS = ("diseases", "disease_predictions")
+
+
+def _orjson():
+    if JSON_ENCODER == "json":
+        return None
+    try:
+        import orjson
+        return orjson
+    except ImportError:
+        return None
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def dumps(data) -> bytes:
+    """Serialize to compact UTF-8 JSON, with orjson when available."""
+    orjson = _orjson()
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # types orjson does not know; the stdlib may still cope
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _split(paths):
+    if not paths:
+        return []
+    if isinstance(paths, str):
+        paths = paths.split(",")
+    return [p.strip().split(".") for p in paths if p.strip()]
+
+
+def select_fields(data: dict, fields) -> dict:
+    """Keep only the given dotted paths (and "status", so errors stay visible)."""
+    paths = _split(fields)
+    if not paths:
+        return data
+    out = {"status": data["status"]} if "status" in data else {}
+    for path in paths:
+        src, dst = data, out
+        for i, key in enumerate(path):
+            if not isinstance(src, dict) or key not in src:
+                break
+            if i == len(path) - 1:
+                dst[key] = src[key]
+            else:
+                src = src[key]
+                dst = dst.setdefault(key, {})
+    return out
+
+
+def exclude_fields(data: dict, exclude) -> dict:
+    """Drop the given dotted paths, copying only the dicts on the way."""
+    for path in _split(exclude):
+        data = _without(data, path)
+    return data
+
+
+def _without(data, path):
+    if not isinstance(data, dict) or path[0] not in data:
+        return data
+    out = dict(data)
+    if len(path) == 1:
+        del out[path[0]]
+    else:
+        out[path[0]] = _without(data[path[0]], path[1:])
+    return out
+
+
+def compact_diseases(diseases: dict) -> dict:
+    possible = diseases.get("possible_diseases", {})
+    return {
+        "possible_diseases": {
+            name: {
+                "confidence": d["confidence"],
+                "risk": RISK_LEVEL_CODES.get(d["risk_level"], d["risk_level"]),
+                "advice": recommendation_code(d["confidence"]),
+                "matched": [m["condition"] for m in d.get("matched_indicators", [])],
+            }
+            for name, d in possible.items()
+        },
+        "top": next(iter(possible), None),
+    }
+
+
+def compact_comparison(comparison: dict) -> dict:
+    return {k: {"value": c.get("value"), "status": c.get("status")} for k, c in comparison.items()}
+
+
+def compact(data):
+    """Replace disease prose and comparison details with codes, wherever they appear."""
+    if not isinstance(data, dict):
+        return data
+    out = {}
+    for key, value in data.items():
+        if key in DISEASE_KEYS and isinstance(value, dict) and "possible_diseases" in value:
+            out[key] = compact_diseases(value)
+        elif key == "comparison" and isinstance(value, dict):
+            out[key] = compact_comparison(value)
+        else:
+            out[key] = compact(value)
+    return out
+
+
+def shape(data: dict, fields: str = None, exclude: str = None, compact_codes: bool = False) -> dict:
+    if compact_codes:
+        data = compact(data)
+    if fields:
+        data = select_fields(data, fields)
+    if exclude:
+        data = exclude_fields(data, exclude)
+    return data
+
+
+def negotiate_encoding(accept_encoding: str):
+    """Best of br/gzip the client accepts (q > 0), or None for identity."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    wildcard = accepted.get("*", 0.0)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and _brotli() is None:
+            continue
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+def encode(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return _brotli().compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def json_response(request: Request, data, status_code: int = 200, headers: dict = None,
+                  body: bytes = None) -> Response:
+    """JSON response for `data` (or pre-serialized `body`), compressed if the client accepts it."""
+    body = dumps(data) if body is None else body
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        # Byte totals, so the compression ratio is their quotient
+        metrics.incr(f"response.{encoding}.raw_bytes", len(body))
+        body = encode(body, encoding)
+        headers["Content-Encoding"] = encoding
+        metrics.incr(f"response.{encoding}.sent_bytes", len(body))
+    return Response(body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def shaped_response(request: Request, data: dict, fields: str = None, exclude: str = None,
+                    compact_codes: bool = False) -> Response:
+    return json_response(request, shape(data, fields, exclude, compact_codes))
+
+
+@lru_cache(maxsize=None)
+def rules_body():
+    """(body, etag) of the static rule metadata; built once per process."""
+    data = rule_metadata()
+    data["normal_ranges"] = ml_service.load_ranges()
+    body = dumps(data)
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def rules_response(request: Request) -> Response:
+    body, etag = rules_body()
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={RULES_MAX_AGE}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip().replace("W/", "", 1) for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers={**headers, "Vary": "Accept-Encoding"})
+    return json_response(request, None, headers=headers, body=body)
@@ -0,0 +1,129 @@
+"""
+Fuzzy matching of OCR-damaged labels against the aliases in mapping.json.
+
+Aliases are indexed once by their padded character trigrams. A lookup
+counts shared trigrams through the posting lists of the query's own
+trigrams, so only aliases that share enough of them (q-gram lemma: each
+edit destroys at most three trigrams) reach the bounded edit-distance check.
+
+An edit that turns one known lab label into another ("rbc count" into
+"wbc count") is a different test, not OCR damage, and is never a match.
+"""
+import re
+from collections import Counter
+
+# Short aliases (hb, alt, sgpt, creat, ...) are one edit away from too many
+# unrelated words, so they are only ever matched exactly
+MIN_FUZZY_LENGTH = 6
+
+# Digits OCR commonly produces inside words: Hemog1obin, Bi1irubin, Plate1ets, C0unt
+OCR_CONFUSIONS = str.maketrans({"0": "o", "1": "l"})
+DIGIT_IN_WORD_RE = re.compile(r"(?<=[a-z])[01]+(?=[a-z])|(?<=[a-z])[01]+\b|\b[01]+(?=[a-z])")
+
+# Labels of tests the mapping does not extract that sit on the same reports,
+# often one letter away from one it does (rbc/wbc, mch/mchc, ...)
+OTHER_LABELS = (
+    "rbc", "rbcs", "hct", "pcv", "mcv", "mch", "mchc", "rdw", "mpv", "esr",
+    "neutrophils", "lymphocytes", "monocytes", "eosinophils", "basophils",
+    "ggt", "alp", "albumin", "globulin", "protein", "urea", "bun", "glucose",
+    "sodium", "potassium", "chloride", "calcium", "cholesterol",
+)
+
+
+def trigrams(s: str):
+    s = f"  {s}  "
+    return [s[i:i + 3] for i in range(len(s) - 2)]
+
+
+def max_edits(length: int) -> int:
+    return 1 if length < 8 else 2
+
+
+def levenshtein(a: str, b: str, limit: int) -> int:
+    """Edit distance between a and b, or limit + 1 as soon as it must exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+def fix_ocr_digits(text: str) -> str:
+    """Turn 0/1 glued to letters back into o/l."""
+    return DIGIT_IN_WORD_RE.sub(lambda m: m.group(0).translate(OCR_CONFUSIONS), text)
+
+
+class AliasIndex:
+    """Trigram index over (alias, standard key) pairs."""
+
+    def __init__(self, aliases, other_labels=OTHER_LABELS):
+        aliases = list(aliases)
+        self.aliases = [(a, key) for a, key in aliases if len(a) >= MIN_FUZZY_LENGTH]
+        # Every word of a known label, with the keys it belongs to (none for other tests)
+        self.labels = {word: set() for word in other_labels}
+        for alias, key in aliases:
+            for word in alias.split():
+                self.labels.setdefault(word, set()).add(key)
+        self.postings = {}
+        for i, (alias, _) in enumerate(self.aliases):
+            for gram in set(trigrams(alias)):
+                self.postings.setdefault(gram, []).append(i)
+
+    def lookup(self, text: str):
+        """
+        Best alias within its edit budget.
+
+        Returns:
+            (standard key, similarity in 0..1) or None
+        """
+        grams = set(trigrams(text))
+        shared = Counter()
+        for gram in grams:
+            for i in self.postings.get(gram, ()):
+                shared[i] += 1
+        best = None
+        for i, count in shared.items():
+            alias, key = self.aliases[i]
+            limit = max_edits(len(alias))
+            # q-gram lemma with padded trigrams: |grams| - 3 * edits must be shared
+            if count < max(len(grams), len(alias) + 2) - 3 * limit:
+                continue
+            d = levenshtein(text, alias, limit)
+            if d > limit or self.swaps_label(text, alias, key):
+                continue
+            score = 1 - d / max(len(text), len(alias))
+            if best is None or score > best[1]:
+                best = (key, round(score, 3))
+        return best
+
+    def swaps_label(self, text: str, alias: str, key: str) -> bool:
+        """Whether a word of `text` that differs from `alias` is itself a label of another test."""
+        words = text.split()
+        alias_words = alias.split()
+        if len(words) != len(alias_words):
+            return False
+        return any(w != a and w in self.labels and key not in self.labels[w]
+                   for w, a in zip(words, alias_words))
+
+    def match(self, label: str):
+        """
+        Match a normalised label (lowercase, alphanumerics and spaces) by the
+        whole label, then by single words and word pairs.
+        """
+        label = fix_ocr_digits(label)
+        words = label.split()
+        spans = [label] + [" ".join(words[i:i + n]) for n in (2, 1) for i in range(len(words) - n + 1)]
+        best = None
+        for span in spans:
+            if len(span) < MIN_FUZZY_LENGTH - 1:
+                continue
+            found = self.lookup(span)
+            if found and (best is None or found[1] > best[1]):
+                best = found
+        return best
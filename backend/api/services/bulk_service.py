@@ -0,0 +1,213 @@
+"""
+Vectorized analysis for structured lab feeds (LIS exports).
+
+Rows are samples and columns are parameters; range comparison, risk
+prediction and disease rules run as column operations over the whole
+table instead of one `/analyze` call per row. CSV is always supported,
+Parquet and Arrow IPC when pyarrow is installed.
+"""
+import io
+import logging
+
+import numpy as np
+import pandas as pd
+
+from . import ml_service
+from .disease_service import DISEASE_RULES, MIN_CONFIDENCE, get_risk_level
+from .extract_service import normalize_key
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ml_service.FEATURES
+
+# Columns recognised as the test name / result in long-format exports
+LONG_PARAM_COLUMNS = ("parameter", "test", "test_name", "analyte")
+LONG_VALUE_COLUMNS = ("value", "result")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+def detect_format(data: bytes, filename: str = "") -> str:
+    """Guess the table format from magic bytes, then the file extension."""
+    if data[:4] == b"PAR1":
+        return "parquet"
+    if data[:6] == b"ARROW1":
+        return "arrow"
+    name = (filename or "").lower()
+    if name.endswith(".parquet"):
+        return "parquet"
+    if name.endswith((".arrow", ".feather", ".ipc")):
+        return "arrow"
+    return "csv"
+
+
+def read_table(data: bytes, fmt: str) -> pd.DataFrame:
+    if fmt == "parquet":
+        return pd.read_parquet(io.BytesIO(data))
+    if fmt == "arrow":
+        return pd.read_feather(io.BytesIO(data))
+    return pd.read_csv(io.BytesIO(data))
+
+
+def write_table(df: pd.DataFrame, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "parquet":
+        df.to_parquet(buf, index=False)
+    elif fmt == "arrow":
+        df.reset_index(drop=True).to_feather(buf)
+    else:
+        df.to_csv(buf, index=False)
+    return buf.getvalue()
+
+
+def normalize_columns(df: pd.DataFrame, id_column: str = None) -> pd.DataFrame:
+    """
+    Bring a lab export into wide form with standard parameter column names.
+
+    Long exports (one row per sample and test) are pivoted on `id_column`;
+    other column headers are mapped through the same aliases as OCR text.
+    """
+    lower = {c.lower(): c for c in df.columns}
+    param_col = next((lower[c] for c in LONG_PARAM_COLUMNS if c in lower), None)
+    value_col = next((lower[c] for c in LONG_VALUE_COLUMNS if c in lower), None)
+    if param_col and value_col:
+        index_col = id_column or next(
+            (c for c in df.columns if c not in (param_col, value_col)), None
+        )
+        if index_col is None:
+            raise ValueError("Long-format input needs a sample id column")
+        df = df.assign(**{param_col: df[param_col].astype(str).map(lambda k: normalize_key(k) or k)})
+        df = df.pivot_table(index=index_col, columns=param_col, values=value_col, aggfunc="last")
+        df.columns.name = None
+        df = df.reset_index()
+
+    renames = {}
+    for c in df.columns:
+        if c in FEATURES or c == id_column or not pd.api.types.is_numeric_dtype(df[c]):
+            continue
+        key = normalize_key(str(c))
+        if key and key not in df.columns and key not in renames.values():
+            renames[c] = key
+    df = df.rename(columns=renames)
+    for f in FEATURES:
+        if f in df.columns:
+            df[f] = pd.to_numeric(df[f], errors="coerce")
+    return df
+
+
+def compare_with_ranges(df: pd.DataFrame) -> pd.DataFrame:
+    """Add a `<param>_status` column (Low/Normal/High/Unknown) per parameter."""
+    ranges = ml_service.load_ranges() or {}
+    out = {}
+    for param in FEATURES:
+        if param not in df.columns:
+            continue
+        values = df[param].to_numpy(dtype=float)
+        if param not in ranges:
+            out[f"{param}_status"] = np.full(len(df), "Unknown", dtype=object)
+            continue
+        low, high = ranges[param].get("any", ranges[param].get("male"))[:2]
+        out[f"{param}_status"] = np.select(
+            [np.isnan(values), values < low, values > high],
+            ["Unknown", "Low", "High"],
+            default="Normal",
+        ).astype(object)
+    return pd.DataFrame(out, index=df.index)
+
+
+def _column(df: pd.DataFrame, name: str) -> np.ndarray:
+    if name in df.columns:
+        return df[name].to_numpy(dtype=float)
+    return np.full(len(df), np.nan)
+
+
+def predict_risk(df: pd.DataFrame) -> pd.DataFrame:
+    """Batch version of ml_service.predict_risk: model where all features exist, rules elsewhere."""
+    with np.errstate(invalid="ignore"):
+        anemia = _column(df, "Hemoglobin") < 11
+        kidney = _column(df, "Creatinine") > 1.3
+        liver = (_column(df, "SGPT") > 56) | (_column(df, "SGOT") > 40)
+    names = np.array(["Anemia_Risk", "Kidney_Risk", "Liver_Risk"], dtype=object)
+    flags = np.column_stack([anemia, kidney, liver])
+    risks = np.array([";".join(names[row]) for row in flags], dtype=object)
+    count = flags.sum(axis=1)
+    overall = np.select([count == 0, count == 1], ["Low", "Medium"], default="High").astype(object)
+    source = np.full(len(df), "rule_based", dtype=object)
+
+    model = ml_service.get_model()
+    X = np.column_stack([_column(df, f) for f in FEATURES])
+    complete = ~np.isnan(X).any(axis=1)
+    if model is not None and complete.any():
+        try:
+            preds = model.predict(X[complete])
+            if hasattr(model, "predict_proba"):
+                probs = model.predict_proba(X[complete]).max(axis=1)
+                model_overall = np.where(probs > 0.7, "High", "Medium")
+            else:
+                model_overall = np.full(len(preds), "Medium")
+            normal = np.array([not p or p == ml_service.NORMAL_LABEL for p in preds])
+            model_overall = np.where(normal, "Low", model_overall)
+            risks[complete] = ["" if n else str(p) for p, n in zip(preds, normal)]
+            overall[complete] = model_overall
+            source[complete] = "model"
+        except Exception as e:
+            logger.warning(f"Batch model prediction failed, using rules: {str(e)}")
+
+    return pd.DataFrame(
+        {"risks": risks, "overall_risk": overall, "risk_source": source}, index=df.index
+    )
+
+
+def predict_diseases(df: pd.DataFrame) -> pd.DataFrame:
+    """Batch version of disease_service.predict_diseases."""
+    confidences = {}
+    for disease, info in DISEASE_RULES.items():
+        score = np.zeros(len(df))
+        for ind in info["indicators"]:
+            col = _column(df, ind["param"])
+            with np.errstate(invalid="ignore"):
+                hit = col < ind["value"] if ind["operator"] == "<" else col > ind["value"]
+            score += np.where(hit, ind["weight"], 0.0)
+        max_weight = sum(ind["weight"] for ind in info["indicators"])
+        conf = np.minimum(score / max_weight * 100, 100) if max_weight > 0 else score * 0
+        confidences[disease] = conf
+
+    diseases = list(confidences)
+    # Rank on rounded confidence (as the per-row service does), threshold on the raw value
+    raw = np.column_stack([confidences[d] for d in diseases])
+    matrix = np.round(raw, 1)
+    order = np.argsort(-matrix, axis=1, kind="stable")
+    ranked = np.take_along_axis(matrix, order, axis=1)
+    ranked_raw = np.take_along_axis(raw, order, axis=1)
+    included = ranked_raw >= MIN_CONFIDENCE
+    names = np.array(diseases, dtype=object)
+
+    possible = [";".join(names[o][i]) for o, i in zip(order, included)]
+    top_conf = ranked[:, 0]
+    has_top = included[:, 0]
+    out = {f"{d}_confidence": matrix[:, j] for j, d in enumerate(diseases)}
+    out["possible_diseases"] = possible
+    out["top_disease"] = np.where(has_top, names[order[:, 0]], "")
+    out["top_confidence"] = np.where(has_top, top_conf, 0.0)
+    out["top_risk_level"] = [get_risk_level(c) if h else "" for c, h in zip(ranked_raw[:, 0], has_top)]
+    return pd.DataFrame(out, index=df.index)
+
+
+def analyze_frame(df: pd.DataFrame, id_column: str = None) -> pd.DataFrame:
+    """Run range comparison, risk prediction and disease rules over a whole table."""
+    df = normalize_columns(df, id_column)
+    return pd.concat(
+        [df, compare_with_ranges(df), predict_risk(df), predict_diseases(df)], axis=1
+    )
+
+
+def analyze_bytes(data: bytes, filename: str = "", id_column: str = None):
+    """Analyze an uploaded table and return (bytes, format) in the same format."""
+    fmt = detect_format(data, filename)
+    result = analyze_frame(read_table(data, fmt), id_column)
+    logger.info(f"Bulk analysis complete: {len(result)} rows ({fmt})")
+    return write_table(result, fmt), fmt
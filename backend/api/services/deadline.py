@@ -0,0 +1,58 @@
+import threading
+import time
+import uuid
+
+
+class OCRCancelled(Exception):
+    """Raised inside the OCR pipeline when its request was cancelled or timed out."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"OCR cancelled: {reason}")
+        self.reason = reason
+
+
+class Deadline:
+    """
+    Per-request deadline and cancellation flag shared with the OCR worker thread.
+
+    The API sets it from the request timeout and cancels it when the client
+    disconnects; the OCR loop checks it between pages and while Tesseract runs.
+    """
+
+    def __init__(self, timeout: float = None, priority: str = None):
+        self.expires_at = time.monotonic() + timeout if timeout is not None else None
+        self.reason = None
+        # OCR scheduling class (see ocr_scheduler.py); None until chosen
+        self.priority = priority
+        self.estimated_cost = None
+        # Sent to remote OCR workers so all of this request's jobs share one flow there
+        self.flow_id = uuid.uuid4().hex
+        # Scheduler flow its Tesseract runs are charged to; None is the deadline itself
+        self.flow = None
+        self._cancelled = threading.Event()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._cancelled.is_set():
+            self.reason = reason
+            self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self):
+        """Seconds left before the deadline, or None if there is no deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self):
+        """Raise OCRCancelled if the request was cancelled or its deadline passed."""
+        if self._cancelled.is_set():
+            raise OCRCancelled(self.reason)
+        if self.expired():
+            self.cancel("deadline")
+            raise OCRCancelled("deadline")
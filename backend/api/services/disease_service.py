@@ -63,6 +63,9 @@ DISEASE_RULES = {
     }
 }
 
+# Diseases scoring below this percentage are not reported
+MIN_CONFIDENCE = 30
+
 
 def predict_diseases(values: dict):
     """
@@ -114,7 +117,7 @@ def predict_diseases(values: dict):
             confidence_percentage = 0
         
         # Only include diseases with at least 30% confidence
-        if confidence_percentage >= 30:
+        if confidence_percentage >= MIN_CONFIDENCE:
             disease_predictions[disease_name] = {
                 "confidence": round(confidence_percentage, 1),
                 "risk_level": get_risk_level(confidence_percentage),
@@ -137,6 +140,40 @@ def predict_diseases(values: dict):
     }
 
 
+# Short codes for the prose above, used by compact API responses; the full
+# text is served once by GET /rules
+RISK_LEVEL_CODES = {
+    "High Risk": "high",
+    "Moderate Risk": "moderate",
+    "Medium Risk": "medium",
+    "Low Risk": "low",
+}
+
+
+def recommendation_code(confidence: float) -> str:
+    """Code for get_recommendation(confidence)."""
+    if confidence >= 80:
+        return "urgent"
+    elif confidence >= 60:
+        return "soon"
+    elif confidence >= 40:
+        return "consult"
+    else:
+        return "monitor"
+
+
+def rule_metadata() -> dict:
+    """Static disease rules and the text behind every compact code."""
+    return {
+        "diseases": DISEASE_RULES,
+        "risk_levels": {code: label for label, code in RISK_LEVEL_CODES.items()},
+        "recommendations": {
+            recommendation_code(c): get_recommendation(c) for c in (80, 60, 40, 0)
+        },
+        "min_confidence": MIN_CONFIDENCE,
+    }
+
+
 def get_risk_level(confidence: float) -> str:
     """Determine risk level based on confidence score."""
     if confidence >= 80:
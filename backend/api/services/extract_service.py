@@ -1,12 +1,14 @@
 import re
 import json
+from functools import lru_cache
 from pathlib import Path
 
 HERE = Path(__file__).parent
 MAPPING_PATH = HERE.parent / "utils" / "mapping.json"
 
+@lru_cache(maxsize=None)
 def get_mapping():
-    """Load mapping dictionary, with fallback if file doesn't exist"""
+    """Load mapping dictionary (cached), with fallback if file doesn't exist"""
     if MAPPING_PATH.exists():
         with open(MAPPING_PATH) as f:
             return json.load(f)
@@ -22,42 +24,96 @@ def get_mapping():
             'bilirubin': ['bilirubin', 'bili']
         }
 
-def normalize_key(k: str):
+# Map to proper key names that match normal_ranges.json
+KEY_MAP = {
+    'hemoglobin': 'Hemoglobin',
+    'wbc': 'WBC',
+    'platelets': 'Platelets',
+    'creatinine': 'Creatinine',
+    'sgpt': 'SGPT',
+    'sgot': 'SGOT',
+    'bilirubin': 'Bilirubin'
+}
+
+def standard_key(std: str) -> str:
+    return KEY_MAP.get(std, std.capitalize())
+
+@lru_cache(maxsize=None)
+def get_alias_index():
+    """Trigram index over the mapping's aliases, built once."""
+    from .alias_index import AliasIndex
+    aliases = []
+    for std, variants in get_mapping().items():
+        for v in variants:
+            aliases.append((re.sub(r'[^a-z0-9 ]+', '', v.lower()).strip(), standard_key(std)))
+    return AliasIndex(aliases)
+
+def match_key(k: str):
+    """
+    Match a label to a standard parameter key.
+
+    Exact alias substrings win with score 1.0; otherwise OCR-damaged labels
+    ("Hemog1obin", "Plate1ets") are matched within a small edit distance.
+
+    Returns:
+        (key, score) or None
+    """
     k = re.sub(r'[^a-z0-9 ]+', '', k.lower())
-    mapping = get_mapping()
-    for std, variants in mapping.items():
+    key = exact_key(k)
+    if key:
+        return key, 1.0
+    return get_alias_index().match(k)
+
+def exact_key(k: str):
+    """Standard key of the first alias contained in normalised label `k`, or None."""
+    for std, variants in get_mapping().items():
         for v in variants:
             if v in k:
-                # Map to proper key names that match normal_ranges.json
-                key_map = {
-                    'hemoglobin': 'Hemoglobin',
-                    'wbc': 'WBC',
-                    'platelets': 'Platelets',
-                    'creatinine': 'Creatinine',
-                    'sgpt': 'SGPT',
-                    'sgot': 'SGOT',
-                    'bilirubin': 'Bilirubin'
-                }
-                return key_map.get(std, std.capitalize())
+                return standard_key(std)
     return None
 
+def normalize_key(k: str):
+    match = match_key(k)
+    return match[0] if match else None
+
+LABEL_WITH_DIGITS_RE = re.compile(r'([A-Za-z][A-Za-z0-9 \-\(\)/]*?)[:\s]+([0-9]+(?:\.[0-9]+)?)')
+
 def extract_key_values(text: str):
-    """Extract blood test parameters and values from text"""
-    data = {}
-    lines = text.splitlines()
-    for line in lines:
+    """
+    Extract blood test parameters and values from text.
+
+    Lines whose label contains an alias are read first; fuzzy matches of
+    OCR-damaged labels only fill parameters no such line provided.
+    """
+    found = []
+    for line in text.splitlines():
         line = line.strip()
         if not line:
             continue
         m = re.search(r'([A-Za-z \-\(\)/]+)[:\s]+([0-9]+(?:\.[0-9]+)?)', line)
-        if m:
-            raw_key = m.group(1).strip()
-            raw_val = m.group(2)
-            key = normalize_key(raw_key)
+        label = re.sub(r'[^a-z0-9 ]+', '', m.group(1).strip().lower()) if m else None
+        key = exact_key(label) if m else None
+        exact = key is not None
+        if m and not exact:
+            match = get_alias_index().match(label)
+            key = match[0] if match else None
+        if key is None:
+            # OCR may put digits inside the label ("Hemog1obin 12.5"); only
+            # fuzzy-match those so real digits (HbA1c) don't hit exact aliases
+            m2 = LABEL_WITH_DIGITS_RE.search(line)
+            if m2:
+                match = get_alias_index().match(re.sub(r'[^a-z0-9 ]+', '', m2.group(1).lower()))
+                if match:
+                    m, key = m2, match[0]
+        if m and key:
             try:
-                val = float(raw_val)
+                val = float(m.group(2))
             except:
                 continue
-            if key:
-                data[key] = val
+            found.append((key, val, exact))
+    exact_keys = {key for key, _, exact in found if exact}
+    data = {}
+    for key, val, exact in found:
+        if exact or key not in exact_keys:
+            data[key] = val
     return data
@@ -0,0 +1,251 @@
+"""
+Embedded report history store (SQLite).
+
+Every analysed report is stored once by content hash together with its
+extracted parameters, so re-opening an old report is a lookup instead of an
+OCR pass, and per-patient trends are served from an index on
+(patient, parameter, date).
+
+Each result is tagged with the fingerprint of the OCR profile and settings
+that produced it (pipeline.ocr_key); a lookup under another fingerprint is a
+miss, and saving the new result replaces the stored one.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+DB_PATH = Path(os.getenv("HISTORY_DB_PATH", PROJECT_ROOT / "data" / "history.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    patient_id TEXT,
+    report_date TEXT NOT NULL,
+    file_name TEXT,
+    overall_risk TEXT,
+    created_at REAL NOT NULL,
+    result_json TEXT NOT NULL,
+    ocr_key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_reports_patient_date
+    ON reports (patient_id, report_date DESC, id DESC);
+
+-- Clustered on the trend key so a series is one contiguous range scan
+CREATE TABLE IF NOT EXISTS measurements (
+    patient_id TEXT NOT NULL,
+    parameter TEXT NOT NULL,
+    report_date TEXT NOT NULL,
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    value REAL NOT NULL,
+    status TEXT,
+    PRIMARY KEY (patient_id, parameter, report_date, report_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_measurements_report ON measurements (report_id);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def get_connection(db_path: Path = None) -> sqlite3.Connection:
+    """Return this thread's connection to the history database, creating the schema once."""
+    db_path = Path(db_path or DB_PATH)
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_path)
+    if conn is None:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        with _init_lock:
+            if db_path not in _initialized:
+                conn.executescript(SCHEMA)
+                _migrate(conn)
+                _initialized.add(db_path)
+        conns[db_path] = conn
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection):
+    """Add columns introduced after a database was created."""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(reports)")}
+    if "ocr_key" not in columns:
+        # Results stored before results were tagged match no fingerprint
+        conn.execute("ALTER TABLE reports ADD COLUMN ocr_key TEXT")
+
+
+def get_by_hash(sha256: str, ocr_key: str = None, db_path: Path = None):
+    """
+    Return the stored /full-analysis result for a report hash, or None.
+
+    With `ocr_key`, only a result produced under that OCR fingerprint is returned.
+    """
+    row = get_connection(db_path).execute(
+        "SELECT result_json, ocr_key FROM reports WHERE sha256 = ?", (sha256,)
+    ).fetchone()
+    if row is None or (ocr_key is not None and row["ocr_key"] != ocr_key):
+        return None
+    return json.loads(row["result_json"])
+
+
+def check_report_date(report_date: str):
+    """
+    Raises:
+        ValueError: `report_date` is not an ISO date (YYYY-MM-DD)
+    """
+    if report_date is None:
+        return
+    try:
+        date.fromisoformat(report_date)
+    except (TypeError, ValueError):
+        raise ValueError(f"report_date must be an ISO date (YYYY-MM-DD), got {report_date!r}")
+
+
+def _measurements(result: dict, patient_id: str, report_date: str, report_id: int):
+    params = result.get("parameters", {})
+    comparison = params.get("comparison", {})
+    return [
+        (patient_id, name, report_date, report_id, float(value), comparison.get(name, {}).get("status"))
+        for name, value in params.get("extracted", {}).items()
+    ]
+
+
+def save_report(result: dict, sha256: str, patient_id: str = None,
+                report_date: str = None, ocr_key: str = None, db_path: Path = None) -> int:
+    """
+    Store a /full-analysis result and its measurements.
+
+    A report already stored under another `ocr_key` gets the new result; its
+    patient and date are kept.
+
+    Returns:
+        The report id (existing id if this hash was already stored)
+    """
+    report_date = report_date or date.today().isoformat()
+    overall_risk = result.get("health_assessment", {}).get("risk_prediction", {}).get("overall_risk")
+
+    conn = get_connection(db_path)
+    with conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO reports "
+            "(sha256, patient_id, report_date, file_name, overall_risk, created_at, result_json, ocr_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (sha256, patient_id, report_date, result.get("file_name"), overall_risk,
+             time.time(), json.dumps(result, ensure_ascii=False), ocr_key),
+        )
+        if cur.rowcount == 0:
+            row = conn.execute(
+                "SELECT id, patient_id, report_date, ocr_key FROM reports WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+            if row["ocr_key"] == ocr_key:
+                return row["id"]
+            conn.execute(
+                "UPDATE reports SET file_name = ?, overall_risk = ?, created_at = ?, result_json = ?, "
+                "ocr_key = ? WHERE id = ?",
+                (result.get("file_name"), overall_risk, time.time(),
+                 json.dumps(result, ensure_ascii=False), ocr_key, row["id"]),
+            )
+            report_id, patient_id, report_date = row["id"], row["patient_id"], row["report_date"]
+            conn.execute("DELETE FROM measurements WHERE report_id = ?", (report_id,))
+        else:
+            report_id = cur.lastrowid
+        if patient_id:
+            conn.executemany(
+                "INSERT OR REPLACE INTO measurements "
+                "(patient_id, parameter, report_date, report_id, value, status) VALUES (?, ?, ?, ?, ?, ?)",
+                _measurements(result, patient_id, report_date, report_id),
+            )
+    return report_id
+
+
+def link_report(sha256: str, patient_id: str = None, report_date: str = None, db_path: Path = None):
+    """
+    File an already stored report under `patient_id` and `report_date`, as if
+    it had just been saved with them.
+
+    A report stored without a patient is claimed by the first one given; one
+    stored for another patient is left alone.
+
+    Returns:
+        The report id, or None if it is not stored or belongs to another patient
+    """
+    if not patient_id and not report_date:
+        return None
+    conn = get_connection(db_path)
+    with conn:
+        row = conn.execute(
+            "SELECT id, patient_id, report_date, result_json FROM reports WHERE sha256 = ?", (sha256,)
+        ).fetchone()
+        if row is None:
+            return None
+        owner = row["patient_id"]
+        if patient_id and owner and owner != patient_id:
+            logger.warning(f"Report {sha256[:12]} is stored for another patient; not linking it")
+            return None
+        patient_id = patient_id or owner
+        report_date = report_date or row["report_date"]
+        if patient_id == owner and report_date == row["report_date"]:
+            return row["id"]
+        conn.execute("UPDATE reports SET patient_id = ?, report_date = ? WHERE id = ?",
+                     (patient_id, report_date, row["id"]))
+        if patient_id:
+            conn.execute("DELETE FROM measurements WHERE report_id = ?", (row["id"],))
+            conn.executemany(
+                "INSERT OR REPLACE INTO measurements "
+                "(patient_id, parameter, report_date, report_id, value, status) VALUES (?, ?, ?, ?, ?, ?)",
+                _measurements(json.loads(row["result_json"]), patient_id, report_date, row["id"]),
+            )
+    return row["id"]
+
+
+def get_history(patient_id: str, limit: int = 50, before: str = None, before_id: int = None,
+                db_path: Path = None):
+    """
+    List a patient's reports, newest first.
+
+    Pass the last row's `report_date` and `id` as `before` and `before_id` to
+    page through long histories; several reports can share a date, so the
+    date alone would skip the rest of them.
+    """
+    sql = ("SELECT id, sha256, report_date, file_name, overall_risk, created_at "
+           "FROM reports WHERE patient_id = ?")
+    args = [patient_id]
+    if before and before_id is not None:
+        sql += " AND (report_date, id) < (?, ?)"
+        args += [before, before_id]
+    elif before:
+        sql += " AND report_date < ?"
+        args.append(before)
+    sql += " ORDER BY report_date DESC, id DESC LIMIT ?"
+    args.append(limit)
+    return [dict(r) for r in get_connection(db_path).execute(sql, args)]
+
+
+def get_trend(patient_id: str, parameter: str, start: str = None, end: str = None,
+              db_path: Path = None):
+    """Return a parameter's time series for a patient, oldest first."""
+    sql = ("SELECT report_date, value, status, report_id FROM measurements "
+           "WHERE patient_id = ? AND parameter = ?")
+    args = [patient_id, parameter]
+    if start:
+        sql += " AND report_date >= ?"
+        args.append(start)
+    if end:
+        sql += " AND report_date <= ?"
+        args.append(end)
+    sql += " ORDER BY report_date, report_id"
+    return [dict(r) for r in get_connection(db_path).execute(sql, args)]
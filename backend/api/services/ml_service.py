@@ -1,27 +1,183 @@
-import joblib
+from functools import lru_cache
 from pathlib import Path
+import hashlib
+import io
 import json
+import logging
+import os
 from .disease_service import predict_diseases
+from ..utils import metrics
+
+logger = logging.getLogger(__name__)
 
 MODEL_PATH = Path(__file__).parent / "predict_model.pkl"
+# Written next to the model by ml_model/train_model.py
+MANIFEST_PATH = MODEL_PATH.with_suffix(".json")
+# Flat-array export of the same model (ml_model/compile_model.py)
+COMPILED_PATH = MODEL_PATH.with_suffix(".compiled")
 RANGES_PATH = Path(__file__).parent.parent / "utils" / "normal_ranges.json"
 
+# Model input order; the manifest must list exactly these
+FEATURES = ["Hemoglobin", "WBC", "Platelets", "Creatinine", "SGPT", "SGOT", "Bilirubin"]
+NORMAL_LABEL = "Normal"
+
+# auto: compiled model if present, else the pickle; or force "compiled" / "sklearn"
+ML_INFERENCE = os.getenv("ML_INFERENCE", "auto")
+# Memory-map the compiled arrays so all workers share one copy in the page cache
+ML_COMPILED_MMAP = os.getenv("ML_COMPILED_MMAP", "1") == "1"
+
+def verify_manifest(manifest: dict, model_bytes: bytes):
+    """Raise ValueError if the model file or its features do not match the manifest."""
+    digest = hashlib.sha256(model_bytes).hexdigest()
+    if manifest.get("sha256") != digest:
+        raise ValueError(f"model checksum {digest[:12]} does not match manifest")
+    if manifest.get("features") != FEATURES:
+        raise ValueError(f"model features {manifest.get('features')} do not match {FEATURES}")
+
+@lru_cache(maxsize=None)
 def load_model():
-    if MODEL_PATH.exists():
-        try:
-            return joblib.load(MODEL_PATH)
-        except Exception:
-            return None
-    return None
+    """
+    Load the risk model once; joblib (and sklearn) are only imported if a model exists.
+
+    A model with a manifest that does not verify is not used (rule-based fallback).
+    """
+    if not MODEL_PATH.exists():
+        return None
+    try:
+        model_bytes = MODEL_PATH.read_bytes()
+        if MANIFEST_PATH.exists():
+            with open(MANIFEST_PATH) as f:
+                manifest = json.load(f)
+            verify_manifest(manifest, model_bytes)
+            import sklearn
+            if manifest.get("sklearn_version") != sklearn.__version__:
+                logger.warning(f"Risk model was trained with scikit-learn {manifest.get('sklearn_version')}, "
+                               f"running {sklearn.__version__}")
+            logger.info(f"Loaded risk model {manifest.get('model')} ({manifest.get('created_at')})")
+        else:
+            logger.warning(f"No manifest at {MANIFEST_PATH}, loading unverified risk model")
+        import joblib
+        return joblib.load(io.BytesIO(model_bytes))
+    except Exception as e:
+        logger.error(f"Risk model not loaded, using rule-based risk: {str(e)}")
+        return None
+
+class CompiledModel:
+    """
+    NumPy evaluator for a compiled tree ensemble or multiclass linear model.
+
+    Reproduces sklearn's predict/predict_proba arithmetic step for step, so
+    results are bit-identical without importing sklearn.
+    """
+
+    def __init__(self, meta: dict, arrays: dict):
+        import numpy as np
+        self._np = np
+        self.kind = meta["kind"]
+        self.classes_ = np.array(meta["classes"])
+        self.depth = meta.get("depth", 0)
+        self.mean = self.scale = None
+        self.__dict__.update(arrays)
+
+    def _tree_proba(self, X):
+        np = self._np
+        # sklearn trees compare float32 inputs against float64 thresholds
+        x = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(x))[:, None]
+        nodes = np.repeat(self.roots[None, :], len(x), axis=0)
+        # Leaves point to themselves, so every path can take `depth` steps
+        for _ in range(self.depth):
+            go_left = x[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.value[nodes].sum(axis=1) / len(self.roots)
+
+    def decision_function(self, X):
+        np = self._np
+        X = np.array(X, dtype=np.float64)
+        if self.mean is not None:
+            X -= self.mean
+        if self.scale is not None:
+            X /= self.scale
+        return X @ self.coef.T + self.intercept
+
+    def predict_proba(self, X):
+        np = self._np
+        if self.kind == "trees":
+            return self._tree_proba(X)
+        scores = self.decision_function(X)
+        scores -= scores.max(axis=1).reshape(-1, 1)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1).reshape(-1, 1)
+        return scores
+
+    def predict(self, X):
+        np = self._np
+        if self.kind == "trees":
+            return self.classes_.take(np.argmax(self._tree_proba(X), axis=1), axis=0)
+        return self.classes_.take(np.argmax(self.decision_function(X), axis=1), axis=0)
+
+def compiled_digest(path: Path) -> str:
+    """SHA-256 over a compiled model directory's files, in name order."""
+    digest = hashlib.sha256()
+    for f in sorted(path.iterdir()):
+        digest.update(f.name.encode())
+        digest.update(f.read_bytes())
+    return digest.hexdigest()
+
+def read_compiled(path: Path, mmap: bool = ML_COMPILED_MMAP) -> CompiledModel:
+    import numpy as np
+    with open(path / "meta.json") as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in meta["arrays"]:
+        array = np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None)
+        # Plain ndarray views over the mapping index faster than np.memmap
+        arrays[name] = np.asarray(array)
+    return CompiledModel(meta, arrays)
+
+@lru_cache(maxsize=None)
+def load_compiled():
+    """Load the compiled risk model once, or None if there is none or it does not verify."""
+    if not COMPILED_PATH.is_dir():
+        return None
+    try:
+        if MANIFEST_PATH.exists():
+            with open(MANIFEST_PATH) as f:
+                compiled = json.load(f).get("compiled") or {}
+            digest = compiled_digest(COMPILED_PATH)
+            if compiled.get("sha256") != digest:
+                raise ValueError(f"compiled model checksum {digest[:12]} does not match manifest")
+        else:
+            logger.warning(f"No manifest at {MANIFEST_PATH}, loading unverified compiled model")
+        model = read_compiled(COMPILED_PATH)
+        logger.info(f"Loaded compiled risk model ({model.kind}, {len(model.classes_)} classes)")
+        return model
+    except Exception as e:
+        logger.error(f"Compiled risk model not loaded: {str(e)}")
+        return None
+
+def get_model():
+    """The risk model to use per ML_INFERENCE, or None for rule-based risk."""
+    if ML_INFERENCE in ("auto", "compiled"):
+        model = load_compiled()
+        if model is not None or ML_INFERENCE == "compiled":
+            return model
+    return load_model()
+
+@lru_cache(maxsize=None)
+def load_ranges():
+    """Load normal ranges once, or None if the file is missing."""
+    if not RANGES_PATH.exists():
+        return None
+    with open(RANGES_PATH) as f:
+        return json.load(f)
 
 def compare_with_ranges(values: dict):
     """Compare extracted values with normal ranges"""
-    if not RANGES_PATH.exists():
+    ranges = load_ranges()
+    if ranges is None:
         return {k: {"value": v, "status": "Unknown"} for k, v in values.items()}
     
-    with open(RANGES_PATH) as f:
-        ranges = json.load(f)
-    
     result = {}
     for k, v in values.items():
         if k not in ranges:
@@ -44,10 +200,10 @@ def compare_with_ranges(values: dict):
 
 def predict_risk(values: dict):
     """Predict health risk based on blood test values"""
-    model = load_model()
-    features = ["Hemoglobin", "WBC", "Platelets", "Creatinine", "SGPT", "SGOT", "Bilirubin"]
-    X = [values.get(f, None) for f in features]
+    model = get_model()
+    X = [values.get(f, None) for f in FEATURES]
     if model is None or any(x is None for x in X):
+        metrics.incr("ml.rule_based" if model is None else "ml.rule_based.missing_features")
         return rule_based(values)
     try:
         pred = model.predict([X])[0]
@@ -55,8 +211,11 @@ def predict_risk(values: dict):
         if hasattr(model, "predict_proba"):
             prob = max(model.predict_proba([X])[0])
         # Return risks as list of strings and overall risk as string
-        risks = [str(pred)] if pred else []
-        overall_risk = "High" if prob and prob > 0.7 else "Medium" if prob else "Medium"
+        risks = [str(pred)] if pred and pred != NORMAL_LABEL else []
+        if not risks:
+            overall_risk = "Low"
+        else:
+            overall_risk = "High" if prob and prob > 0.7 else "Medium"
         return {"risks": risks, "overall_risk": overall_risk}
     except Exception:
         return rule_based(values)
@@ -0,0 +1,132 @@
+"""
+Process pool for parallel page OCR.
+
+With OCR_PROCESS_WORKERS > 0, tiled strips are OCR'd in worker processes:
+the page goes into shared memory once (see shared_pages.py) and each task
+carries only the segment descriptor and its row range, so no pixels are
+pickled. Cropping, PNG encoding and TSV parsing then run outside the API
+process's GIL. When the request is cancelled the page's cancel flag is set,
+and strips already running kill their Tesseract process.
+"""
+import logging
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from .deadline import Deadline, OCRCancelled
+from .shared_pages import SharedPage, cancel_flag, open_page, cleanup_leaked_segments
+from ..utils import metrics
+
+logger = logging.getLogger(__name__)
+
+OCR_PROCESS_WORKERS = int(os.getenv("OCR_PROCESS_WORKERS", "0"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return OCR_PROCESS_WORKERS > 0
+
+
+def _init_worker():
+    # Ctrl+C reaches the whole process group; the API process shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            cleanup_leaked_segments()
+            _pool = ProcessPoolExecutor(max_workers=OCR_PROCESS_WORKERS, initializer=_init_worker)
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+class StripDeadline(Deadline):
+    """A strip task's deadline, also cancelled by the page's shared cancel flag."""
+
+    def __init__(self, timeout, page_cancelled):
+        super().__init__(timeout)
+        self._page_cancelled = page_cancelled
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._cancelled.is_set() and self._page_cancelled():
+            self.cancel("cancelled")
+        return self._cancelled.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise OCRCancelled(self.reason)
+        super().check()
+
+
+def _ocr_rows(desc, rows, config: str, timeout):
+    """Worker task: OCR rows [top, bottom) of a shared page and return its words."""
+    from . import ocr_service
+    with open_page(desc, rows) as img, cancel_flag(desc) as page_cancelled:
+        return ocr_service.run_tesseract_data(img, config, StripDeadline(timeout, page_cancelled))
+
+
+def ocr_strips(img, strips, config: str, deadline=None, on_done=None):
+    """
+    OCR row ranges of `img` in the worker pool.
+
+    Args:
+        strips: List of (top, bottom)
+        on_done: Optional callable(index, words) called in completion order
+
+    Returns:
+        Word lists (see ocr_service.run_tesseract_data), one per strip, in order
+    """
+    pool = get_pool()
+    results = [None] * len(strips)
+    with SharedPage(img) as page:
+        timeout = deadline.remaining() if deadline else None
+        futures = []
+        try:
+            for rows in strips:
+                futures.append(pool.submit(_ocr_rows, page.descriptor, rows, config, timeout))
+            for i, future in enumerate(futures):
+                while True:
+                    if deadline:
+                        deadline.check()
+                    try:
+                        results[i] = future.result(timeout=0.1)
+                        break
+                    except FutureTimeoutError:
+                        continue
+                if on_done is not None:
+                    on_done(i, results[i])
+        except BrokenProcessPool:
+            metrics.incr("ocr.pool.broken")
+            logger.error("OCR worker process died, restarting the pool")
+            _discard_pool(pool)
+            raise
+        finally:
+            # Queued strips never start; running ones hold their own mapping,
+            # so unlinking the segment under them is safe, and stop on the flag
+            for future in futures:
+                future.cancel()
+            page.cancel()
+    return results
@@ -0,0 +1,145 @@
+"""
+Tesseract OCR profiles built from the lab vocabulary.
+
+Reports only matter to us for the parameter aliases in mapping.json, their
+units and numbers. The `lab` profiles hand Tesseract that vocabulary as
+user-words and user-patterns files and switch off its general dictionaries,
+`numeric` restricts single value cells to digits, and the `*_fast` profiles
+use the fast (integer) traineddata when TESSDATA_FAST_DIR points at it.
+"""
+import json
+import logging
+import os
+import re
+import shlex
+from functools import lru_cache
+from pathlib import Path
+
+from . import ocr_settings
+from .extract_service import get_mapping
+
+logger = logging.getLogger(__name__)
+
+HERE = Path(__file__).parent
+RANGES_PATH = HERE.parent / "utils" / "normal_ranges.json"
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+PROFILES_DIR = Path(os.getenv("OCR_PROFILES_DIR", PROJECT_ROOT / "data" / "ocr_profiles"))
+
+# Directory holding tessdata_fast's eng.traineddata (github.com/tesseract-ocr/tessdata_fast)
+TESSDATA_FAST_DIR = os.getenv("TESSDATA_FAST_DIR", "")
+
+DEFAULT_PROFILE = os.getenv("OCR_PROFILE", "default")
+
+NUMERIC_WHITELIST = "0123456789.,"
+
+# Full-page profiles take their page segmentation mode from ocr_settings
+PROFILES = {
+    "default": {},
+    "lab": {"vocabulary": True},
+    "fast": {"fast": True},
+    "lab_fast": {"vocabulary": True, "fast": True},
+    "numeric": {"psm": 7, "whitelist": NUMERIC_WHITELIST},
+    "numeric_fast": {"psm": 7, "whitelist": NUMERIC_WHITELIST, "fast": True},
+}
+# Profiles that can read a whole page; the others have a fixed psm and read single value cells
+PAGE_PROFILES = tuple(name for name, spec in PROFILES.items() if "psm" not in spec)
+
+# Value shapes seen on reports, in Tesseract's user-patterns syntax
+# (\d digit, \* repeat previous class): 12, 12.5, 1.25, 4,500, 150,000
+NUMBER_PATTERNS = [
+    r"\d\*",
+    r"\d\*.\d\*",
+    r"\d,\d\d\d",
+    r"\d\d,\d\d\d",
+    r"\d\d\d,\d\d\d",
+    r"\d\*-\d\*",
+    r"\d\*.\d\*-\d\*.\d\*",
+]
+
+
+def lab_words():
+    """Alias words from mapping.json plus parameter names and units from normal_ranges.json."""
+    words = set()
+    for variants in get_mapping().values():
+        for v in variants:
+            words.update(w for w in re.split(r"[^A-Za-z/]+", v) if len(w) > 1)
+    if RANGES_PATH.exists():
+        with open(RANGES_PATH) as f:
+            for name, spec in json.load(f).items():
+                words.add(name)
+                if spec.get("unit"):
+                    words.add(spec["unit"])
+    # Reports print labels in any case
+    return sorted(words | {w.upper() for w in words} | {w.capitalize() for w in words})
+
+
+def build_vocabulary(out_dir: Path = None):
+    """
+    Write lab.user-words and lab.user-patterns.
+
+    Returns:
+        (user_words_path, user_patterns_path)
+    """
+    out_dir = Path(out_dir or PROFILES_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    words_path = out_dir / "lab.user-words"
+    patterns_path = out_dir / "lab.user-patterns"
+    words_path.write_text("\n".join(lab_words()) + "\n", encoding="utf-8")
+    patterns_path.write_text("\n".join(NUMBER_PATTERNS) + "\n", encoding="utf-8")
+    return words_path, patterns_path
+
+
+@lru_cache(maxsize=None)
+def _vocabulary_files():
+    return build_vocabulary()
+
+
+@lru_cache(maxsize=None)
+def _fast_tessdata_dir():
+    if TESSDATA_FAST_DIR and (Path(TESSDATA_FAST_DIR) / "eng.traineddata").exists():
+        return TESSDATA_FAST_DIR
+    if TESSDATA_FAST_DIR:
+        logger.warning(f"No eng.traineddata in TESSDATA_FAST_DIR={TESSDATA_FAST_DIR}, using default tessdata")
+    return None
+
+
+def check_page_profile(name: str = None):
+    """
+    Raises:
+        ValueError: unknown profile name, or a cell profile that cannot read a page
+    """
+    name = name or DEFAULT_PROFILE
+    profile_config(name)
+    if name not in PAGE_PROFILES:
+        raise ValueError(f"OCR profile '{name}' reads single value cells; "
+                         f"full pages take one of {', '.join(PAGE_PROFILES)}")
+
+
+@lru_cache(maxsize=None)
+def profile_config(name: str = None, page_psm: int = None) -> str:
+    """
+    Tesseract config string for a profile; `page_psm` overrides the tuned
+    page segmentation mode of full-page profiles.
+
+    Raises:
+        ValueError: unknown profile name
+    """
+    name = name or DEFAULT_PROFILE
+    spec = PROFILES.get(name)
+    if spec is None:
+        raise ValueError(f"Unknown OCR profile '{name}', expected one of {', '.join(PROFILES)}")
+    psm = spec.get("psm") or page_psm or ocr_settings.SETTINGS["psm"]
+    args = ["--oem", "1", "--psm", str(psm)]
+    if spec.get("fast") and _fast_tessdata_dir():
+        args += ["--tessdata-dir", _fast_tessdata_dir()]
+    if spec.get("vocabulary"):
+        words, patterns = _vocabulary_files()
+        args += [
+            "--user-words", str(words),
+            "--user-patterns", str(patterns),
+            "-c", "load_system_dawg=0",
+            "-c", "load_freq_dawg=0",
+        ]
+    if spec.get("whitelist"):
+        args += ["-c", f"tessedit_char_whitelist={spec['whitelist']}"]
+    return " ".join(shlex.quote(a) for a in args)
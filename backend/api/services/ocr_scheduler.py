@@ -0,0 +1,211 @@
+"""
+Cost-aware scheduling of local Tesseract runs.
+
+With a plain FIFO one multi-page scanned PDF holds every worker thread while
+single-photo uploads queue behind it. Instead each Tesseract run waits for
+one of OCR_SCHEDULER_SLOTS slots, and waiting runs are served in start-time
+fair queueing order:
+
+- every request (its Deadline) is a flow; each page or strip it OCRs is a
+  task costing OCR_COST_PER_PAGE + OCR_COST_PER_MEGAPIXEL * megapixels
+- a task's start tag is max(virtual time, the flow's previous finish tag)
+  and its finish tag adds cost / the weight of the request's priority class,
+  so a request that has already had a lot of OCR time falls behind new ones
+  and pages of concurrent requests interleave
+- priority classes and their weights come from OCR_PRIORITY_CLASSES; clients
+  pick one with the X-OCR-Priority header, and requests whose estimated
+  total cost (pages x page pixels, known after decode or page counting)
+  exceeds OCR_BATCH_COST are moved to OCR_LARGE_JOB_PRIORITY unless they
+  picked a class themselves
+
+Queueing delay is recorded per class as the ocr.queue_ms.<class> timing.
+Process-pool strips (ocr_pool.py) and remote OCR workers are not scheduled
+here; remote workers gate their own Tesseract runs with this scheduler,
+using the forwarded class and charging every job of one API request to one
+flow (X-OCR-Flow).
+
+Each request OCRs its pages one at a time, so the queue only fills when more
+requests are admitted than there are slots: ADMISSION_MAX_IN_FLIGHT defaults
+to twice OCR_SCHEDULER_SLOTS.
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from ..utils import metrics
+
+logger = logging.getLogger(__name__)
+
+OCR_SCHEDULER = os.getenv("OCR_SCHEDULER", "1") == "1"
+# Concurrent Tesseract processes; each one keeps a core busy
+OCR_SCHEDULER_SLOTS = int(os.getenv("OCR_SCHEDULER_SLOTS", str(os.cpu_count() or 1)))
+# name:weight pairs; a class with weight 8 gets 8x the OCR time of weight 1 under contention
+OCR_PRIORITY_CLASSES = os.getenv("OCR_PRIORITY_CLASSES", "interactive:8,batch:1")
+OCR_DEFAULT_PRIORITY = os.getenv("OCR_DEFAULT_PRIORITY", "interactive")
+OCR_LARGE_JOB_PRIORITY = os.getenv("OCR_LARGE_JOB_PRIORITY", "batch")
+# Estimated request cost above which it runs as a large job; 0 disables
+OCR_BATCH_COST = float(os.getenv("OCR_BATCH_COST", "6"))
+OCR_COST_PER_PAGE = float(os.getenv("OCR_COST_PER_PAGE", "0.5"))
+OCR_COST_PER_MEGAPIXEL = float(os.getenv("OCR_COST_PER_MEGAPIXEL", "1.0"))
+
+# How often a waiting task re-checks its deadline
+POLL_SECONDS = 0.1
+# Pages are costed as A4 before they are rasterized
+A4_INCHES = (8.27, 11.69)
+
+
+def parse_classes(spec: str) -> dict:
+    """Parse "interactive:8,batch:1" into {"interactive": 8.0, "batch": 1.0}."""
+    classes = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition(":")
+        weight = float(weight or 1)
+        if weight <= 0:
+            raise ValueError(f"priority class {name.strip()!r} needs a positive weight")
+        classes[name.strip()] = weight
+    if not classes:
+        raise ValueError("no priority classes configured")
+    return classes
+
+
+PRIORITY_WEIGHTS = parse_classes(OCR_PRIORITY_CLASSES)
+
+
+def check_priority(priority: str):
+    """Raise ValueError if `priority` is not a configured class (None means the default)."""
+    if priority is not None and priority not in PRIORITY_WEIGHTS:
+        raise ValueError(f"Unknown OCR priority {priority!r}; choose from {', '.join(PRIORITY_WEIGHTS)}")
+
+
+def task_cost(pixels: int) -> float:
+    """Estimated cost of OCRing one page or strip of `pixels` pixels."""
+    return OCR_COST_PER_PAGE + OCR_COST_PER_MEGAPIXEL * pixels / 1e6
+
+
+def estimate_cost(pages: int, pixels_per_page: int) -> float:
+    return pages * task_cost(pixels_per_page)
+
+
+def pdf_page_pixels(dpi: int) -> int:
+    return int(A4_INCHES[0] * dpi) * int(A4_INCHES[1] * dpi)
+
+
+class Flow:
+    """A flow several Deadlines are charged to (the remote jobs of one API request)."""
+
+
+def flow_of(deadline):
+    return getattr(deadline, "flow", None) or deadline
+
+
+def priority_of(deadline) -> str:
+    priority = getattr(deadline, "priority", None)
+    return priority if priority in PRIORITY_WEIGHTS else OCR_DEFAULT_PRIORITY
+
+
+def plan(deadline, pages: int, pixels_per_page: int):
+    """
+    Record a request's estimated OCR cost once its page count and size are
+    known, moving it to the large-job class if it is expensive and the client
+    did not choose a class.
+    """
+    if deadline is None:
+        return
+    cost = estimate_cost(pages, pixels_per_page)
+    deadline.estimated_cost = cost
+    if (deadline.priority is None and OCR_BATCH_COST and cost > OCR_BATCH_COST
+            and OCR_LARGE_JOB_PRIORITY in PRIORITY_WEIGHTS):
+        deadline.priority = OCR_LARGE_JOB_PRIORITY
+        metrics.incr(f"ocr.scheduler.moved_to.{OCR_LARGE_JOB_PRIORITY}")
+        logger.info(f"OCR job of {pages} pages (estimated cost {cost:.1f}) runs as {OCR_LARGE_JOB_PRIORITY}")
+
+
+class OCRScheduler:
+    """Start-time fair queueing over a fixed number of OCR slots."""
+
+    def __init__(self, slots: int, weights: dict):
+        self.slots = max(1, slots)
+        self.weights = weights
+        self._cond = threading.Condition()
+        self._busy = 0
+        self._queue = []  # heap of (start tag, seq, ticket)
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        # Flow finish tags, dropped with the request's Deadline (or Flow)
+        self._finish = weakref.WeakKeyDictionary()
+
+    def _tag(self, deadline, cost: float, priority: str) -> float:
+        flow = flow_of(deadline)
+        start = max(self._vtime, self._finish.get(flow, 0.0))
+        self._finish[flow] = start + cost / self.weights.get(priority, 1.0)
+        return start
+
+    def _dispatch(self, start: float):
+        self._busy += 1
+        self._vtime = max(self._vtime, start)
+
+    def _report(self):
+        metrics.set_value("ocr.queue_depth", len(self._queue))
+        metrics.set_value("ocr.slots_busy", self._busy)
+
+    def acquire(self, deadline, cost: float):
+        """
+        Wait for a slot in fair order.
+
+        Raises:
+            OCRCancelled: the deadline was cancelled or expired while waiting
+        """
+        priority = priority_of(deadline)
+        waited = time.monotonic()
+        with self._cond:
+            start = self._tag(deadline, cost, priority)
+            if self._busy < self.slots and not self._queue:
+                self._dispatch(start)
+            else:
+                ticket = object()
+                heapq.heappush(self._queue, (start, next(self._seq), ticket))
+                self._report()
+                try:
+                    while not (self._busy < self.slots and self._queue[0][2] is ticket):
+                        self._cond.wait(POLL_SECONDS)
+                        deadline.check()
+                    heapq.heappop(self._queue)
+                    self._dispatch(start)
+                except BaseException:
+                    self._queue = [entry for entry in self._queue if entry[2] is not ticket]
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                    raise
+                finally:
+                    self._report()
+        metrics.observe(f"ocr.queue_ms.{priority}", (time.monotonic() - waited) * 1000)
+        metrics.incr(f"ocr.tasks.{priority}")
+
+    def release(self):
+        with self._cond:
+            self._busy -= 1
+            self._report()
+            self._cond.notify_all()
+
+
+scheduler = OCRScheduler(OCR_SCHEDULER_SLOTS, PRIORITY_WEIGHTS)
+
+
+@contextmanager
+def slot(deadline, pixels: int):
+    """Hold an OCR slot for one Tesseract run on `pixels` pixels; unscheduled without a deadline."""
+    if deadline is None or not OCR_SCHEDULER:
+        yield
+        return
+    scheduler.acquire(deadline, task_cost(pixels))
+    try:
+        yield
+    finally:
+        scheduler.release()
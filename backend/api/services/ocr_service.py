@@ -1,29 +1,181 @@
-from PIL import Image
 import io
-import pytesseract
+import itertools
 import os
+import shlex
+import subprocess
+import tempfile
 import logging
 
+from . import ocr_scheduler, ocr_settings, pdf_sandbox
+from .deadline import OCRCancelled
+from .pdf_sandbox import PDFSandboxError
+from ..utils import metrics
+
 logger = logging.getLogger(__name__)
 
 # Configure Tesseract path for Windows
 TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-if os.path.exists(TESSERACT_PATH):
-    pytesseract.pytesseract.pytesseract_cmd = TESSERACT_PATH
+
+# Speed/accuracy settings, tuned per corpus by backend/ocr_tune.py (see ocr_settings.py)
+SETTINGS = ocr_settings.SETTINGS
 
 # Optimize Tesseract config for faster processing
-TESSERACT_CONFIG = r'--oem 1 --psm 6'
+TESSERACT_CONFIG = f"--oem 1 --psm {SETTINGS['psm']}"
+
+# PDF limits: pages read from the text layer, pages rasterized for OCR, raster DPI
+PDF_TEXT_MAX_PAGES = int(os.getenv("PDF_TEXT_MAX_PAGES", "10"))
+PDF_OCR_MAX_PAGES = SETTINGS["pdf_ocr_max_pages"]
+PDF_DPI = SETTINGS["pdf_dpi"]
+# Images wider than this are downscaled before full-page OCR
+MAX_WIDTH = SETTINGS["max_width"]
+
+# Progressive mode: cheap low-resolution pass, high-resolution re-scan of
+# only the lines whose values were missed (see progressive_ocr.py)
+OCR_PROGRESSIVE = os.getenv("OCR_PROGRESSIVE", "0") == "1"
+
+# Template mode: pages matching an enrolled lab layout only OCR their value
+# cells (see template_service.py); a no-op until a template is enrolled
+OCR_TEMPLATES = os.getenv("OCR_TEMPLATES", "1") == "1"
+
+# Near-duplicate mode: pages matching a page recently OCR'd for the same
+# client reuse its text once all of its values are confirmed (see page_dedup.py)
+OCR_DEDUP = os.getenv("OCR_DEDUP", "0") == "1"
+
+# Heading of a PDF page that failed to OCR; output containing it is never stored
+PAGE_ERROR_HEADING = "(Error) ---"
+
+# PIL and pytesseract are imported on first use so that importing the API
+# stays cheap; the startup warm-up pulls them in before the first request.
+_pytesseract = None
+
+def get_pytesseract():
+    """Import pytesseract once and point it at the Windows install if present."""
+    global _pytesseract
+    if _pytesseract is None:
+        import pytesseract
+        if os.path.exists(TESSERACT_PATH):
+            pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
+        _pytesseract = pytesseract
+    return _pytesseract
 
 def check_tesseract_installed():
     """Check if Tesseract is installed and accessible."""
+    pytesseract = get_pytesseract()
     try:
         pytesseract.get_tesseract_version()
         return True
     except pytesseract.TesseractNotFoundError:
         return False
 
-def optimize_image(img, max_width=1024):
+def warm_up_tesseract():
+    """Run a tiny OCR pass so Tesseract pages in its traineddata before real traffic."""
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (120, 40), "white")
+    ImageDraw.Draw(img).text((10, 12), "Hb 12.5", fill="black")
+    return get_pytesseract().image_to_string(img, config=TESSERACT_CONFIG)
+
+def _run_tesseract_cli(img, args, deadline) -> str:
+    """Run the Tesseract CLI on `img` and return stdout, killing it if `deadline` is cancelled."""
+    pytesseract = get_pytesseract()
+    deadline.check()
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
+        img.save(tmp, format="PNG")
+    try:
+        # Waits here, in fair order, while other requests hold every OCR slot
+        with ocr_scheduler.slot(deadline, img.width * img.height):
+            cmd = [pytesseract.pytesseract.tesseract_cmd, tmp.name, "stdout", *args]
+            try:
+                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            except FileNotFoundError:
+                raise pytesseract.TesseractNotFoundError()
+            while True:
+                try:
+                    out, err = proc.communicate(timeout=0.1)
+                    break
+                except subprocess.TimeoutExpired:
+                    if deadline.cancelled or deadline.expired():
+                        proc.kill()
+                        proc.wait()
+                        proc.stdout.close()
+                        proc.stderr.close()
+                        metrics.incr("ocr.tesseract_killed")
+                        deadline.check()
+            if proc.returncode != 0:
+                raise pytesseract.TesseractError(proc.returncode, err.decode("utf-8", "ignore").strip())
+            return out.decode("utf-8", "ignore")
+    finally:
+        os.unlink(tmp.name)
+
+def run_tesseract_local(img, config: str = TESSERACT_CONFIG, deadline=None) -> str:
+    """
+    OCR a PIL image on this machine, honouring an optional Deadline.
+
+    Without a deadline this is plain pytesseract. With one, Tesseract runs as a
+    subprocess we own so it can be killed as soon as the request is cancelled
+    or its deadline passes.
+    """
+    if deadline is None:
+        return get_pytesseract().image_to_string(img, config=config)
+    return _run_tesseract_cli(img, shlex.split(config), deadline)
+
+def run_tesseract_tsv_local(img, config: str = TESSERACT_CONFIG, deadline=None) -> str:
+    """Like run_tesseract_local, but return Tesseract's TSV word table."""
+    if deadline is None:
+        return get_pytesseract().image_to_data(img, config=config)
+    return _run_tesseract_cli(img, shlex.split(config) + ["tsv"], deadline)
+
+def run_tesseract(img, config: str = TESSERACT_CONFIG, deadline=None) -> str:
+    """OCR a PIL image on a remote OCR worker if configured (see remote_ocr.py), else locally."""
+    from . import remote_ocr
+    if remote_ocr.enabled():
+        return remote_ocr.run(img, config, deadline, "text")
+    return run_tesseract_local(img, config, deadline)
+
+def run_tesseract_data(img, config: str = TESSERACT_CONFIG, deadline=None):
+    """
+    OCR a PIL image and return its words with bounding boxes.
+
+    Returns:
+        List of dicts with block_num, par_num, line_num, left, top, width,
+        height, conf and text (empty words are dropped)
+    """
+    from . import remote_ocr
+    if remote_ocr.enabled():
+        return parse_tsv(remote_ocr.run(img, config, deadline, "tsv"))
+    return parse_tsv(run_tesseract_tsv_local(img, config, deadline))
+
+def parse_tsv(tsv: str):
+    lines = tsv.splitlines()
+    if not lines:
+        return []
+    header = lines[0].split("\t")
+    words = []
+    for line in lines[1:]:
+        row = dict(zip(header, line.split("\t")))
+        text = row.get("text", "").strip()
+        if not text:
+            continue
+        word = {k: int(float(row[k])) for k in
+                ("block_num", "par_num", "line_num", "left", "top", "width", "height")}
+        word["conf"] = float(row.get("conf", -1))
+        word["text"] = text
+        words.append(word)
+    return words
+
+def words_to_text(words) -> str:
+    """Text of parsed TSV words laid out as Tesseract prints it: one line per line, paragraphs apart."""
+    out = []
+    paragraph = None
+    for (block, par, _), line in itertools.groupby(words, lambda w: (w["block_num"], w["par_num"], w["line_num"])):
+        if paragraph is not None and (block, par) != paragraph:
+            out.append("")
+        paragraph = (block, par)
+        out.append(" ".join(w["text"] for w in line))
+    return "\n".join(out)
+
+def optimize_image(img, max_width=MAX_WIDTH):
     """Optimize image size for faster OCR processing."""
+    from PIL import Image
     # Resize if too large
     if img.width > max_width:
         ratio = max_width / img.width
@@ -31,39 +183,101 @@ def optimize_image(img, max_width=1024):
         img = img.resize((max_width, new_height), Image.Resampling.LANCZOS)
     return img
 
-def extract_text_from_pdf_pypdf2(pdf_bytes: bytes):
-    """Extract text directly from PDF using PyPDF2."""
+def extract_text_from_pdf(pdf_bytes: bytes, deadline=None, pages: int = None):
+    """
+    Extract the PDF's text layer with the configured backend (see pdf_text.py);
+    `pages` is its page count, if known.
+    """
+    from . import pdf_text
+    if pdf_sandbox.PDF_SANDBOX:
+        try:
+            return pdf_sandbox.extract_text(pdf_bytes, PDF_TEXT_MAX_PAGES, deadline, pages)
+        except PDFSandboxError as e:
+            if e.limit_exceeded:
+                raise
+            logger.error(f"Error extracting PDF text: {str(e)}")
+            return None
+    return pdf_text.extract_text(pdf_bytes, PDF_TEXT_MAX_PAGES, pages=pages)
+
+def inspect_pdf(pdf_bytes: bytes, dpi: int = PDF_DPI, max_pages: int = PDF_OCR_MAX_PAGES):
+    """(pages, pixels) of a PDF from its page boxes; raises if it cannot be parsed."""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    scale = (dpi / 72.0) ** 2
+    pixels = 0
+    for page in reader.pages[:max_pages]:
+        box = page.mediabox
+        pixels += int(float(box.width) * float(box.height) * scale)
+    return len(reader.pages), pixels
+
+def inspect_document(file_bytes: bytes):
+    """
+    Cheaply estimate the size of a document without decoding pixels.
+
+    Returns:
+        (pages, pixels) where pixels is the raster size OCR would work on
+
+    Raises:
+        PDFSandboxError: a sandboxed PDF parse broke its resource limits
+    """
+    if file_bytes[:4] == b'%PDF':
+        try:
+            if pdf_sandbox.PDF_SANDBOX:
+                return pdf_sandbox.inspect(file_bytes, PDF_DPI, PDF_OCR_MAX_PAGES)
+            return inspect_pdf(file_bytes)
+        except PDFSandboxError as e:
+            if e.limit_exceeded:
+                raise
+            logger.warning(f"Could not inspect PDF: {str(e)}")
+            return 1, 0
+        except Exception as e:
+            logger.warning(f"Could not inspect PDF: {str(e)}")
+            return 1, 0
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(file_bytes)) as img:
+            return getattr(img, "n_frames", 1), img.width * img.height
+    except Exception:
+        # Invalid images are rejected later by image_to_text
+        return 1, 0
+
+def pdf_page_count(pdf_bytes: bytes, deadline=None):
+    """Number of pages in a PDF, or None if it cannot be read."""
     try:
+        if pdf_sandbox.PDF_SANDBOX:
+            return pdf_sandbox.page_count(pdf_bytes, deadline)
         from PyPDF2 import PdfReader
-        pdf_file = io.BytesIO(pdf_bytes)
-        reader = PdfReader(pdf_file)
-        text = []
-        
-        # Extract text from all pages (max 10 pages to avoid timeout)
-        num_pages = min(len(reader.pages), 10)
-        for page_num in range(num_pages):
-            try:
-                page = reader.pages[page_num]
-                page_text = page.extract_text()
-                if page_text.strip():
-                    text.append(f"--- Page {page_num + 1} ---\n{page_text}")
-            except Exception as e:
-                logger.error(f"Error extracting text from page {page_num + 1}: {str(e)}")
-        
-        return "\n\n".join(text) if text else None
-    except ImportError:
-        logger.warning("PyPDF2 not installed")
+        return len(PdfReader(io.BytesIO(pdf_bytes)).pages)
+    except OCRCancelled:
+        raise
+    except PDFSandboxError as e:
+        if e.limit_exceeded:
+            raise
         return None
-    except Exception as e:
-        logger.error(f"Error extracting PDF text: {str(e)}")
+    except Exception:
         return None
 
-def convert_pdf_to_images(pdf_bytes: bytes):
-    """Convert PDF pages to images using pdf2image."""
+def convert_pdf_to_images(pdf_bytes: bytes, first_page: int = 1, last_page: int = PDF_OCR_MAX_PAGES,
+                          dpi: int = PDF_DPI, deadline=None):
+    """
+    Convert PDF pages to images using pdf2image, or None if that fails.
+
+    Raises:
+        PDFSandboxError: sandboxed rasterization broke its resource limits
+    """
     try:
+        if pdf_sandbox.PDF_SANDBOX:
+            return pdf_sandbox.rasterize(pdf_bytes, first_page, last_page, dpi, deadline)
         from pdf2image import convert_from_bytes
-        images = convert_from_bytes(pdf_bytes, first_page=1, last_page=3, dpi=150)
+        images = convert_from_bytes(pdf_bytes, first_page=first_page, last_page=last_page, dpi=dpi)
         return images
+    except OCRCancelled:
+        raise
+    except PDFSandboxError as e:
+        if e.limit_exceeded:
+            raise
+        logger.error(f"Error converting PDF: {str(e)}")
+        return None
     except ImportError:
         logger.warning("pdf2image library not installed")
         return None
@@ -71,7 +285,57 @@ def convert_pdf_to_images(pdf_bytes: bytes):
         logger.error(f"Error converting PDF: {str(e)}")
         return None
 
-def image_to_text(image_bytes: bytes) -> str:
+def _emit(progress, event: str, **data):
+    if progress is not None:
+        progress(event, data)
+
+def is_clean(text: str) -> bool:
+    """
+    Whether OCR output is a complete reading of the document: not an error,
+    not "No text detected" and without pages that failed to OCR.
+    """
+    if not text.strip() or text.startswith(("Error", "No text detected")):
+        return False
+    return PAGE_ERROR_HEADING not in text
+
+def image_to_text(image_bytes: bytes, deadline=None, progress=None, progressive: bool = None,
+                  templates: bool = None, profile: str = None, dedup: bool = None,
+                  settings: dict = None, dedup_scope: str = None) -> str:
+    """
+    Extract text from an image or PDF.
+
+    If a Deadline is given, no further pages are started once it is cancelled
+    or expired, the running Tesseract process is killed and OCRCancelled is raised.
+    If `progress(event, data)` is given it is called as each stage completes:
+    pdf_text, page_rasterized, template, page_ocr (per page), image_decoded and
+    strip_ocr (per strip of a tiled image).
+    `progressive`, `templates` and `dedup` override the OCR_PROGRESSIVE,
+    OCR_TEMPLATES and OCR_DEDUP settings for this call; `profile` picks the
+    Tesseract profile for full-page OCR (see ocr_profiles.py, raises
+    ValueError if unknown or a cell profile) and `settings` overrides ocr_settings for this call.
+    Near-duplicate pages are only looked up and remembered within
+    `dedup_scope`; without one dedup is off.
+    """
+    from PIL import Image
+    from . import ocr_profiles
+    pytesseract = get_pytesseract()
+    settings = ocr_settings.resolve(settings)
+    ocr_profiles.check_page_profile(profile)
+    config = ocr_profiles.profile_config(profile, settings["psm"])
+    metrics.incr(f"ocr.profile.{profile or ocr_profiles.DEFAULT_PROFILE}")
+    if progressive is None:
+        progressive = OCR_PROGRESSIVE
+    if progressive:
+        from . import progressive_ocr
+    if templates is None:
+        templates = OCR_TEMPLATES
+    if templates:
+        from . import template_service
+    if dedup is None:
+        dedup = OCR_DEDUP
+    dedup = dedup and dedup_scope is not None
+    if dedup:
+        from . import page_dedup
     try:
         if not image_bytes or len(image_bytes) == 0:
             return "Error: Empty file"
@@ -82,40 +346,77 @@ def image_to_text(image_bytes: bytes) -> str:
         if is_pdf:
             logger.info("Processing PDF file")
             
-            # Try PyPDF2 first (direct text extraction, faster)
-            text = extract_text_from_pdf_pypdf2(image_bytes)
+            # Counted once for both the text layer and rasterization
+            if deadline:
+                deadline.check()
+            page_count = pdf_page_count(image_bytes, deadline)
+            
+            # Try the text layer first (direct text extraction, faster)
+            text = extract_text_from_pdf(image_bytes, deadline, page_count)
+            _emit(progress, "pdf_text", found=bool(text))
             if text:
-                logger.info(f"Extracted text from PDF using PyPDF2: {len(text)} characters")
+                logger.info(f"Extracted text from PDF text layer: {len(text)} characters")
                 return text
             
-            # Fallback: Try converting PDF to images and use OCR
-            logger.info("PyPDF2 extraction returned no text, attempting image conversion")
-            images = convert_pdf_to_images(image_bytes)
-            
-            if images is None:
-                return "Error: Could not process PDF. pdf2image requires poppler to be installed."
+            # Fallback: rasterize and OCR one page at a time, so progress can be
+            # reported and a cancelled request stops before the next page
+            logger.info("PDF has no text layer, attempting image conversion")
+            max_pages = settings["pdf_ocr_max_pages"]
+            num_pages = min(page_count or max_pages, max_pages)
+            dpi = progressive_ocr.LOW_DPI if progressive else settings["pdf_dpi"]
+            ocr_scheduler.plan(deadline, num_pages, ocr_scheduler.pdf_page_pixels(dpi))
             
-            if not images:
-                return "Error: Could not extract pages from PDF"
-            
-            # Process all extracted images with OCR
             all_text = []
-            for page_num, img in enumerate(images, 1):
+            for page_num in range(1, num_pages + 1):
+                if deadline:
+                    deadline.check()
+                images = convert_pdf_to_images(image_bytes, page_num, page_num, dpi, deadline)
+                if images is None:
+                    if page_num == 1:
+                        return "Error: Could not process PDF. pdf2image requires poppler to be installed."
+                    break
+                if not images:
+                    if page_num == 1:
+                        return "Error: Could not extract pages from PDF"
+                    break
+                _emit(progress, "page_rasterized", page=page_num, pages=num_pages)
+                
                 try:
-                    img = img.convert("RGB")
-                    img = optimize_image(img)
+                    img = images[0].convert("RGB")
                     logger.info(f"Processing PDF page {page_num} with OCR, size: {img.size}")
-                    ocr_text = pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
+                    ocr_text = page_dedup.lookup(img, config, dedup_scope, deadline) if dedup else None
+                    if ocr_text is None and templates:
+                        ocr_text = template_service.ocr_with_template(img, deadline, progress, page_num)
+                    if ocr_text is None and progressive:
+                        def load_high_res(page_num=page_num):
+                            high = convert_pdf_to_images(
+                                image_bytes, page_num, page_num, progressive_ocr.HIGH_DPI, deadline
+                            )
+                            return high[0].convert("RGB") if high else None
+                        ocr_text = progressive_ocr.ocr_page(img, load_high_res, deadline, progress,
+                                                            page_num, config, settings["preprocess"])
+                    elif ocr_text is None:
+                        page = ocr_settings.preprocess(optimize_image(img, settings["max_width"]),
+                                                       settings["preprocess"])
+                        if dedup:
+                            ocr_text = page_dedup.ocr_page(page, config, dedup_scope, deadline, source=img)
+                        else:
+                            ocr_text = run_tesseract(page, config, deadline)
                     if ocr_text.strip():
                         all_text.append(f"--- Page {page_num} ---\n{ocr_text}")
+                    _emit(progress, "page_ocr", page=page_num, pages=num_pages, text=ocr_text)
+                except (OCRCancelled, PDFSandboxError):
+                    metrics.incr("ocr.pages_skipped", num_pages - page_num + 1)
+                    raise
                 except Exception as e:
                     logger.error(f"Error processing PDF page {page_num}: {str(e)}")
-                    all_text.append(f"--- Page {page_num} (Error) ---\nFailed to process page: {str(e)}")
+                    all_text.append(f"--- Page {page_num} {PAGE_ERROR_HEADING}\nFailed to process page: {str(e)}")
             
             return "\n\n".join(all_text) if all_text else "No text detected in PDF"
         
         else:
             # Process as regular image
+            from . import tiled_ocr
             logger.info("Processing image file")
             byte_stream = io.BytesIO(image_bytes)
             try:
@@ -124,17 +425,43 @@ def image_to_text(image_bytes: bytes) -> str:
                 
                 # Re-open since verify() closes the file
                 byte_stream.seek(0)
-                img = Image.open(byte_stream).convert("RGB")
+                original = Image.open(byte_stream).convert("RGB")
                 
                 # Optimize image for faster processing
-                img = optimize_image(img)
+                img = optimize_image(original, progressive_ocr.LOW_WIDTH if progressive else settings["max_width"])
             except (IOError, Image.UnidentifiedImageError) as img_err:
                 return f"Error: Invalid image format - {str(img_err)}"
+            _emit(progress, "image_decoded", width=img.width, height=img.height)
+            ocr_scheduler.plan(deadline, 1, img.width * img.height)
             
             logger.info(f"Processing image of size {img.size}")
-            text = pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
+            text = page_dedup.lookup(original, config, dedup_scope, deadline) if dedup else None
+            if text is None and templates:
+                text = template_service.ocr_with_template(original, deadline, progress)
+            if text is None and tiled_ocr.OCR_TILING and tiled_ocr.should_tile(original):
+                if dedup:
+                    # The strips' word boxes locate the value cells, so no extra full-page pass
+                    text, words = tiled_ocr.ocr_image_words(original, config, deadline, progress,
+                                                            settings["preprocess"])
+                    page_dedup.remember(original, config, dedup_scope, text, words)
+                else:
+                    text = tiled_ocr.ocr_image(original, config, deadline, progress, settings["preprocess"])
+            elif text is None and progressive:
+                text = progressive_ocr.ocr_page(
+                    img, lambda: progressive_ocr.high_res_image(original), deadline, progress, config=config,
+                    preprocess=settings["preprocess"]
+                )
+            elif text is None:
+                img = ocr_settings.preprocess(img, settings["preprocess"])
+                if dedup:
+                    text = page_dedup.ocr_page(img, config, dedup_scope, deadline, source=original)
+                else:
+                    text = run_tesseract(img, config, deadline)
+            _emit(progress, "page_ocr", page=1, pages=1, text=text)
             return text if text.strip() else "No text detected in image"
     
+    except (OCRCancelled, PDFSandboxError):
+        raise
     except pytesseract.TesseractNotFoundError:
         return "Error: Tesseract is not installed or not in PATH."
     except Exception as e:
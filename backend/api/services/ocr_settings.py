@@ -0,0 +1,137 @@
+"""
+Tunable OCR speed/accuracy settings.
+
+The defaults are the values the service has always used. `python -m
+backend.ocr_tune` picks settings for a labeled corpus and writes them to
+OCR_SETTINGS_PATH (default data/ocr_settings.json), which is read once when
+ocr_service is imported, i.e. at startup:
+
+    max_width          images are downscaled to this width before OCR
+    pdf_dpi            rasterization DPI of scanned PDF pages
+    psm                Tesseract page segmentation mode for full pages
+    pdf_ocr_max_pages  scanned PDF pages OCR'd per document
+    preprocess         PIL steps applied before full-page, tiled and progressive
+                       OCR (both resolutions), in order; not to template cells
+"""
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+SETTINGS_PATH = Path(os.getenv("OCR_SETTINGS_PATH", PROJECT_ROOT / "data" / "ocr_settings.json"))
+
+DEFAULTS = {
+    "max_width": 1024,
+    "pdf_dpi": 150,
+    "psm": 6,
+    "pdf_ocr_max_pages": 3,
+    "preprocess": [],
+}
+
+# Page segmentation modes that make sense for a whole report page
+PAGE_PSMS = (1, 3, 4, 6, 11, 12)
+
+
+def _grayscale(img):
+    return img.convert("L")
+
+
+def _autocontrast(img):
+    from PIL import ImageOps
+    return ImageOps.autocontrast(img, cutoff=1)
+
+
+def _sharpen(img):
+    from PIL import ImageFilter
+    return img.filter(ImageFilter.SHARPEN)
+
+
+def _denoise(img):
+    from PIL import ImageFilter
+    return img.filter(ImageFilter.MedianFilter(3))
+
+
+def _binarize(img):
+    """Black and white at Otsu's threshold."""
+    gray = img.convert("L")
+    hist = gray.histogram()
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    best, threshold = -1.0, 128
+    weight = sum_below = 0
+    for i, h in enumerate(hist):
+        weight += h
+        sum_below += i * h
+        if weight == 0 or weight == total:
+            continue
+        mean_below = sum_below / weight
+        mean_above = (sum_all - sum_below) / (total - weight)
+        between = weight * (total - weight) * (mean_below - mean_above) ** 2
+        if between > best:
+            best, threshold = between, i
+    return gray.point(lambda p: 255 if p > threshold else 0)
+
+
+PREPROCESS_STEPS = {
+    "grayscale": _grayscale,
+    "autocontrast": _autocontrast,
+    "sharpen": _sharpen,
+    "denoise": _denoise,
+    "binarize": _binarize,
+}
+
+
+def preprocess(img, steps):
+    for step in steps:
+        img = PREPROCESS_STEPS[step](img)
+    return img
+
+
+def validate(settings: dict) -> dict:
+    """
+    Return `settings` over the defaults.
+
+    Raises:
+        ValueError: an unknown key, or a value out of range
+    """
+    unknown = set(settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown OCR settings: {', '.join(sorted(unknown))}")
+    merged = {**DEFAULTS, **settings}
+    for key in ("max_width", "pdf_dpi", "pdf_ocr_max_pages"):
+        if not isinstance(merged[key], int) or merged[key] < 1:
+            raise ValueError(f"{key} must be a positive integer, got {merged[key]!r}")
+    if merged["psm"] not in PAGE_PSMS:
+        raise ValueError(f"psm must be one of {PAGE_PSMS}, got {merged['psm']!r}")
+    steps = merged["preprocess"]
+    if not isinstance(steps, list) or any(s not in PREPROCESS_STEPS for s in steps):
+        raise ValueError(f"preprocess must list steps from {', '.join(PREPROCESS_STEPS)}, got {steps!r}")
+    merged["preprocess"] = list(steps)
+    return merged
+
+
+def load(path: Path = None) -> dict:
+    """Settings from the tuner's file (its "settings" entry), or the defaults if it is missing or invalid."""
+    path = Path(path or SETTINGS_PATH)
+    if not path.exists():
+        return dict(DEFAULTS)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        settings = validate(data.get("settings", data))
+    except (OSError, ValueError) as e:
+        logger.error(f"Ignoring OCR settings in {path}: {str(e)}")
+        return dict(DEFAULTS)
+    logger.info(f"Loaded OCR settings from {path}: {settings}")
+    return settings
+
+
+SETTINGS = load()
+
+
+def resolve(overrides: dict = None) -> dict:
+    """The startup settings with per-call `overrides` (used by the tuner)."""
+    return validate({**SETTINGS, **overrides}) if overrides else SETTINGS
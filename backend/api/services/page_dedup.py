@@ -0,0 +1,147 @@
+"""
+Near-duplicate page detection for OCR.
+
+The most common repeat upload is the same paper report re-photographed or
+re-scanned, which the content SHA-256 misses. Every page OCR'd in full is
+remembered with a 64-bit perceptual hash, its text and the value cells of
+the parameters it read; incoming pages are looked up by Hamming distance
+in a multi-index hash (utils/mih.py) over the most recent OCR_DEDUP_MAX_PAGES
+pages.
+
+Pages are only ever matched against pages OCR'd in the same scope (the
+client, and the patient when one is given), so one upload's text is never
+handed to another client. A perceptual hash only sees the layout: two
+reports from the same lab with different values hash closer than two photos
+of one report. So a match within OCR_DEDUP_MIN_SIMILARITY is only trusted
+after every remembered value cell is re-read on the new page (as single
+numeric lines, like lab templates) and gives the same value; then the
+remembered text is reused instead of running full-page Tesseract.
+
+Pages are OCR'd with one word-box (TSV) pass: its words locate the value
+cells and its lines make up the text, so a miss costs no extra Tesseract run.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import ocr_profiles, ocr_service
+from .extract_service import extract_key_values
+from .template_service import CELL_PROFILE, find_value_cells, read_cell
+from ..utils import metrics
+from ..utils.imagehash import phash
+from ..utils.mih import MultiIndexHash
+
+logger = logging.getLogger(__name__)
+
+OCR_DEDUP_MAX_PAGES = int(os.getenv("OCR_DEDUP_MAX_PAGES", "2000"))
+# Share of the hash bits that must agree; 0.8 tolerates re-photos with a
+# little rotation, blur and JPEG noise
+OCR_DEDUP_MIN_SIMILARITY = float(os.getenv("OCR_DEDUP_MIN_SIMILARITY", "0.8"))
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE ** 2
+MAX_DISTANCE = int(HASH_BITS * (1 - OCR_DEDUP_MIN_SIMILARITY))
+
+
+def page_hash(img) -> int:
+    return phash(img, hash_size=HASH_SIZE)
+
+
+class PageIndex:
+    """The most recently OCR'd pages, oldest evicted first."""
+
+    def __init__(self, max_pages: int = OCR_DEDUP_MAX_PAGES):
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        self._index = MultiIndexHash(HASH_BITS)
+        self._ids = itertools.count()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def add(self, h: int, config: str, scope: str, text: str, cells: dict, values: dict):
+        with self._lock:
+            page_id = next(self._ids)
+            self._pages[page_id] = {"hash": h, "config": config, "scope": scope, "text": text,
+                                    "cells": cells, "values": values, "created_at": time.time()}
+            self._index.add(page_id, h)
+            while len(self._pages) > self.max_pages:
+                old_id, _ = self._pages.popitem(last=False)
+                self._index.remove(old_id)
+                metrics.incr("ocr.dedup.evicted")
+            metrics.set_value("ocr.dedup.pages", len(self._pages))
+
+    def candidates(self, h: int, config: str, scope: str):
+        """Remembered pages of `scope` OCR'd with `config` within MAX_DISTANCE of `h`, closest first."""
+        with self._lock:
+            found = self._index.search(h, MAX_DISTANCE)
+            return [(d, self._pages[page_id]) for d, page_id in found
+                    if self._pages[page_id]["config"] == config and self._pages[page_id]["scope"] == scope]
+
+
+_index = PageIndex()
+
+
+def _verified(img, entry, deadline) -> bool:
+    """Re-read every remembered value cell on `img` and require the remembered values."""
+    keys = [k for k in entry["cells"] if k in entry["values"]]
+    if not keys:
+        return False
+    config = ocr_profiles.profile_config(CELL_PROFILE)
+    for key in keys:
+        if read_cell(img, entry["cells"][key], deadline, config) != entry["values"][key]:
+            return False
+    return True
+
+
+def lookup(img, config: str, scope: str, deadline=None):
+    """
+    Text of a verified near-duplicate of page `img` OCR'd with `config` in `scope`, or None.
+
+    Only the closest candidate is verified; a failed check means a different
+    report in the same layout, and the page is OCR'd in full.
+    """
+    if not len(_index):
+        return None
+    found = _index.candidates(page_hash(img), config, scope)
+    if not found:
+        metrics.incr("ocr.dedup.miss")
+        return None
+    distance, entry = found[0]
+    if not _verified(img, entry, deadline):
+        metrics.incr("ocr.dedup.rejected")
+        logger.info(f"Near-duplicate page (distance {distance}) failed value verification")
+        return None
+    metrics.incr("ocr.dedup.hit")
+    logger.info(f"Reusing OCR text of a near-duplicate page (distance {distance}/{HASH_BITS})")
+    return entry["text"]
+
+
+def remember(img, config: str, scope: str, text: str, words, source=None):
+    """
+    Remember `text`, read from `img` with `config`, for near-duplicate lookups in `scope`.
+
+    Args:
+        words: The word boxes `text` was read as, in `img`'s coordinates;
+            they locate the value cells that verify later matches
+        source: The decoded page `img` was downscaled from, if any; it is
+            what later uploads are hashed and verified against
+    """
+    values = extract_key_values(text)
+    if not values:
+        return
+    cells = find_value_cells(words, img.width, img.height)
+    if any(k in values for k in cells):
+        _index.add(page_hash(img if source is None else source), config, scope, text, cells, values)
+
+
+def ocr_page(img, config: str, scope: str, deadline=None, source=None) -> str:
+    """OCR `img` in full with one word-box pass and remember it (see remember)."""
+    words = ocr_service.run_tesseract_data(img, config, deadline)
+    text = ocr_service.words_to_text(words)
+    remember(img, config, scope, text, words, source)
+    return text
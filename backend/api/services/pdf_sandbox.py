@@ -0,0 +1,277 @@
+"""
+Sandboxed PDF parsing and rasterization.
+
+Malformed or hostile PDFs can make PyPDF2 or poppler spin or balloon in
+memory. With PDF_SANDBOX on (the default), every parse, text extraction and
+rasterization runs in a short-lived child process with a CPU-time limit
+(RLIMIT_CPU), an address-space limit (RLIMIT_AS, inherited by poppler's
+helpers), a wall-clock timeout and an RSS watchdog. A child that breaks a
+limit is killed and the caller gets a PDFSandboxError saying which limit,
+so one bad upload cannot stall or take down the process serving everyone
+else. Children are forked from a forkserver that has the PDF libraries
+preloaded, so each job starts in milliseconds.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..utils import metrics
+
+try:
+    import resource
+except ImportError:  # Windows: wall-clock and RSS limits only
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+PDF_SANDBOX = os.getenv("PDF_SANDBOX", "1") == "1"
+CPU_SECONDS = float(os.getenv("PDF_SANDBOX_CPU_SECONDS", "20"))
+WALL_SECONDS = float(os.getenv("PDF_SANDBOX_WALL_SECONDS", "30"))
+MEMORY_MB = int(os.getenv("PDF_SANDBOX_MEMORY_MB", "1024"))
+
+POLL_SECONDS = 0.05
+
+# Reasons that mean "this PDF is too expensive" rather than "this PDF is not readable"
+LIMIT_REASONS = ("timeout", "cpu_limit", "memory_limit", "crashed")
+
+
+class PDFSandboxError(Exception):
+    """A sandboxed PDF job failed; `reason` is one of LIMIT_REASONS, invalid_pdf or unavailable."""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"PDF {reason}: {detail}" if detail else f"PDF {reason}")
+        self.reason = reason
+        self.detail = detail
+
+    @property
+    def limit_exceeded(self) -> bool:
+        return self.reason in LIMIT_REASONS
+
+    def as_dict(self):
+        return {"error": "pdf_rejected", "reason": self.reason, "detail": self.detail}
+
+
+# --- Jobs (run inside the child) ---
+
+def _task_inspect(data: bytes, dpi: int, max_pages: int):
+    from . import ocr_service
+    return ocr_service.inspect_pdf(data, dpi, max_pages)
+
+
+def _task_page_count(data: bytes, backend: str):
+    from . import pdf_text
+    return pdf_text.BACKENDS[backend].page_count(data)
+
+
+def _task_text_range(data: bytes, backend: str, first: int, last: int):
+    from . import pdf_text
+    return pdf_text.BACKENDS[backend].extract_pages(data, first, last)
+
+
+def _task_rasterize(data: bytes, first: int, last: int, dpi: int):
+    from pdf2image import convert_from_bytes
+    images = convert_from_bytes(data, first_page=first, last_page=last, dpi=dpi)
+    # Raw pixels avoid a PNG encode/decode round trip through the pipe
+    return [(img.mode, img.size, img.tobytes()) for img in images]
+
+
+def _task_ping():
+    return True
+
+
+TASKS = {
+    "ping": _task_ping,
+    "inspect": _task_inspect,
+    "page_count": _task_page_count,
+    "text_range": _task_text_range,
+    "rasterize": _task_rasterize,
+}
+
+
+def _caused_by_memory(exc) -> bool:
+    # Parsers often wrap the MemoryError in their own read errors
+    while exc is not None:
+        if isinstance(exc, MemoryError):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+def _child(conn, task: str, args, cpu_seconds: float, memory_mb: int):
+    # Headroom to report a MemoryError once the address-space limit is hit
+    reserve = bytearray(1024 * 1024)
+    try:
+        if resource is not None:
+            cpu = max(1, math.ceil(cpu_seconds))
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+            memory = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        result = ("ok", TASKS[task](*args))
+    except ImportError as e:
+        result = ("error", "unavailable", str(e))
+    except BaseException as e:
+        del reserve
+        if _caused_by_memory(e):
+            result = ("error", "memory_limit", f"exceeded {memory_mb} MB")
+        elif "NotInstalled" in type(e).__name__:
+            # pdf2image reports a missing poppler as its own exception types
+            result = ("error", "unavailable", str(e))
+        else:
+            result = ("error", "invalid_pdf", str(e)[:500])
+    try:
+        conn.send(result)
+    finally:
+        conn.close()
+
+
+# --- Parent side ---
+
+_ctx = None
+
+
+def _context():
+    global _ctx
+    if _ctx is None:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            _ctx = multiprocessing.get_context("forkserver")
+            _ctx.set_forkserver_preload([__name__, "PyPDF2", "pdf2image", "PIL.Image"])
+        else:
+            _ctx = multiprocessing.get_context("spawn")
+    return _ctx
+
+
+def warm_up():
+    """Start the forkserver and run one job so the first PDF does not pay for preloading."""
+    if PDF_SANDBOX:
+        run("ping")
+
+
+def _rss_mb(pid: int):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _exit_reason(exitcode):
+    if exitcode == -getattr(signal, "SIGXCPU", -1):
+        return "cpu_limit"
+    if exitcode in (-signal.SIGKILL, -signal.SIGABRT):
+        # The kernel's OOM killer, or a C allocation failing under RLIMIT_AS
+        return "memory_limit"
+    return "crashed"
+
+
+def run(task: str, *args, deadline=None, cpu_seconds: float = None,
+        wall_seconds: float = None, memory_mb: int = None):
+    """
+    Run one PDF job in a resource-limited child and return its result.
+
+    Raises:
+        PDFSandboxError: the job broke a limit, crashed or failed
+        OCRCancelled: `deadline` was cancelled or passed while waiting
+    """
+    if deadline is not None:
+        deadline.check()
+    cpu_seconds = cpu_seconds or CPU_SECONDS
+    wall_seconds = wall_seconds or WALL_SECONDS
+    memory_mb = memory_mb or MEMORY_MB
+    ctx = _context()
+    recv_conn, send_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(send_conn, task, args, cpu_seconds, memory_mb))
+    start = time.monotonic()
+    proc.start()
+    send_conn.close()
+    message = reason = None
+    try:
+        while True:
+            if recv_conn.poll(POLL_SECONDS):
+                try:
+                    message = recv_conn.recv()
+                except EOFError:
+                    pass  # died before answering
+                break
+            if not proc.is_alive():
+                break
+            if time.monotonic() - start > wall_seconds:
+                reason = "timeout"
+                break
+            rss = _rss_mb(proc.pid)
+            if rss is not None and rss > memory_mb:
+                reason = "memory_limit"
+                break
+            if deadline is not None and (deadline.cancelled or deadline.expired()):
+                proc.kill()
+                deadline.check()
+    finally:
+        if message is None and reason is None:
+            proc.join(1)  # let a child that closed the pipe finish exiting
+        if proc.is_alive():
+            proc.kill()
+        proc.join()
+        recv_conn.close()
+    metrics.observe(f"pdf_sandbox.{task}", (time.monotonic() - start) * 1000)
+
+    if message is not None and message[0] == "ok":
+        return message[1]
+    if message is not None:
+        reason, detail = message[1], message[2]
+    elif reason == "timeout":
+        detail = f"exceeded {wall_seconds:g}s wall clock"
+    elif reason == "memory_limit":
+        detail = f"exceeded {memory_mb} MB RSS"
+    else:
+        reason = _exit_reason(proc.exitcode)
+        detail = {
+            "cpu_limit": f"exceeded {cpu_seconds:g}s CPU",
+            "memory_limit": f"exceeded {memory_mb} MB (exit code {proc.exitcode})",
+        }.get(reason, f"exit code {proc.exitcode}")
+    metrics.incr(f"pdf_sandbox.{reason}")
+    if reason in LIMIT_REASONS:
+        logger.warning(f"Sandboxed PDF {task} killed: {reason} ({detail})")
+    raise PDFSandboxError(reason, detail)
+
+
+def inspect(data: bytes, dpi: int, max_pages: int, deadline=None):
+    return run("inspect", data, dpi, max_pages, deadline=deadline)
+
+
+def page_count(data: bytes, deadline=None) -> int:
+    from . import pdf_text
+    return run("page_count", data, pdf_text.get_backend().name, deadline=deadline)
+
+
+def extract_text(data: bytes, max_pages: int, deadline=None, pages: int = None):
+    """
+    Sandboxed pdf_text.extract_text: each page range is extracted in its own
+    child. `pages` is the page count if the caller already has it.
+    """
+    from . import pdf_text
+    backend = pdf_text.get_backend()
+    if pages is None:
+        pages = run("page_count", data, backend.name, deadline=deadline)
+    pages = min(pages, max_pages)
+    ranges = pdf_text.plan_ranges(pages)
+    if not ranges:
+        return None
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(run, "text_range", data, backend.name, a, b, deadline=deadline)
+                   for a, b in ranges]
+        texts = [text for f in futures for text in f.result()]
+    metrics.incr(f"pdf_text.{backend.name}")
+    return pdf_text.format_sections(texts)
+
+
+def rasterize(data: bytes, first: int, last: int, dpi: int, deadline=None):
+    """Sandboxed pdf2image.convert_from_bytes; returns PIL images."""
+    from PIL import Image
+    pages = run("rasterize", data, first, last, dpi, deadline=deadline)
+    return [Image.frombytes(mode, size, raw) for mode, size, raw in pages]
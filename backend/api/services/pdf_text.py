@@ -0,0 +1,224 @@
+"""
+Pluggable PDF text-layer extraction.
+
+Backends, fastest first: PyMuPDF (`fitz`), poppler's `pdftotext` CLI (already
+installed wherever pdf2image works), `pypdf` and `PyPDF2` as the pure-Python
+fallback. PDF_TEXT_BACKEND picks one by name; `auto` uses the choice saved by
+`python -m backend.pdf_benchmark --save`, else PyPDF2 as the service always
+has (its text is what extraction was written against), else the first one
+installed.
+
+Longer documents are split into page ranges extracted concurrently, each
+worker opening its own copy of the document (none of the parsers are safe
+to share across threads). The pure-Python parsers hold the GIL, so their
+ranges run in pdf_sandbox children (forked from its forkserver, with its
+resource limits); the others run on threads.
+"""
+import abc
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from pathlib import Path
+
+from ..utils import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+BACKEND_CHOICE_PATH = Path(os.getenv("PDF_BACKEND_CHOICE_PATH", PROJECT_ROOT / "data" / "pdf_backend.json"))
+PDF_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND", "auto")
+PDF_TEXT_WORKERS = int(os.getenv("PDF_TEXT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Below this many pages the pool hand-off costs more than it saves
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_TEXT_PARALLEL_MIN_PAGES", "4"))
+# `auto` without a benchmark choice
+DEFAULT_BACKEND = "pypdf2"
+
+
+class PdfBackend(abc.ABC):
+    name = None
+    holds_gil = False
+
+    @abc.abstractmethod
+    def available(self) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def page_count(self, data: bytes) -> int:
+        ...
+
+    @abc.abstractmethod
+    def extract_pages(self, data: bytes, first: int, last: int):
+        """Text of pages first..last (0-based, inclusive) as a list of strings."""
+
+
+class PyMuPDFBackend(PdfBackend):
+    name = "pymupdf"
+
+    def available(self):
+        try:
+            import fitz  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def page_count(self, data):
+        import fitz
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            return doc.page_count
+
+    def extract_pages(self, data, first, last):
+        import fitz
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            return [doc[i].get_text() for i in range(first, last + 1)]
+
+
+class PdftotextBackend(PdfBackend):
+    name = "pdftotext"
+
+    def available(self):
+        return shutil.which("pdftotext") is not None and shutil.which("pdfinfo") is not None
+
+    def page_count(self, data):
+        out = subprocess.run(["pdfinfo", "-"], input=data, capture_output=True, check=True).stdout
+        for line in out.decode("utf-8", "ignore").splitlines():
+            if line.startswith("Pages:"):
+                return int(line.split()[1])
+        return 0
+
+    def extract_pages(self, data, first, last):
+        out = subprocess.run(
+            ["pdftotext", "-layout", "-f", str(first + 1), "-l", str(last + 1), "-", "-"],
+            input=data, capture_output=True, check=True,
+        ).stdout.decode("utf-8", "ignore")
+        # pdftotext ends every page with a form feed
+        pages = out.split("\f")
+        return (pages + [""] * (last - first + 1))[:last - first + 1]
+
+
+class PypdfBackend(PdfBackend):
+    name = "pypdf"
+    module = "pypdf"
+    holds_gil = True
+
+    def _reader(self, data):
+        return __import__(self.module).PdfReader(io.BytesIO(data))
+
+    def available(self):
+        try:
+            __import__(self.module)
+            return True
+        except ImportError:
+            return False
+
+    def page_count(self, data):
+        return len(self._reader(data).pages)
+
+    def extract_pages(self, data, first, last):
+        reader = self._reader(data)
+        texts = []
+        for i in range(first, last + 1):
+            try:
+                texts.append(reader.pages[i].extract_text() or "")
+            except Exception as e:
+                logger.error(f"Error extracting text from page {i + 1}: {str(e)}")
+                texts.append("")
+        return texts
+
+
+class PyPDF2Backend(PypdfBackend):
+    name = "pypdf2"
+    module = "PyPDF2"
+
+
+BACKENDS = {b.name: b for b in (PyMuPDFBackend(), PdftotextBackend(), PypdfBackend(), PyPDF2Backend())}
+
+
+def available_backends():
+    return [name for name, b in BACKENDS.items() if b.available()]
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: str = None) -> PdfBackend:
+    """
+    Resolve a backend by name, or the configured one (`auto`: benchmarked,
+    else DEFAULT_BACKEND, else the first available).
+
+    Raises:
+        ValueError: the named backend is unknown or not installed
+    """
+    name = name or PDF_TEXT_BACKEND
+    if name == "auto":
+        if BACKEND_CHOICE_PATH.exists():
+            with open(BACKEND_CHOICE_PATH, encoding="utf-8") as f:
+                chosen = json.load(f).get("backend")
+            if chosen in BACKENDS and BACKENDS[chosen].available():
+                return BACKENDS[chosen]
+        if BACKENDS[DEFAULT_BACKEND].available():
+            return BACKENDS[DEFAULT_BACKEND]
+        for backend in BACKENDS.values():
+            if backend.available():
+                return backend
+        raise ValueError("No PDF text backend installed")
+    backend = BACKENDS.get(name)
+    if backend is None or not backend.available():
+        raise ValueError(f"PDF backend '{name}' is not available; installed: {', '.join(available_backends())}")
+    return backend
+
+
+def plan_ranges(pages: int, workers: int = None):
+    """Split pages 0..pages-1 into inclusive (first, last) ranges, one per worker."""
+    workers = PDF_TEXT_WORKERS if workers is None else workers
+    if pages == 0:
+        return []
+    if workers <= 1 or pages < PARALLEL_MIN_PAGES:
+        return [(0, pages - 1)]
+    chunk = -(-pages // workers)
+    return [(start, min(pages, start + chunk) - 1) for start in range(0, pages, chunk)]
+
+
+def format_sections(texts):
+    """Join page texts as "--- Page N ---" sections, or None if no page has text."""
+    sections = [f"--- Page {i + 1} ---\n{t}" for i, t in enumerate(texts) if t.strip()]
+    return "\n\n".join(sections) if sections else None
+
+
+def extract_pages(data: bytes, max_pages: int, backend: PdfBackend = None, workers: int = None,
+                  pages: int = None):
+    """
+    Text of the first `max_pages` pages, extracted in parallel page ranges when worthwhile.
+
+    `pages` is the document's page count if the caller already has it.
+    """
+    backend = backend or get_backend()
+    if pages is None:
+        pages = backend.page_count(data)
+    ranges = plan_ranges(min(pages, max_pages), workers)
+    if len(ranges) <= 1:
+        return backend.extract_pages(data, *ranges[0]) if ranges else []
+    if backend.holds_gil:
+        from . import pdf_sandbox
+        extract = partial(pdf_sandbox.run, "text_range", data, backend.name)
+    else:
+        extract = partial(backend.extract_pages, data)
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(extract, a, b) for a, b in ranges]
+        return [text for f in futures for text in f.result()]
+
+
+def extract_text(data: bytes, max_pages: int, backend: PdfBackend = None, pages: int = None):
+    """
+    Text layer of a PDF as "--- Page N ---" sections, or None if it has none.
+    """
+    try:
+        backend = backend or get_backend()
+        texts = extract_pages(data, max_pages, backend, pages=pages)
+    except Exception as e:
+        logger.error(f"Error extracting PDF text: {str(e)}")
+        return None
+    metrics.incr(f"pdf_text.{backend.name}")
+    return format_sections(texts)
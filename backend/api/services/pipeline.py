@@ -0,0 +1,58 @@
+"""
+The full report pipeline (OCR -> extraction -> analysis) without HTTP.
+
+Shared by the /full-analysis endpoint and the offline batch tools so they
+all produce the same result shape.
+"""
+import hashlib
+import json
+
+from . import ocr_service, ocr_profiles, ocr_settings, extract_service, ml_service
+from .disease_service import predict_diseases
+
+
+def content_hash(content: bytes) -> str:
+    """Stable identifier for a report's bytes."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def ocr_key(profile: str = None) -> str:
+    """
+    Fingerprint of the OCR profile and tuned settings a result is produced
+    with; stored results are only reused under the same one.
+    """
+    spec = {"profile": profile or ocr_profiles.DEFAULT_PROFILE, "settings": ocr_settings.SETTINGS}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def analyze_values(values: dict):
+    """Compare with ranges, predict risk and diseases for extracted values."""
+    comparison = ml_service.compare_with_ranges(values)
+    prediction = ml_service.predict_risk(values)
+    diseases_data = predict_diseases(values)
+    return comparison, prediction, diseases_data
+
+
+def build_full_result(file_name: str, text: str, values: dict) -> dict:
+    """Assemble the /full-analysis response body from OCR text and extracted values."""
+    comparison, prediction, diseases_data = analyze_values(values)
+    return {
+        "status": "success",
+        "file_name": file_name,
+        "extracted_text": text,
+        "parameters": {
+            "extracted": values,
+            "comparison": comparison
+        },
+        "health_assessment": {
+            "risk_prediction": prediction,
+            "disease_predictions": diseases_data
+        }
+    }
+
+
+def analyze_report(content: bytes, file_name: str = None, deadline=None) -> dict:
+    """Run OCR, extraction and analysis on a report's bytes."""
+    text = ocr_service.image_to_text(content, deadline)
+    values = extract_service.extract_key_values(text)
+    return build_full_result(file_name, text, values)
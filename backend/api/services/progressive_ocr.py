@@ -0,0 +1,143 @@
+"""
+Progressive multi-resolution OCR.
+
+A cheap pass OCRs the page at low resolution and keeps Tesseract's word
+boxes. Only lines whose parameter label was read but whose value is missing
+or implausible are cropped from a high-resolution rendering and OCR'd again
+as single lines, so clean reports never pay for high resolution.
+"""
+import logging
+import os
+import re
+
+from . import ocr_service, ocr_settings
+from .extract_service import extract_key_values, normalize_key
+from ..utils import metrics
+
+logger = logging.getLogger(__name__)
+
+LOW_WIDTH = int(os.getenv("PROGRESSIVE_LOW_WIDTH", "1024"))
+LOW_DPI = int(os.getenv("PROGRESSIVE_LOW_DPI", "100"))
+HIGH_DPI = int(os.getenv("PROGRESSIVE_HIGH_DPI", "300"))
+MAX_RESCANS_PER_PAGE = int(os.getenv("PROGRESSIVE_MAX_RESCANS", "8"))
+
+# Single text line, used for the targeted re-scans
+LINE_CONFIG = r'--oem 1 --psm 7'
+
+# Broad bounds that accept both absolute and x10^3 unit conventions;
+# anything outside is treated as an OCR error worth a second look
+PLAUSIBLE_RANGES = {
+    "Hemoglobin": (2, 25),
+    "WBC": (0.5, 200000),
+    "Platelets": (5, 2000000),
+    "Creatinine": (0.1, 20),
+    "SGPT": (1, 5000),
+    "SGOT": (1, 5000),
+    "Bilirubin": (0.05, 50),
+}
+
+LABEL_RE = re.compile(r'\s*([A-Za-z][A-Za-z \-\(\)/]*)')
+
+
+def is_plausible(key: str, value: float) -> bool:
+    low, high = PLAUSIBLE_RANGES.get(key, (float("-inf"), float("inf")))
+    return low <= value <= high
+
+
+def group_lines(words):
+    """Group Tesseract words into text lines with a bounding box, in reading order."""
+    lines = {}
+    for w in words:
+        key = (w["block_num"], w["par_num"], w["line_num"])
+        line = lines.setdefault(key, {"words": [], "box": [w["left"], w["top"], 0, 0]})
+        line["words"].append(w["text"])
+        box = line["box"]
+        box[0] = min(box[0], w["left"])
+        box[1] = min(box[1], w["top"])
+        box[2] = max(box[2], w["left"] + w["width"])
+        box[3] = max(box[3], w["top"] + w["height"])
+    return [
+        {"text": " ".join(line["words"]), "box": tuple(line["box"])}
+        for _, line in sorted(lines.items())
+    ]
+
+
+def lines_needing_rescan(lines):
+    """
+    Find lines that name a parameter but yield no plausible value.
+
+    Returns:
+        List of (line index, standard parameter key)
+    """
+    targets = []
+    for i, line in enumerate(lines):
+        m = LABEL_RE.match(line["text"])
+        key = normalize_key(m.group(1)) if m else None
+        if key is None:
+            continue
+        value = extract_key_values(line["text"]).get(key)
+        if value is None or not is_plausible(key, value):
+            targets.append((i, key))
+    return targets[:MAX_RESCANS_PER_PAGE]
+
+
+def ocr_page(low_img, load_high_res, deadline=None, progress=None, page: int = 1,
+             config: str = ocr_service.TESSERACT_CONFIG, preprocess=()) -> str:
+    """
+    OCR one page progressively.
+
+    Args:
+        low_img: Page image at the cheap resolution
+        load_high_res: Callable returning the same page at high resolution,
+            or None if it cannot be rendered; only called if some line needs
+            a re-scan
+        preprocess: ocr_settings steps applied to both resolutions first
+    """
+    low_img = ocr_settings.preprocess(low_img, preprocess)
+    words = ocr_service.run_tesseract_data(low_img, config, deadline)
+    lines = group_lines(words)
+    targets = lines_needing_rescan(lines)
+    if not targets:
+        metrics.incr("ocr.progressive.cheap_only")
+        return "\n".join(line["text"] for line in lines)
+
+    high = load_high_res()
+    if high is None:
+        metrics.incr("ocr.progressive.no_high_res")
+        logger.warning(f"Progressive OCR page {page}: no high-resolution rendering, keeping the cheap pass")
+        return "\n".join(line["text"] for line in lines)
+    metrics.incr("ocr.progressive.rescanned_pages")
+    high = ocr_settings.preprocess(high, preprocess)
+    sx = high.width / low_img.width
+    sy = high.height / low_img.height
+    fixed = []
+    for i, key in targets:
+        left, top, right, bottom = lines[i]["box"]
+        pad = (bottom - top) * 0.5
+        # Values sit to the right of the label, so keep the rest of the row
+        crop = high.crop((
+            int(max(0, left - pad) * sx),
+            int(max(0, top - pad) * sy),
+            high.width,
+            int(min(low_img.height, bottom + pad) * sy),
+        ))
+        text = ocr_service.run_tesseract(crop, LINE_CONFIG, deadline).strip()
+        value = extract_key_values(text).get(key)
+        metrics.incr("ocr.progressive.rescans")
+        if value is not None and is_plausible(key, value):
+            lines[i]["text"] = text
+            fixed.append(key)
+    if fixed:
+        metrics.incr("ocr.progressive.recovered", len(fixed))
+    if progress is not None:
+        progress("rescan", {"page": page, "targets": [k for _, k in targets], "recovered": fixed})
+    logger.info(f"Progressive OCR page {page}: re-scanned {len(targets)} line(s), recovered {fixed}")
+    return "\n".join(line["text"] for line in lines)
+
+
+def high_res_image(img):
+    """High-resolution source for an uploaded image: the original, or 2x if it is already small."""
+    from PIL import Image
+    if img.width >= LOW_WIDTH * 1.5:
+        return img
+    return img.resize((img.width * 2, img.height * 2), Image.Resampling.LANCZOS)
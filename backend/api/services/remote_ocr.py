@@ -0,0 +1,260 @@
+"""
+Dispatch of Tesseract jobs to remote OCR worker nodes.
+
+OCR is nearly all of the backend's CPU, so it can be scaled out separately:
+set OCR_WORKER_URLS to a comma-separated list of worker base URLs (see
+backend/ocr_worker.py) and every page/line OCR job is sent to the least
+loaded healthy worker as a PNG over HTTP. A background thread polls each
+worker's /health; a worker that fails a request is taken out of rotation
+until its next good health check and the job is retried on another one.
+If no worker can take the job it runs locally (OCR_WORKER_LOCAL_FALLBACK).
+"""
+import io
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from .deadline import OCRCancelled
+from ..utils import metrics
+
+logger = logging.getLogger(__name__)
+
+WORKER_URLS = [u.strip().rstrip("/") for u in os.getenv("OCR_WORKER_URLS", "").split(",") if u.strip()]
+HEALTH_INTERVAL = float(os.getenv("OCR_WORKER_HEALTH_INTERVAL", "5"))
+MAX_ATTEMPTS = int(os.getenv("OCR_WORKER_MAX_ATTEMPTS", "3"))
+LOCAL_FALLBACK = os.getenv("OCR_WORKER_LOCAL_FALLBACK", "1") == "1"
+REQUEST_TIMEOUT = float(os.getenv("OCR_WORKER_TIMEOUT", "120"))
+CONNECT_TIMEOUT = 2.0
+# How often a request waiting on a worker checks whether it was cancelled
+CANCEL_POLL_SECONDS = 0.1
+
+PSM_RE = re.compile(r"--psm (\d+)")
+
+
+class NoWorkerAvailable(Exception):
+    """Every worker is down or busy and local fallback is off."""
+
+
+class WorkerNode:
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True   # optimistic until the first health check says otherwise
+        self.in_flight = 0    # jobs we have sent and not yet got back
+        self.reported_in_flight = 0
+        self.capacity = 1
+        self.last_error = None
+
+    @property
+    def load(self) -> float:
+        return (self.in_flight + self.reported_in_flight) / max(1, self.capacity)
+
+    def as_dict(self):
+        return {
+            "url": self.url, "healthy": self.healthy, "in_flight": self.in_flight,
+            "reported_in_flight": self.reported_in_flight, "capacity": self.capacity,
+            "last_error": self.last_error,
+        }
+
+
+class WorkerTier:
+    """Membership, health checks and least-loaded routing over a fixed set of workers."""
+
+    def __init__(self, urls, health_interval: float = HEALTH_INTERVAL):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.nodes = [WorkerNode(u) for u in urls]
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(urls) or 1, pool_maxsize=32)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # POSTs run here so the calling thread can give up on a cancelled request
+        self._calls = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ocr-dispatch")
+        self._checker = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._checker is None and self.nodes:
+            self.check_health()
+            self._checker = threading.Thread(target=self._health_loop, name="ocr-worker-health", daemon=True)
+            self._checker.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._calls.shutdown(wait=False)
+
+    def _health_loop(self):
+        while not self._stopped.wait(self.health_interval):
+            self.check_health()
+
+    def check_health(self):
+        for node in self.nodes:
+            try:
+                response = self._session.get(f"{node.url}/health", timeout=CONNECT_TIMEOUT)
+                response.raise_for_status()
+                status = response.json()
+                with self._lock:
+                    if not node.healthy:
+                        logger.info(f"OCR worker {node.url} is back")
+                    node.healthy = True
+                    node.capacity = int(status.get("capacity", 1))
+                    node.reported_in_flight = int(status.get("in_flight", 0))
+            except Exception as e:
+                self._mark_down(node, e)
+        metrics.set_value("ocr.workers.healthy", sum(n.healthy for n in self.nodes))
+
+    def _mark_down(self, node: WorkerNode, error):
+        with self._lock:
+            if node.healthy:
+                logger.warning(f"OCR worker {node.url} marked down: {error}")
+            node.healthy = False
+            node.last_error = str(error)
+
+    def _acquire(self, exclude):
+        """Pick the least-loaded healthy node not yet tried and count the job against it."""
+        with self._lock:
+            candidates = [n for n in self.nodes if n.healthy and n not in exclude]
+            if not candidates:
+                return None
+            node = min(candidates, key=lambda n: n.load)
+            node.in_flight += 1
+            return node
+
+    def _release(self, node: WorkerNode):
+        with self._lock:
+            node.in_flight -= 1
+
+    def _post(self, node: WorkerNode, png: bytes, params: dict, headers: dict, timeout: float, deadline):
+        """
+        POST one job to `node`, returning as soon as the request's deadline is
+        cancelled or passes (OCRCancelled) rather than when the worker answers.
+
+        An abandoned job still counts against the node until it answers; the
+        worker stops it at its X-Request-Timeout.
+        """
+        future = self._calls.submit(
+            self._session.post, f"{node.url}/ocr", params=params, data=png,
+            headers=headers, timeout=(CONNECT_TIMEOUT, timeout + 1),
+        )
+        future.add_done_callback(lambda _: self._release(node))
+        if deadline is None:
+            return future.result()
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL_SECONDS)
+            except FutureTimeout:
+                deadline.check()
+
+    def dispatch(self, png: bytes, params: dict, deadline=None) -> str:
+        """
+        Run one job on a worker, retrying on other workers.
+
+        Raises:
+            NoWorkerAvailable: no worker could take the job
+            OCRCancelled: the request's deadline passed or it was cancelled
+        """
+        import requests
+        tried = []
+        while len(tried) < MAX_ATTEMPTS:
+            if deadline:
+                deadline.check()
+            node = self._acquire(tried)
+            if node is None:
+                break
+            tried.append(node)
+            timeout = REQUEST_TIMEOUT
+            if deadline and deadline.remaining() is not None:
+                timeout = max(0.1, deadline.remaining())
+            headers = {"Content-Type": "image/png", "X-Request-Timeout": f"{timeout:.3f}"}
+            if deadline and deadline.priority:
+                headers["X-OCR-Priority"] = deadline.priority
+            if deadline:
+                headers["X-OCR-Flow"] = deadline.flow_id
+            try:
+                response = self._post(node, png, params, headers, timeout, deadline)
+            except requests.exceptions.RequestException as e:
+                self._mark_down(node, e)
+                metrics.incr("ocr.workers.retries")
+                continue
+            if response.status_code == 200:
+                metrics.incr("ocr.workers.dispatched")
+                return response.json()["output"]
+            if response.status_code == 504:
+                if deadline:
+                    deadline.cancel("deadline")
+                raise OCRCancelled("deadline")
+            if response.status_code == 503:
+                # Busy, not broken: try another node without taking this one out
+                metrics.incr("ocr.workers.busy")
+                continue
+            if response.status_code >= 500:
+                self._mark_down(node, f"HTTP {response.status_code}")
+                metrics.incr("ocr.workers.retries")
+                continue
+            raise RuntimeError(f"OCR worker {node.url} rejected the job: {response.text}")
+        raise NoWorkerAvailable(f"No OCR worker available after trying {len(tried)}")
+
+
+_tier = None
+_tier_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(WORKER_URLS)
+
+
+def get_tier() -> WorkerTier:
+    global _tier
+    with _tier_lock:
+        if _tier is None:
+            _tier = WorkerTier(WORKER_URLS)
+            _tier.start()
+        return _tier
+
+
+def _profile_params(config: str) -> dict:
+    """
+    Send known profiles by name: their vocabulary files live on each worker's
+    own disk. The page segmentation mode goes along, since the call may use a
+    tuned one rather than the worker's.
+    """
+    from . import ocr_profiles
+    m = PSM_RE.search(config)
+    psm = int(m.group(1)) if m else None
+    for name in ocr_profiles.PROFILES:
+        if ocr_profiles.profile_config(name, psm) == config:
+            return {"profile": name, **({"psm": psm} if psm else {})}
+    return {"config": config}
+
+
+def run(img, config: str, deadline=None, kind: str = "text") -> str:
+    """
+    OCR `img` on a worker and return Tesseract's output (`kind` "text" or "tsv").
+
+    Falls back to local Tesseract when no worker can take the job.
+    """
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    params = {"kind": kind, **_profile_params(config)}
+    start = time.perf_counter()
+    try:
+        output = get_tier().dispatch(buf.getvalue(), params, deadline)
+        metrics.observe("ocr.workers.remote", (time.perf_counter() - start) * 1000)
+        return output
+    except NoWorkerAvailable as e:
+        if not LOCAL_FALLBACK:
+            raise
+        metrics.incr("ocr.workers.local_fallback")
+        logger.warning(f"{str(e)}, running OCR locally")
+    from . import ocr_service
+    if kind == "tsv":
+        return ocr_service.run_tesseract_tsv_local(img, config, deadline)
+    return ocr_service.run_tesseract_local(img, config, deadline)
+
+
+def status():
+    return [n.as_dict() for n in get_tier().nodes] if enabled() else []
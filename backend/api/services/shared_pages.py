@@ -0,0 +1,144 @@
+"""
+Page pixels in shared memory for OCR worker processes.
+
+The API process copies a page's pixels into a named shared-memory segment
+once and sends workers only a PageDescriptor (segment name, array shape,
+PIL mode). Workers map the segment and wrap it in a PIL image without
+copying; a strip of a tiled page is a row slice of the same mapping.
+
+A byte after the pixels is the page's cancel flag: the owner sets it with
+cancel() and workers poll it through cancel_flag(), so an API-side
+cancellation reaches strips already running in other processes.
+
+Only the creating process unlinks a segment, so a crashed worker cannot
+leak one. Segments left by a crashed API process carry its pid in their
+name and are removed by cleanup_leaked_segments() on the next start.
+"""
+import logging
+import os
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+from ..utils import metrics
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "bloodreport"
+SHM_DIR = "/dev/shm"
+
+PageDescriptor = namedtuple("PageDescriptor", ["name", "shape", "mode"])
+
+
+class SharedPage:
+    """Owner side of a page in shared memory; the segment is unlinked on close()."""
+
+    def __init__(self, img):
+        import numpy as np
+        if img.mode not in ("L", "RGB"):
+            img = img.convert("RGB")
+        shape = (img.height, img.width) if img.mode == "L" else (img.height, img.width, 3)
+        size = int(np.prod(shape))
+        name = f"{SEGMENT_PREFIX}_{os.getpid()}_{uuid.uuid4().hex[:12]}"
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=size + 1)
+        self._flag = size
+        view = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf)
+        view[...] = np.asarray(img)
+        del view  # release the export so close() can unmap
+        self.descriptor = PageDescriptor(self._shm.name, shape, img.mode)
+        metrics.incr("ocr.shm.segments")
+        metrics.incr("ocr.shm.bytes", size)
+
+    def cancel(self):
+        """Tell workers reading this page to stop."""
+        if self._shm is not None:
+            self._shm.buf[self._flag] = 1
+
+    def close(self):
+        if self._shm is None:
+            return
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def open_page(desc: PageDescriptor, rows=None):
+    """
+    Worker side: yield a PIL image backed by the segment, without copying.
+
+    Args:
+        rows: Optional (top, bottom) to map only a horizontal strip
+
+    The image is only valid inside the with-block.
+    """
+    import numpy as np
+    from PIL import Image
+    shm = shared_memory.SharedMemory(name=desc.name)
+    arr = img = None
+    try:
+        arr = np.ndarray(desc.shape, dtype=np.uint8, buffer=shm.buf)
+        if rows is not None:
+            arr = arr[rows[0]:rows[1]]
+        img = Image.fromarray(arr, desc.mode)
+        yield img
+    finally:
+        # Views into the mapping must be gone before it can be closed
+        if img is not None:
+            img.close()
+        img = arr = None
+        shm.close()
+
+
+@contextmanager
+def cancel_flag(desc: PageDescriptor):
+    """Worker side: yield a callable telling whether the owner has cancelled the page."""
+    import numpy as np
+    shm = shared_memory.SharedMemory(name=desc.name)
+    offset = int(np.prod(desc.shape))
+    try:
+        yield lambda: shm.buf[offset] != 0
+    finally:
+        shm.close()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def cleanup_leaked_segments() -> int:
+    """Unlink segments whose creating process is gone; returns how many were removed."""
+    if not os.path.isdir(SHM_DIR):
+        return 0
+    removed = 0
+    for entry in os.listdir(SHM_DIR):
+        parts = entry.split("_")
+        if len(parts) != 3 or parts[0] != SEGMENT_PREFIX or not parts[1].isdigit():
+            continue
+        if _pid_alive(int(parts[1])):
+            continue
+        try:
+            os.unlink(os.path.join(SHM_DIR, entry))
+            removed += 1
+        except OSError:
+            pass
+    if removed:
+        logger.warning(f"Removed {removed} leaked shared-memory page segment(s)")
+        metrics.incr("ocr.shm.leaked_removed", removed)
+    return removed
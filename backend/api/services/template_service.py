@@ -0,0 +1,260 @@
+"""
+Lab-template registry for region-targeted OCR.
+
+Most reports come from a handful of lab layouts. Each enrolled template
+stores a perceptual hash of the page layout and the normalised boxes of its
+value cells. Incoming pages are fingerprinted and matched with a BK-tree
+over Hamming distance; on a match only the value cells are OCR'd, as single
+numeric lines, instead of running full-page Tesseract.
+"""
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from . import ocr_service, ocr_profiles
+from .extract_service import normalize_key
+from ..utils import metrics
+from ..utils.bktree import BKTree
+from ..utils.imagehash import phash, hamming, to_hex, from_hex
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+TEMPLATES_PATH = Path(os.getenv("TEMPLATES_PATH", PROJECT_ROOT / "data" / "templates.json"))
+
+# 256-bit layout fingerprint; pages within this many differing bits match
+FINGERPRINT_SIZE = 16
+FINGERPRINT_BITS = FINGERPRINT_SIZE ** 2
+MATCH_MAX_DISTANCE = int(os.getenv("TEMPLATE_MATCH_MAX_DISTANCE", "40"))
+
+# Fraction of a template's value cells that must read back as numbers,
+# otherwise the page is treated as a different layout and fully OCR'd
+MIN_FILLED_RATIO = 0.5
+
+# Value cells hold one number: single line, digits only
+CELL_PROFILE = "numeric"
+
+LABEL_RE = re.compile(r'[A-Za-z][A-Za-z \-\(\)/]*')
+NUMBER_RE = re.compile(r'[0-9]+(?:[.,][0-9]+)?')
+THOUSANDS_RE = re.compile(r',(?=[0-9]{3}(?![0-9]))')
+
+
+def layout_fingerprint(img) -> int:
+    """Perceptual hash of the page layout (text blocks, rules, table grid)."""
+    return phash(img, hash_size=FINGERPRINT_SIZE)
+
+
+def _word_lines(words):
+    lines = {}
+    for w in words:
+        lines.setdefault((w["block_num"], w["par_num"], w["line_num"]), []).append(w)
+    return [sorted(ws, key=lambda w: w["left"]) for _, ws in sorted(lines.items())]
+
+
+def find_value_cells(words, width: int, height: int):
+    """
+    Derive value-cell regions from a full-page OCR of a template page.
+
+    For each line that starts with a known parameter label, the first number
+    after the label is its value; its box is widened to absorb shifts
+    between scans and normalised to the page size.
+
+    Returns:
+        {parameter: [x0, y0, x1, y1]} with coordinates in 0..1
+    """
+    cells = {}
+    for line in _word_lines(words):
+        label = []
+        for i, w in enumerate(line):
+            if NUMBER_RE.fullmatch(w["text"].strip(":")):
+                break
+            label.append(w["text"])
+        else:
+            continue
+        m = LABEL_RE.match(" ".join(label))
+        key = normalize_key(m.group(0)) if m else None
+        if key is None or key in cells:
+            continue
+        value = line[i]
+        pad_x = max(value["width"], value["height"])
+        pad_y = value["height"] * 0.4
+        cells[key] = [
+            round(max(0.0, (value["left"] - pad_x * 0.5) / width), 4),
+            round(max(0.0, (value["top"] - pad_y) / height), 4),
+            round(min(1.0, (value["left"] + value["width"] + pad_x) / width), 4),
+            round(min(1.0, (value["top"] + value["height"] + pad_y) / height), 4),
+        ]
+    return cells
+
+
+class TemplateRegistry:
+    """Enrolled templates persisted as JSON, indexed by layout fingerprint."""
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path or TEMPLATES_PATH)
+        self._lock = threading.Lock()
+        self.templates = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for t in json.load(f).get("templates", []):
+                    self.templates[t["id"]] = t
+        self._build_index()
+
+    def _build_index(self):
+        self._index = BKTree(
+            lambda a, b: hamming(a[0], b[0]),
+            [(from_hex(t["fingerprint"]), t["id"]) for t in self.templates.values()],
+        )
+
+    def __len__(self):
+        return len(self.templates)
+
+    def list(self):
+        return [
+            {"id": t["id"], "name": t["name"], "profile": t.get("profile", CELL_PROFILE),
+             "created_at": t["created_at"], "parameters": sorted(t["cells"])}
+            for t in self.templates.values()
+        ]
+
+    def match(self, fingerprint: int):
+        """Return (template, distance) of the nearest template within MATCH_MAX_DISTANCE, or None."""
+        with self._lock:
+            found = self._index.nearest((fingerprint, None), MATCH_MAX_DISTANCE)
+            if found is None:
+                return None
+            distance, (_, template_id) = found
+            return self.templates[template_id], distance
+
+    def add(self, name: str, fingerprint: int, cells: dict, profile: str = CELL_PROFILE) -> dict:
+        template = {
+            "id": uuid.uuid4().hex[:12],
+            "name": name,
+            "fingerprint": to_hex(fingerprint, FINGERPRINT_BITS),
+            "cells": cells,
+            "profile": profile,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self.templates[template["id"]] = template
+            self._index.add((fingerprint, template["id"]))
+            self._save()
+        return template
+
+    def remove(self, template_id: str) -> bool:
+        with self._lock:
+            if self.templates.pop(template_id, None) is None:
+                return False
+            self._build_index()
+            self._save()
+            return True
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"templates": list(self.templates.values())}, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> TemplateRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TemplateRegistry()
+    return _registry
+
+
+def enroll(name: str, img, deadline=None, profile: str = CELL_PROFILE) -> dict:
+    """
+    Enrol a page image as a new template.
+
+    Runs one full-page OCR to locate the value cells; `profile` is the OCR
+    profile used to read them on matching pages. Raises ValueError if the
+    profile is unknown or no parameter values are found on the page.
+    """
+    ocr_profiles.profile_config(profile)
+    words = ocr_service.run_tesseract_data(img, ocr_service.TESSERACT_CONFIG, deadline)
+    cells = find_value_cells(words, img.width, img.height)
+    if not cells:
+        raise ValueError("No blood parameters with values found on the page")
+    template = get_registry().add(name, layout_fingerprint(img), cells, profile)
+    logger.info(f"Enrolled template {template['id']} ({name}) with cells {sorted(cells)}")
+    return template
+
+
+def enroll_document(name: str, content: bytes, deadline=None, profile: str = CELL_PROFILE) -> dict:
+    """Enrol the first page of an uploaded image or scanned PDF."""
+    from PIL import Image
+    if content[:4] == b'%PDF':
+        images = ocr_service.convert_pdf_to_images(content, 1, 1, deadline=deadline)
+        if not images:
+            raise ValueError("Could not rasterize the PDF")
+        img = images[0].convert("RGB")
+    else:
+        img = Image.open(io.BytesIO(content)).convert("RGB")
+    return enroll(name, img, deadline, profile)
+
+
+def read_cell(img, box, deadline=None, config: str = None):
+    """OCR one normalised value cell and return its number, or None."""
+    from PIL import Image
+    x0, y0, x1, y1 = box
+    crop = img.crop((int(x0 * img.width), int(y0 * img.height),
+                     int(x1 * img.width), int(y1 * img.height)))
+    if crop.height < 32:
+        # Tesseract is most reliable with glyphs around 20-30 px tall
+        scale = 32 / max(1, crop.height)
+        crop = crop.resize((int(crop.width * scale), 32), Image.Resampling.LANCZOS)
+    config = config or ocr_profiles.profile_config(CELL_PROFILE)
+    text = ocr_service.run_tesseract(crop, config, deadline).replace(" ", "")
+    # "4,500" is a thousands separator, "1,2" a decimal comma
+    m = NUMBER_RE.search(THOUSANDS_RE.sub("", text))
+    return float(m.group(0).replace(",", ".")) if m else None
+
+
+def ocr_with_template(img, deadline=None, progress=None, page: int = 1):
+    """
+    OCR a page through a matching template.
+
+    Returns:
+        "Parameter: value" lines for the template's cells, or None when no
+        template matches or too few cells read back (caller falls back to
+        full-page OCR)
+    """
+    registry = get_registry()
+    if not len(registry):
+        return None
+    matched = registry.match(layout_fingerprint(img))
+    if matched is None:
+        metrics.incr("ocr.template.miss")
+        return None
+    template, distance = matched
+
+    config = ocr_profiles.profile_config(template.get("profile", CELL_PROFILE))
+    values = {}
+    for key, box in template["cells"].items():
+        value = read_cell(img, box, deadline, config)
+        if value is not None:
+            values[key] = value
+    if len(values) < len(template["cells"]) * MIN_FILLED_RATIO:
+        metrics.incr("ocr.template.rejected")
+        logger.info(f"Template {template['id']} matched page {page} (distance {distance}) "
+                    f"but only {len(values)}/{len(template['cells'])} cells read; falling back")
+        return None
+
+    metrics.incr("ocr.template.hit")
+    if progress is not None:
+        progress("template", {"page": page, "template": template["name"], "distance": distance})
+    logger.info(f"Page {page} matched template {template['name']} (distance {distance})")
+    return "\n".join(f"{key}: {value:g}" for key, value in values.items())
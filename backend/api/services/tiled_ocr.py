@@ -0,0 +1,151 @@
+"""
+Strip-tiled OCR for very tall or very large single images.
+
+Long photographed reports and stitched screenshots are split into
+overlapping horizontal strips at native resolution (no downscaling, so
+small text survives) and the strips are OCR'd in parallel. Each strip owns
+the band between the midpoints of its overlaps; a text line is kept only by
+the strip that owns its vertical centre, which removes the duplicates the
+overlaps produce and drops the half-lines cut at strip edges.
+
+Strips run on threads by default, or in the OCR process pool (with the page
+handed over through shared memory) when OCR_PROCESS_WORKERS is set.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import ocr_service, ocr_pool, ocr_settings
+from ..utils import metrics
+
+logger = logging.getLogger(__name__)
+
+OCR_TILING = os.getenv("OCR_TILING", "1") == "1"
+TILE_MIN_HEIGHT = int(os.getenv("OCR_TILE_MIN_HEIGHT", "2400"))
+# Only images much taller than a page are tiled for their height: a portrait
+# photo of an A4 report (about 1.4 high per wide) is OCR'd downscaled like any page
+TILE_MIN_ASPECT = float(os.getenv("OCR_TILE_MIN_ASPECT", "2.0"))
+TILE_MIN_PIXELS = int(os.getenv("OCR_TILE_MIN_PIXELS", "24000000"))
+STRIP_HEIGHT = int(os.getenv("OCR_STRIP_HEIGHT", "1000"))
+# Must exceed the tallest text line so every line is whole in some strip
+STRIP_OVERLAP = int(os.getenv("OCR_STRIP_OVERLAP", "120"))
+# Each strip is its own Tesseract process, so threads are enough to use every core
+TILE_WORKERS = int(os.getenv("OCR_TILE_WORKERS", str(os.cpu_count() or 2)))
+
+
+def should_tile(img) -> bool:
+    tall = img.height >= TILE_MIN_HEIGHT and img.height >= TILE_MIN_ASPECT * img.width
+    return tall or img.width * img.height >= TILE_MIN_PIXELS
+
+
+def plan_strips(height: int, strip_height: int = STRIP_HEIGHT, overlap: int = STRIP_OVERLAP):
+    """
+    Split [0, height) into overlapping strips.
+
+    Returns:
+        List of (top, bottom, own_top, own_bottom): the crop rows and the
+        rows whose lines this strip is responsible for
+    """
+    step = strip_height - overlap
+    tops = list(range(0, max(1, height - overlap), step))
+    strips = []
+    for i, top in enumerate(tops):
+        bottom = min(height, top + strip_height)
+        own_top = 0 if i == 0 else top + overlap // 2
+        own_bottom = height if i == len(tops) - 1 else bottom - overlap // 2
+        strips.append((top, bottom, own_top, own_bottom))
+    return strips
+
+
+def _owned_lines(words, strip):
+    """Lines (lists of words, moved to page coordinates) whose vertical centre this strip owns."""
+    top, bottom, own_top, own_bottom = strip
+    lines = {}
+    for w in words:
+        lines.setdefault((w["block_num"], w["par_num"], w["line_num"]), []).append(w)
+    kept = []
+    for _, line in sorted(lines.items()):
+        y0 = min(w["top"] for w in line)
+        y1 = max(w["top"] + w["height"] for w in line)
+        if own_top <= top + (y0 + y1) / 2 < own_bottom:
+            kept.append([{**w, "top": w["top"] + top} for w in line])
+    return kept
+
+
+def _line_text(line) -> str:
+    return " ".join(w["text"] for w in line)
+
+
+def _ocr_strip(img, strip, config, deadline):
+    top, bottom = strip[:2]
+    words = ocr_service.run_tesseract_data(img.crop((0, top, img.width, bottom)), config, deadline)
+    return _owned_lines(words, strip)
+
+
+def _ocr_strips_in_threads(img, strips, config, deadline, progress):
+    results = [None] * len(strips)
+    with ThreadPoolExecutor(max_workers=min(TILE_WORKERS, len(strips))) as pool:
+        futures = {pool.submit(_ocr_strip, img, s, config, deadline): i for i, s in enumerate(strips)}
+        try:
+            for done, future in enumerate(futures, 1):
+                results[futures[future]] = future.result()
+                if progress is not None:
+                    progress("strip_ocr", {"strip": done, "strips": len(strips)})
+        except BaseException:
+            # Don't start strips that are still queued; running ones stop on the deadline
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+
+def _ocr_strips_in_processes(img, strips, config, deadline, progress):
+    def on_done(i, words):
+        if progress is not None:
+            progress("strip_ocr", {"strip": i + 1, "strips": len(strips)})
+    words = ocr_pool.ocr_strips(img, [s[:2] for s in strips], config, deadline, on_done)
+    return [_owned_lines(w, s) for w, s in zip(words, strips)]
+
+
+def ocr_image(img, config: str = ocr_service.TESSERACT_CONFIG, deadline=None, progress=None,
+              preprocess=()) -> str:
+    """
+    OCR a large image as parallel strips and return the merged text in reading order.
+
+    `preprocess` lists ocr_settings steps applied to the image first, as on
+    the full-page path.
+    """
+    return ocr_image_words(img, config, deadline, progress, preprocess)[0]
+
+
+def ocr_image_words(img, config: str = ocr_service.TESSERACT_CONFIG, deadline=None, progress=None,
+                    preprocess=()):
+    """
+    Like ocr_image, but also return the kept words in `img`'s coordinates,
+    each line numbered as its own block.
+
+    Returns:
+        (text, words)
+    """
+    img = ocr_settings.preprocess(img, preprocess)
+    strips = plan_strips(img.height)
+    metrics.incr("ocr.tiled.images")
+    metrics.incr("ocr.tiled.strips", len(strips))
+    logger.info(f"Tiling {img.width}x{img.height} image into {len(strips)} strips")
+    results = None
+    if ocr_pool.enabled():
+        try:
+            results = _ocr_strips_in_processes(img, strips, config, deadline, progress)
+        except BrokenProcessPool:
+            logger.warning("OCR worker pool failed, falling back to in-process strips")
+    if results is None:
+        results = _ocr_strips_in_threads(img, strips, config, deadline, progress)
+    lines = []
+    for strip_lines in results:
+        for line in strip_lines:
+            # A line straddling an ownership boundary can still be read twice
+            if not lines or _line_text(line) != _line_text(lines[-1]):
+                lines.append(line)
+    words = [{**w, "block_num": n, "par_num": 1, "line_num": 1} for n, line in enumerate(lines, 1) for w in line]
+    return "\n".join(_line_text(line) for line in lines), words
@@ -0,0 +1,58 @@
+"""
+Burkhard-Keller tree for nearest-neighbour lookups under a metric.
+
+Works with any integer metric that satisfies the triangle inequality
+(Hamming distance between hashes, edit distance between strings). A search
+with radius r only descends into children whose edge distance lies within
+r of the query's distance to the node, so most of the tree is never visited.
+"""
+
+
+class BKTree:
+    def __init__(self, distance, items=()):
+        self.distance = distance
+        self._root = None
+        self._size = 0
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, item):
+        if self._root is None:
+            self._root = (item, {})
+            self._size = 1
+            return
+        node = self._root
+        while True:
+            d = self.distance(item, node[0])
+            if d == 0 and item == node[0]:
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = (item, {})
+                self._size += 1
+                return
+            node = child
+
+    def search(self, item, max_distance: int):
+        """Return [(distance, item)] within `max_distance`, closest first."""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            value, children = stack.pop()
+            d = self.distance(item, value)
+            if d <= max_distance:
+                found.append((d, value))
+            low, high = d - max_distance, d + max_distance
+            stack.extend(child for edge, child in children.items() if low <= edge <= high)
+        found.sort(key=lambda x: x[0])
+        return found
+
+    def nearest(self, item, max_distance: int):
+        """Return (distance, item) of the closest match within `max_distance`, or None."""
+        found = self.search(item, max_distance)
+        return found[0] if found else None
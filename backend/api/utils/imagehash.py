@@ -0,0 +1,51 @@
+"""
+Perceptual image hashes and Hamming-distance helpers.
+
+`phash` keeps the signs of the lowest DCT frequencies of a downscaled
+grayscale image, so it survives re-scans, JPEG artefacts and small shifts
+but changes when the page layout does.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis, so dct(x) == D @ x."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    d = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    d[0] /= np.sqrt(2.0)
+    return d
+
+
+def phash(img, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """
+    Perceptual hash of an image as an int of hash_size**2 bits.
+
+    Args:
+        img: PIL image
+        hash_size: Side of the kept low-frequency block; 8 gives 64 bits,
+            16 gives 256 bits and resolves coarser layout detail
+    """
+    from PIL import Image
+    size = hash_size * highfreq_factor
+    pixels = np.asarray(img.convert("L").resize((size, size), Image.Resampling.LANCZOS), dtype=np.float64)
+    d = _dct_matrix(size)
+    low = (d @ pixels @ d.T)[:hash_size, :hash_size]
+    # Median without the DC term, which only encodes overall brightness
+    bits = (low > np.median(low.flatten()[1:])).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def to_hex(h: int, bits: int) -> str:
+    return format(h, f"0{bits // 4}x")
+
+
+def from_hex(s: str) -> int:
+    return int(s, 16)
@@ -0,0 +1,48 @@
+import threading
+
+# In-process counters and timings exposed through the /metrics endpoint
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+_values = {}
+
+
+def incr(name: str, amount: int = 1):
+    """Increment a named counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name: str, ms: float):
+    """Record a duration in milliseconds under the given name."""
+    with _lock:
+        t = _timings.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0})
+        t["count"] += 1
+        t["total_ms"] += ms
+        t["last_ms"] = ms
+        if ms > t["max_ms"]:
+            t["max_ms"] = ms
+
+
+def set_value(name: str, value):
+    """Store a point-in-time value (gauge, flag or small dict)."""
+    with _lock:
+        _values[name] = value
+
+
+def get_value(name: str, default=None):
+    with _lock:
+        return _values.get(name, default)
+
+
+def snapshot():
+    """Return a JSON-serializable copy of all metrics."""
+    with _lock:
+        timings = {}
+        for name, t in _timings.items():
+            timings[name] = dict(t, avg_ms=round(t["total_ms"] / t["count"], 2) if t["count"] else 0.0)
+        return {
+            "counters": dict(_counters),
+            "timings": timings,
+            "values": dict(_values),
+        }
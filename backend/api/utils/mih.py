@@ -0,0 +1,83 @@
+"""
+Multi-index hashing for Hamming-radius search over fixed-width hashes.
+
+Each hash is split into `chunks` substrings, each indexed in its own table.
+By the pigeonhole principle two hashes within distance r agree to within
+r // chunks bits on at least one substring, so a search only probes the
+buckets near each of the query's substrings and checks the full distance
+of what it finds there, instead of scanning every stored hash.
+"""
+from functools import lru_cache
+from itertools import combinations
+
+from .imagehash import hamming
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(width: int, radius: int):
+    """All `width`-bit masks with at most `radius` bits set."""
+    masks = []
+    for r in range(min(radius, width) + 1):
+        for bits in combinations(range(width), r):
+            mask = 0
+            for b in bits:
+                mask |= 1 << b
+            masks.append(mask)
+    return tuple(masks)
+
+
+class MultiIndexHash:
+    def __init__(self, bits: int = 64, chunks: int = 4):
+        if bits % chunks:
+            raise ValueError(f"{bits} bits do not split into {chunks} equal chunks")
+        self.bits = bits
+        self.chunks = chunks
+        self.width = bits // chunks
+        self._mask = (1 << self.width) - 1
+        self._tables = [{} for _ in range(chunks)]
+        self._hashes = {}
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _parts(self, h: int):
+        return [(h >> (i * self.width)) & self._mask for i in range(self.chunks)]
+
+    def add(self, key, h: int):
+        if key in self._hashes:
+            self.remove(key)
+        self._hashes[key] = h
+        for table, part in zip(self._tables, self._parts(h)):
+            table.setdefault(part, set()).add(key)
+
+    def remove(self, key):
+        h = self._hashes.pop(key, None)
+        if h is None:
+            return
+        for table, part in zip(self._tables, self._parts(h)):
+            bucket = table[part]
+            bucket.discard(key)
+            if not bucket:
+                del table[part]
+
+    def search(self, h: int, max_distance: int):
+        """Return [(distance, key)] within `max_distance`, closest first."""
+        masks = _flip_masks(self.width, max_distance // self.chunks)
+        candidates = set()
+        for table, part in zip(self._tables, self._parts(h)):
+            for mask in masks:
+                bucket = table.get(part ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+        found = []
+        for key in candidates:
+            d = hamming(h, self._hashes[key])
+            if d <= max_distance:
+                found.append((d, key))
+        found.sort(key=lambda x: x[0])
+        return found
+
+    def nearest(self, h: int, max_distance: int):
+        """Return (distance, key) of the closest hash within `max_distance`, or None."""
+        found = self.search(h, max_distance)
+        return found[0] if found else None
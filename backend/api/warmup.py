@@ -0,0 +1,126 @@
+"""
+Startup warm-up and import-time budget check.
+
+`warm_up()` is called from the API lifespan hook so the first real request
+does not pay for loading caches, the model or Tesseract's traineddata.
+Running this module checks that importing the API stays within budget:
+
+    python -m backend.api.warmup
+"""
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from .services import ocr_service, extract_service, ml_service, pdf_sandbox
+from .utils import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# Modules that must not be loaded just by importing the API
+HEAVY_MODULES = ("PIL", "pytesseract", "joblib", "sklearn", "PyPDF2", "pdf2image")
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def warm_up():
+    """Preload caches, verify Tesseract once and run a tiny OCR pass."""
+    timings = {}
+
+    start = time.perf_counter()
+    extract_service.get_mapping()
+    ml_service.load_ranges()
+    timings["caches_ms"] = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    model_loaded = ml_service.get_model() is not None
+    timings["model_ms"] = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    tesseract_ok = False
+    try:
+        tesseract_ok = ocr_service.check_tesseract_installed()
+        if tesseract_ok:
+            ocr_service.warm_up_tesseract()
+    except Exception as e:
+        logger.warning(f"Tesseract warm-up failed: {str(e)}")
+    timings["tesseract_ms"] = _elapsed_ms(start)
+
+    start = time.perf_counter()
+    try:
+        pdf_sandbox.warm_up()
+    except Exception as e:
+        logger.warning(f"PDF sandbox warm-up failed: {str(e)}")
+    timings["pdf_sandbox_ms"] = _elapsed_ms(start)
+
+    result = {
+        "tesseract_available": tesseract_ok,
+        "model_loaded": model_loaded,
+        "timings_ms": timings,
+    }
+    for name, ms in timings.items():
+        metrics.observe(f"warmup.{name[:-3]}", ms)
+    metrics.set_value("tesseract_available", tesseract_ok)
+    metrics.set_value("model_loaded", model_loaded)
+    logger.info(f"Warm-up complete: {result}")
+    return result
+
+
+def measure_import_time(module: str = "backend.api.main"):
+    """Import `module` in a fresh interpreter and report its cost and heavy imports."""
+    code = (
+        "import json, sys\n"
+        f"import {module}\n"
+        f"print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))"
+    )
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = _elapsed_ms(start)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    # -X importtime lines look like: "import time:  self | cumulative | name"
+    cumulative_ms = None
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative_ms = round(int(parts[1].strip()) / 1000, 2)
+
+    return {
+        "module": module,
+        "import_ms": cumulative_ms,
+        "process_ms": wall_ms,
+        "heavy_modules_loaded": json.loads(proc.stdout.strip().splitlines()[-1]),
+    }
+
+
+def check_import_budget(budget_ms: float = IMPORT_BUDGET_MS):
+    """Return (ok, report) for the API import against the configured budget."""
+    report = measure_import_time()
+    report["budget_ms"] = budget_ms
+    ok = (
+        report["import_ms"] is not None
+        and report["import_ms"] <= budget_ms
+        and not report["heavy_modules_loaded"]
+    )
+    return ok, report
+
+
+if __name__ == "__main__":
+    ok, report = check_import_budget()
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Blood Report Analyzer - Offline Batch Analyzer
+
+Runs the OCR -> extraction -> analysis pipeline over a directory or glob of
+reports in a process pool, without going through the HTTP API.
+
+    python -m backend.batch reports/ --output results.jsonl
+    python -m backend.batch "scans/2025-*/*.pdf" --output results.parquet --workers 8
+
+Files whose content hash is already in the output are skipped, so re-running
+a back-fill only processes new reports.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from .api.services import pipeline
+
+logger = logging.getLogger(__name__)
+
+REPORT_EXTENSIONS = (".png", ".jpg", ".jpeg", ".pdf")
+
+
+def find_reports(inputs):
+    """Expand directories (recursively) and glob patterns into report paths."""
+    paths = []
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            candidates = p.rglob("*")
+        elif p.is_file():
+            candidates = [p]
+        else:
+            candidates = (Path(m) for m in glob.glob(item, recursive=True))
+        paths.extend(c for c in candidates if c.is_file() and c.suffix.lower() in REPORT_EXTENSIONS)
+    return sorted(set(paths))
+
+
+class JsonlSink:
+    """Appends one JSON record per line; safe to interrupt and resume."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = None
+
+    def seen_hashes(self):
+        hashes = set()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # partially written last line
+                    if record.get("status") == "success":
+                        hashes.add(record.get("sha256"))
+        return hashes
+
+    def write(self, record: dict):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetSink:
+    """Collects records and rewrites the Parquet file (old rows + new) on close."""
+
+    def __init__(self, path):
+        import pandas as pd
+        self._pd = pd
+        self.path = Path(path)
+        self._existing = pd.read_parquet(self.path) if self.path.exists() else None
+        self._rows = []
+
+    def seen_hashes(self):
+        if self._existing is None or "sha256" not in self._existing:
+            return set()
+        ok = self._existing[self._existing["status"] == "success"]
+        return set(ok["sha256"])
+
+    def write(self, record: dict):
+        assessment = record.get("health_assessment", {})
+        self._rows.append({
+            "file": record["file"],
+            "sha256": record.get("sha256"),
+            "status": record["status"],
+            "elapsed_ms": record.get("elapsed_ms"),
+            "error": record.get("error"),
+            "overall_risk": assessment.get("risk_prediction", {}).get("overall_risk"),
+            "values": json.dumps(record.get("parameters", {}).get("extracted", {})),
+            "result": json.dumps(record, ensure_ascii=False),
+        })
+
+    def close(self):
+        if not self._rows:
+            return
+        df = self._pd.DataFrame(self._rows)
+        if self._existing is not None:
+            df = self._pd.concat([self._existing, df], ignore_index=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(self.path, index=False)
+        self._rows = []
+
+
+def open_sink(path):
+    if str(path).lower().endswith(".parquet"):
+        return ParquetSink(path)
+    return JsonlSink(path)
+
+
+def init_worker():
+    """Load caches, the model and Tesseract once per worker process."""
+    from .api.warmup import warm_up
+    logging.getLogger().setLevel(logging.WARNING)
+    warm_up()
+
+
+def process_file(path: str, sha256: str = None) -> dict:
+    """Analyze one report file; errors are returned as records, not raised."""
+    start = time.perf_counter()
+    # Known before reading, so unreadable files are still recorded with their hash
+    record = {"file": str(path), "sha256": sha256}
+    try:
+        content = Path(path).read_bytes()
+        record["sha256"] = sha256 or pipeline.content_hash(content)
+        result = pipeline.analyze_report(content, Path(path).name)
+        if result["extracted_text"].startswith("Error"):
+            result["status"] = "error"
+            result["error"] = result["extracted_text"]
+        record.update(result)
+    except Exception as e:
+        record.update({"status": "error", "error": str(e)})
+    record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return record
+
+
+def run_batch(inputs, output, workers=None, force=False, progress=True):
+    """Process all reports under `inputs` into `output`; returns a summary dict."""
+    sink = open_sink(output)
+    seen = set() if force else sink.seen_hashes()
+
+    todo = []
+    skipped = 0
+    total_bytes = 0
+    for path in find_reports(inputs):
+        content = path.read_bytes()
+        digest = pipeline.content_hash(content)
+        if digest in seen:
+            skipped += 1
+            continue
+        seen.add(digest)  # identical files in the same run are processed once
+        todo.append((str(path), digest))
+        total_bytes += len(content)
+
+    summary = {"queued": len(todo), "skipped": skipped, "succeeded": 0, "failed": 0}
+    if not todo:
+        sink.close()
+        return summary
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            futures = [pool.submit(process_file, path, digest) for path, digest in todo]
+            for done, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                sink.write(record)
+                summary["succeeded" if record["status"] == "success" else "failed"] += 1
+                if progress:
+                    elapsed = time.perf_counter() - start
+                    print(
+                        f"\r[{done}/{len(todo)}] {done / elapsed:.2f} files/s, "
+                        f"{summary['failed']} failed - {Path(record['file']).name[:40]:<40}",
+                        end="", file=sys.stderr, flush=True,
+                    )
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - start
+    if progress:
+        print(file=sys.stderr)
+    summary["elapsed_s"] = round(elapsed, 2)
+    summary["files_per_s"] = round(len(todo) / elapsed, 2)
+    summary["mb_per_s"] = round(total_bytes / 1e6 / elapsed, 2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze blood report files offline")
+    parser.add_argument("inputs", nargs="+", help="Directories, files or glob patterns")
+    parser.add_argument("-o", "--output", default="results.jsonl",
+                        help="Output file (.jsonl, or .parquet if pandas/pyarrow are installed)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-process files already present in the output")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Hide the progress line")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    summary = run_batch(args.inputs, args.output, args.workers, args.force, not args.quiet)
+    print(json.dumps(summary))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Blood Report Analyzer - OCR Profile Benchmark
+
+Runs every report of a labeled corpus through each OCR profile and reports
+latency and extraction accuracy per profile.
+
+    python -m backend.ocr_benchmark corpus/ --profiles default,lab,lab_fast
+
+A corpus is a directory of reports, each with a sidecar `<report>.json`
+holding the expected values, e.g. {"Hemoglobin": 13.2, "WBC": 7400}.
+A value counts as correct when it is within 1% of the expected one.
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+
+from .api.services import extract_service, ocr_profiles, ocr_service
+from .batch import find_reports
+
+logger = logging.getLogger(__name__)
+
+REL_TOLERANCE = 0.01
+
+
+def load_corpus(inputs):
+    """Return [(path, expected values)] for reports that have a sidecar label file."""
+    corpus = []
+    for path in find_reports(inputs):
+        label = path.with_name(path.name + ".json")
+        if not label.exists():
+            label = path.with_suffix(".json")
+        if not label.exists():
+            logger.warning(f"No labels for {path}, skipping")
+            continue
+        with open(label, encoding="utf-8") as f:
+            corpus.append((path, {k: float(v) for k, v in json.load(f).items()}))
+    return corpus
+
+
+def score_values(expected: dict, extracted: dict):
+    """Return (correct, expected count, spurious count) for one report."""
+    correct = sum(
+        1 for k, v in expected.items()
+        if k in extracted and abs(extracted[k] - v) <= abs(v) * REL_TOLERANCE
+    )
+    spurious = sum(1 for k in extracted if k not in expected)
+    return correct, len(expected), spurious
+
+
+def benchmark(corpus, ocr_kwargs: dict, repeat: int = 1) -> dict:
+    """
+    OCR the corpus with `ocr_kwargs` passed to image_to_text.
+
+    Returns:
+        Latency (ms) and accuracy summary
+    """
+    times = []
+    correct = total = spurious = 0
+    for path, expected in corpus:
+        content = path.read_bytes()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text = ocr_service.image_to_text(content, **ocr_kwargs)
+            times.append((time.perf_counter() - start) * 1000)
+        c, t, s = score_values(expected, extract_service.extract_key_values(text))
+        correct, total, spurious = correct + c, total + t, spurious + s
+    times.sort()
+    return {
+        "files": len(corpus),
+        "mean_ms": round(statistics.mean(times), 1) if times else None,
+        "p50_ms": round(times[len(times) // 2], 1) if times else None,
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 1) if times else None,
+        "accuracy": round(correct / total, 4) if total else None,
+        "spurious": spurious,
+    }
+
+
+def benchmark_profiles(corpus, profiles, repeat: int = 1) -> dict:
+    """Benchmark full-page OCR (templates, progressive and near-duplicate modes off) per profile."""
+    results = {}
+    for profile in profiles:
+        ocr_profiles.check_page_profile(profile)  # fail fast on typos and cell profiles
+        ocr_kwargs = {"profile": profile, "progressive": False, "templates": False, "dedup": False}
+        # One untimed pass so the first profile does not pay Tesseract's cold start
+        if corpus:
+            ocr_service.image_to_text(corpus[0][0].read_bytes(), **ocr_kwargs)
+        results[profile] = benchmark(corpus, ocr_kwargs, repeat)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare OCR profiles on a labeled report corpus")
+    parser.add_argument("inputs", nargs="+", help="Corpus directories, files or glob patterns")
+    parser.add_argument("-p", "--profiles", default=",".join(ocr_profiles.PAGE_PROFILES),
+                        help="Comma-separated profiles (default: all full-page profiles)")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="OCR passes per report")
+    parser.add_argument("--json", dest="json_out", default=None, help="Also write results as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    corpus = load_corpus(args.inputs)
+    if not corpus:
+        parser.error("no labeled reports found")
+    try:
+        results = benchmark_profiles(corpus, args.profiles.split(","), args.repeat)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"{'profile':<14}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'accuracy':>10}{'spurious':>10}")
+    for profile, r in results.items():
+        accuracy = f"{r['accuracy']:.1%}" if r["accuracy"] is not None else "-"
+        print(f"{profile:<14}{r['mean_ms']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{accuracy:>10}{r['spurious']:>10}")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
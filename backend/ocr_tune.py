@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Blood Report Analyzer - OCR Settings Tuner
+
+Sweeps the OCR speed/accuracy settings (image width, PDF DPI, page
+segmentation mode, scanned PDF page limit and preprocessing, see
+api/services/ocr_settings.py) over a labeled corpus in the format of
+ocr_benchmark.py, measuring extraction accuracy against mean latency per
+document:
+
+    python -m backend.ocr_tune corpus/ --max-width 800,1024,1400 --psm 4,6 \\
+        --preprocess none,autocontrast,grayscale+sharpen
+
+Every setting tried is printed with the Pareto frontier (no other setting
+is both faster and at least as accurate) marked. The chosen setting, the
+fastest one on the frontier within --accuracy-tolerance of the best
+accuracy, is written to OCR_SETTINGS_PATH (default data/ocr_settings.json),
+which the API loads at startup.
+
+DPI and page limits only matter for scanned PDFs and are not swept when the
+corpus has none.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .api.services import ocr_profiles, ocr_service, ocr_settings
+from .ocr_benchmark import benchmark, load_corpus
+
+logger = logging.getLogger(__name__)
+
+PDF_ONLY = ("pdf_dpi", "pdf_ocr_max_pages")
+
+
+def _ints(value: str):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _steps(value: str):
+    """Parse "none,autocontrast,grayscale+sharpen" into [[], ["autocontrast"], ["grayscale", "sharpen"]]."""
+    options = []
+    for option in value.split(","):
+        option = option.strip()
+        options.append([] if option in ("", "none") else option.split("+"))
+    return options
+
+
+def grid(space: dict):
+    """All combinations of the values in `space`, as settings dicts."""
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def pareto_frontier(results):
+    """Results no other result beats on both accuracy and mean latency, fastest first."""
+    frontier = []
+    best = -1.0
+    for r in sorted(results, key=lambda r: (r["mean_ms"], -r["accuracy"])):
+        if r["accuracy"] > best:
+            frontier.append(r)
+            best = r["accuracy"]
+    return frontier
+
+
+def choose(frontier, accuracy_tolerance: float = 0.0, max_latency_ms: float = None):
+    """Fastest frontier result within `accuracy_tolerance` of the best one under the latency cap, or None."""
+    if max_latency_ms is not None:
+        frontier = [r for r in frontier if r["mean_ms"] <= max_latency_ms]
+    if not frontier:
+        return None
+    best = max(r["accuracy"] for r in frontier)
+    return next(r for r in frontier if r["accuracy"] >= best - accuracy_tolerance)
+
+
+def sweep(corpus, candidates, profile: str = None, repeat: int = 1):
+    """Benchmark full-page OCR with each candidate setting; returns one result per candidate."""
+    # Near-duplicate reuse stays off: dedup returns the same full-page text as
+    # this path, and repeat passes over the corpus would all be reuse hits
+    base = {"profile": profile, "progressive": False, "templates": False, "dedup": False}
+    # One untimed pass so the first setting does not pay Tesseract's cold start
+    ocr_service.image_to_text(corpus[0][0].read_bytes(), **base)
+    results = []
+    for i, settings in enumerate(candidates, 1):
+        r = benchmark(corpus, {**base, "settings": settings}, repeat)
+        results.append({"settings": ocr_settings.validate(settings), **r})
+        logger.info(f"[{i}/{len(candidates)}] {settings}: {r['accuracy']} in {r['mean_ms']} ms")
+    return results
+
+
+def write_settings(path: Path, chosen: dict, tuning: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"settings": chosen["settings"], "tuning": tuning}, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _describe(settings: dict) -> str:
+    return (f"w={settings['max_width']} dpi={settings['pdf_dpi']} psm={settings['psm']} "
+            f"pages={settings['pdf_ocr_max_pages']} pre={'+'.join(settings['preprocess']) or 'none'}")
+
+
+def main(argv=None):
+    current = ocr_settings.SETTINGS
+    parser = argparse.ArgumentParser(description="Tune OCR speed/accuracy settings on a labeled report corpus")
+    parser.add_argument("inputs", nargs="+", help="Corpus directories, files or glob patterns")
+    parser.add_argument("--max-width", type=_ints, default=[800, 1024, 1400])
+    parser.add_argument("--dpi", type=_ints, default=[100, 150, 200])
+    parser.add_argument("--psm", type=_ints, default=[3, 4, 6])
+    parser.add_argument("--pdf-pages", type=_ints, default=[current["pdf_ocr_max_pages"]],
+                        help="Scanned PDF pages to OCR (default: the current limit)")
+    parser.add_argument("--preprocess", type=_steps, default=_steps("none,autocontrast,binarize"),
+                        help=f"Comma-separated options of +-joined steps from {', '.join(ocr_settings.PREPROCESS_STEPS)}")
+    parser.add_argument("-p", "--profile", default=None, help="OCR profile (default: OCR_PROFILE)")
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="OCR passes per report")
+    parser.add_argument("--max-settings", type=int, default=60,
+                        help="Sample this many settings when the grid is larger (the current one is always kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.01,
+                        help="Accuracy that may be given up for speed when choosing")
+    parser.add_argument("--max-latency-ms", type=float, default=None, help="Only choose settings at most this slow")
+    parser.add_argument("--out", type=Path, default=ocr_settings.SETTINGS_PATH)
+    parser.add_argument("--json", dest="json_out", default=None, help="Also write every result as JSON")
+    parser.add_argument("--dry-run", action="store_true", help="Report without writing the settings file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        ocr_profiles.check_page_profile(args.profile)
+    except ValueError as e:
+        parser.error(str(e))
+    corpus = load_corpus(args.inputs)
+    if not corpus:
+        parser.error("no labeled reports found")
+
+    space = {
+        "max_width": args.max_width,
+        "pdf_dpi": args.dpi,
+        "psm": args.psm,
+        "pdf_ocr_max_pages": args.pdf_pages,
+        "preprocess": args.preprocess,
+    }
+    if not any(path.read_bytes()[:4] == b"%PDF" for path, _ in corpus):
+        for key in PDF_ONLY:
+            space[key] = [current[key]]
+    candidates = grid(space)
+    try:
+        for settings in candidates:
+            ocr_settings.validate(settings)
+    except ValueError as e:
+        parser.error(str(e))
+    if len(candidates) > args.max_settings:
+        logger.info(f"Sampling {args.max_settings} of {len(candidates)} settings")
+        others = [c for c in candidates if c != current]
+        candidates = [dict(current)] + random.Random(args.seed).sample(others, args.max_settings - 1)
+    elif current not in candidates:
+        candidates.append(dict(current))
+
+    results = sweep(corpus, candidates, args.profile, args.repeat)
+    results = [r for r in results if r["accuracy"] is not None]
+    frontier = pareto_frontier(results)
+    chosen = choose(frontier, args.accuracy_tolerance, args.max_latency_ms)
+    baseline = next((r for r in results if r["settings"] == current), None)
+
+    print(f"{'settings':<52}{'mean ms':>10}{'p95 ms':>10}{'accuracy':>10}")
+    for r in sorted(results, key=lambda r: r["mean_ms"]):
+        mark = "*" if r is chosen else ("+" if r in frontier else " ")
+        print(f"{mark} {_describe(r['settings']):<50}{r['mean_ms']:>10}{r['p95_ms']:>10}{r['accuracy']:>10.1%}")
+    print("+ Pareto frontier, * chosen, current settings:", _describe(current))
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "frontier": frontier, "chosen": chosen}, f, indent=2)
+    if chosen is None:
+        print(f"no setting fits the {args.max_latency_ms} ms latency cap", file=sys.stderr)
+        return 1
+    if baseline is not None:
+        print(f"chosen: {chosen['accuracy']:.1%} in {chosen['mean_ms']} ms "
+              f"(current: {baseline['accuracy']:.1%} in {baseline['mean_ms']} ms)")
+
+    if not args.dry_run:
+        tuning = {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "files": len(corpus),
+            "profile": args.profile or ocr_profiles.DEFAULT_PROFILE,
+            "accuracy": chosen["accuracy"],
+            "mean_ms": chosen["mean_ms"],
+            "p95_ms": chosen["p95_ms"],
+            "accuracy_tolerance": args.accuracy_tolerance,
+            "max_latency_ms": args.max_latency_ms,
+            "frontier": [{k: r[k] for k in ("settings", "accuracy", "mean_ms", "p95_ms")} for r in frontier],
+        }
+        write_settings(args.out, chosen, tuning)
+        print(f"wrote {args.out}; restart the API to use it")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Blood Report Analyzer - OCR Worker Node
+
+Serves Tesseract over HTTP for the API's remote OCR tier
+(backend/api/services/remote_ocr.py):
+
+    GET  /health                    {"status", "in_flight", "capacity"}
+    POST /ocr?kind=text|tsv&profile=NAME[&psm=N]  (or &config=...)  body: PNG
+         -> {"output": "..."}; 503 when at capacity, 504 past X-Request-Timeout
+            (or OCR_WORKER_TIMEOUT without one), queued or running
+
+Run several local workers on consecutive ports and point the API at them:
+
+    python -m backend.ocr_worker --port 9001 --count 3
+    OCR_WORKER_URLS=http://127.0.0.1:9001,http://127.0.0.1:9002,http://127.0.0.1:9003
+"""
+import argparse
+import io
+import logging
+import math
+import multiprocessing
+import os
+import re
+import shlex
+import signal
+import sys
+import threading
+from collections import OrderedDict
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+from .api.services import ocr_profiles, ocr_scheduler, ocr_service
+from .api.services.deadline import Deadline, OCRCancelled
+
+logger = logging.getLogger(__name__)
+
+# Concurrent Tesseract runs, and jobs accepted (running + queued) before answering 503.
+# Queued jobs wait in the OCR scheduler, so they start in fair order by class and flow
+CAPACITY = int(os.getenv("OCR_WORKER_CAPACITY", str(ocr_scheduler.OCR_SCHEDULER_SLOTS)))
+MAX_IN_FLIGHT = int(os.getenv("OCR_WORKER_MAX_IN_FLIGHT", str(CAPACITY * 2)))
+# Seconds a job may wait and run when the caller sends no X-Request-Timeout
+TIMEOUT = float(os.getenv("OCR_WORKER_TIMEOUT", "110"))
+# API requests whose flow (X-OCR-Flow) is remembered between their jobs
+FLOW_CACHE_SIZE = 4096
+
+# Raw configs may only set the engine, page segmentation and the -c variables
+# the profiles use (ocr_profiles.profile_config), never files or other variables
+CONFIG_VARIABLES = ("tessedit_char_whitelist", "load_system_dawg", "load_freq_dawg")
+CONFIG_VALUE_RE = re.compile(r"^[A-Za-z0-9_.,]*$")
+
+app = FastAPI(title="Blood Report Analyzer OCR Worker")
+
+_lock = threading.Lock()
+_in_flight = 0
+_flows = OrderedDict()
+
+ocr_scheduler.scheduler.slots = CAPACITY
+
+
+def _flow(flow_id: str):
+    """The scheduler flow all jobs of one API request are charged to."""
+    with _lock:
+        flow = _flows.pop(flow_id, None) or ocr_scheduler.Flow()
+        _flows[flow_id] = flow
+        while len(_flows) > FLOW_CACHE_SIZE:
+            _flows.popitem(last=False)
+        return flow
+
+
+def check_config(config: str):
+    """
+    Raises:
+        ValueError: `config` is not made of --oem N, --psm N and -c NAME=VALUE
+            pairs with NAME in CONFIG_VARIABLES
+    """
+    tokens = shlex.split(config)
+    if len(tokens) % 2:
+        raise ValueError(f"Config not allowed: {config}")
+    for flag, value in zip(tokens[::2], tokens[1::2]):
+        if flag in ("--oem", "--psm") and value.isdigit():
+            continue
+        name, eq, setting = value.partition("=")
+        if flag == "-c" and eq and name in CONFIG_VARIABLES and CONFIG_VALUE_RE.match(setting):
+            continue
+        raise ValueError(f"Config not allowed: {config}")
+
+
+def resolve_config(profile: str = None, config: str = None, psm: int = None) -> str:
+    if profile:
+        return ocr_profiles.profile_config(profile, psm)
+    if config:
+        check_config(config)
+        return config
+    return ocr_service.TESSERACT_CONFIG
+
+
+def _ocr(png: bytes, kind: str, config: str, deadline: Deadline) -> str:
+    from PIL import Image
+    img = Image.open(io.BytesIO(png))
+    return _run(img, kind, config, deadline)
+
+
+def _run(img, kind: str, config: str, deadline: Deadline) -> str:
+    deadline.check()
+    if kind == "tsv":
+        return ocr_service.run_tesseract_tsv_local(img, config, deadline)
+    return ocr_service.run_tesseract_local(img, config, deadline)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "in_flight": _in_flight, "capacity": CAPACITY}
+
+
+@app.post("/ocr")
+async def ocr(request: Request, kind: str = "text", profile: str = None, config: str = None,
+              psm: int = None):
+    global _in_flight
+    if kind not in ("text", "tsv"):
+        raise HTTPException(status_code=400, detail="kind must be text or tsv")
+    try:
+        config = resolve_config(profile, config, psm)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        timeout = float(request.headers.get("X-Request-Timeout", TIMEOUT))
+    except ValueError:
+        timeout = TIMEOUT
+    # Bounds the wait for a scheduler slot as well as the Tesseract run
+    if not (math.isfinite(timeout) and timeout > 0):
+        timeout = TIMEOUT
+    timeout = min(timeout, TIMEOUT)
+    # Scheduling class of the calling request; unknown classes get the worker's default
+    priority = request.headers.get("X-OCR-Priority") or None
+    deadline = Deadline(timeout, priority)
+    flow_id = request.headers.get("X-OCR-Flow")
+    if flow_id:
+        deadline.flow = _flow(flow_id)
+
+    with _lock:
+        if _in_flight >= MAX_IN_FLIGHT:
+            raise HTTPException(status_code=503, detail="Worker at capacity", headers={"Retry-After": "1"})
+        _in_flight += 1
+    try:
+        png = await request.body()
+        output = await run_in_threadpool(_ocr, png, kind, config, deadline)
+        return {"output": output}
+    except OCRCancelled:
+        raise HTTPException(status_code=504, detail="OCR deadline exceeded")
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    finally:
+        with _lock:
+            _in_flight -= 1
+
+
+def serve(host: str, port: int):
+    import uvicorn
+    from .api.warmup import warm_up
+    logging.basicConfig(level=logging.INFO)
+    warm_up()
+    uvicorn.run(app, host=host, port=port, log_level="warning")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run OCR worker node(s)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001, help="First port")
+    parser.add_argument("--count", type=int, default=1, help="Worker processes on consecutive ports")
+    args = parser.parse_args(argv)
+
+    if args.count == 1:
+        serve(args.host, args.port)
+        return 0
+    procs = [
+        multiprocessing.Process(target=serve, args=(args.host, args.port + i), daemon=False)
+        for i in range(args.count)
+    ]
+    for p in procs:
+        p.start()
+    print(",".join(f"http://{args.host}:{args.port + i}" for i in range(args.count)), flush=True)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
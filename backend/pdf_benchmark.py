@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Blood Report Analyzer - PDF Text Backend Benchmark
+
+Times every installed PDF text backend on a corpus of text PDFs and checks
+that each one reads the same parameters as the PyPDF2 reference.
+
+    python -m backend.pdf_benchmark reports/ --save
+
+With --save, the fastest backend whose output is equivalent on every file
+is written to data/pdf_backend.json, which PDF_TEXT_BACKEND=auto (the
+default) picks up on the next start.
+"""
+import argparse
+import difflib
+import json
+import logging
+import re
+import sys
+import time
+from pathlib import Path
+
+from .api.services import extract_service, pdf_text
+from .api.services.ocr_service import PDF_TEXT_MAX_PAGES
+from .batch import find_reports
+
+logger = logging.getLogger(__name__)
+
+REFERENCE = "pypdf2"
+# Backends lay text out differently; words in order must still largely agree
+MIN_TEXT_SIMILARITY = 0.9
+
+
+def _words(text: str):
+    return re.findall(r"\S+", text or "")
+
+
+def equivalent(reference: str, text: str):
+    """
+    Compare two extractions of the same PDF.
+
+    Returns:
+        (same parameters and values, word-sequence similarity 0..1)
+    """
+    same_values = (extract_service.extract_key_values(reference or "")
+                   == extract_service.extract_key_values(text or ""))
+    similarity = difflib.SequenceMatcher(None, _words(reference), _words(text), autojunk=False).ratio()
+    return same_values, round(similarity, 4)
+
+
+def benchmark(paths, backends, repeat: int = 3, max_pages: int = PDF_TEXT_MAX_PAGES):
+    """Best-of-`repeat` time per backend and its equivalence to the reference."""
+    reference = {p: pdf_text.extract_text(p.read_bytes(), max_pages, pdf_text.BACKENDS[REFERENCE])
+                 for p in paths} if REFERENCE in backends else {}
+    results = {}
+    for name in backends:
+        backend = pdf_text.BACKENDS[name]
+        total_ms = 0.0
+        mismatches = []
+        min_similarity = 1.0
+        for path in paths:
+            data = path.read_bytes()
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                text = pdf_text.extract_text(data, max_pages, backend)
+                best = min(best, (time.perf_counter() - start) * 1000)
+            total_ms += best
+            if path in reference:
+                same_values, similarity = equivalent(reference[path], text)
+                min_similarity = min(min_similarity, similarity)
+                if not same_values or similarity < MIN_TEXT_SIMILARITY:
+                    mismatches.append(path.name)
+        results[name] = {
+            "total_ms": round(total_ms, 1),
+            "mean_ms": round(total_ms / len(paths), 1),
+            "min_similarity": min_similarity if reference else None,
+            "mismatches": mismatches,
+            "equivalent": not mismatches,
+        }
+    return results
+
+
+def pick_fastest(results):
+    ok = [(r["total_ms"], name) for name, r in results.items() if r["equivalent"]]
+    return min(ok)[1] if ok else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PDF text-layer backends")
+    parser.add_argument("inputs", nargs="+", help="Directories, PDF files or glob patterns")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Runs per file (best is kept)")
+    parser.add_argument("--save", action="store_true",
+                        help=f"Write the fastest equivalent backend to {pdf_text.BACKEND_CHOICE_PATH}")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    paths = [p for p in find_reports(args.inputs) if p.suffix.lower() == ".pdf"]
+    if not paths:
+        parser.error("no PDF files found")
+    backends = pdf_text.available_backends()
+    if REFERENCE not in backends:
+        print(f"warning: {REFERENCE} not installed, text equivalence is not checked", file=sys.stderr)
+
+    results = benchmark(paths, backends, args.repeat)
+    print(f"{'backend':<12}{'total ms':>10}{'mean ms':>10}{'similarity':>12}  equivalent")
+    for name, r in results.items():
+        similarity = f"{r['min_similarity']:.3f}" if r["min_similarity"] is not None else "-"
+        print(f"{name:<12}{r['total_ms']:>10}{r['mean_ms']:>10}{similarity:>12}  "
+              f"{'yes' if r['equivalent'] else 'no: ' + ', '.join(r['mismatches'][:5])}")
+
+    fastest = pick_fastest(results)
+    print(f"fastest equivalent backend: {fastest or 'none'}")
+    if args.save and fastest:
+        path = Path(pdf_text.BACKEND_CHOICE_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"backend": fastest, "results": results}, f, indent=2)
+        print(f"saved to {path}")
+    return 0 if fastest else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
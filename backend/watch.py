@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Blood Report Analyzer - Watch-Folder Ingestion
+
+Watches one or more directories for new reports (e.g. a scanner's drop
+folder) and runs them through the OCR -> extraction -> analysis pipeline
+with bounded parallelism.
+
+    python -m backend.watch /mnt/scans --output data/ingest.jsonl
+
+Files are only picked up once their size and mtime have been stable for
+`--settle` seconds, so partially written scans are not read. Progress is
+checkpointed after every file in an append-only log, so a restart resumes
+without reprocessing. If a worker process dies (killed, out of memory), the
+pool is restarted and the reports it had in flight are retried.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from .api.services import pipeline
+from .batch import REPORT_EXTENSIONS, init_worker, open_sink, process_file
+
+logger = logging.getLogger(__name__)
+
+# A report in flight this many times when a worker died is recorded as an error
+MAX_POOL_CRASHES = 2
+
+
+class Checkpoint:
+    """
+    Processed files (by path, size, mtime) and content hashes, persisted as an
+    append-only log of one JSON entry per processed file.
+
+    The log is replayed on start (later entries win, a torn last line is
+    ignored) and compacted then if superseded entries dominate it.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = {}
+        self.hashes = set()
+        self._file = None
+        lines = 0
+        torn = False
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        torn = True  # partially written last line
+                        continue
+                    lines += 1
+                    self._apply(entry)
+        # Rewritten before appending, so new entries never follow a torn line
+        if torn or lines > 2 * len(self.files) + 100:
+            self.compact()
+
+    def _apply(self, entry: dict):
+        self.files[entry["path"]] = {k: entry[k] for k in ("size", "mtime", "sha256", "status")}
+        if entry["status"] == "success":
+            self.hashes.add(entry["sha256"])
+
+    def is_done(self, path: Path, stat) -> bool:
+        entry = self.files.get(str(path))
+        return entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+    def mark(self, path: Path, stat, sha256: str, status: str):
+        """Record a processed file and append it to the log."""
+        entry = {"path": str(path), "size": stat.st_size, "mtime": stat.st_mtime,
+                 "sha256": sha256, "status": status}
+        self._apply(entry)
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def compact(self):
+        """Rewrite the log with one entry per file."""
+        self.close()
+        # Write-then-rename so a crash never leaves a truncated checkpoint
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for path, entry in self.files.items():
+                f.write(json.dumps({"path": path, **entry}) + "\n")
+        os.replace(tmp, self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def init_watch_worker():
+    # Ctrl+C goes to the whole process group; let the parent drain workers instead
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker()
+
+
+class FolderWatcher:
+    """Polls directories and feeds settled, unseen reports to a process pool."""
+
+    def __init__(self, dirs, sink, checkpoint, workers=2, settle=5.0, interval=2.0):
+        self.dirs = [Path(d) for d in dirs]
+        self.sink = sink
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.settle = settle
+        self.interval = interval
+        self._pending = {}   # path -> (size, mtime, first time seen with that size/mtime)
+        self._running = {}   # future -> (path, stat, sha256)
+        self._retry = []     # (path, stat, sha256) in flight when a worker died
+        self._crashes = {}   # path -> times it was in flight when a worker died
+        self._broken = False
+        self._stopping = False
+        self.processed = 0
+
+    def stop(self, *_):
+        logger.info("Stopping after in-flight reports finish")
+        self._stopping = True
+
+    def scan(self):
+        """Return report paths that are new or changed and have stopped growing."""
+        now = time.monotonic()
+        in_flight = {str(p) for p, _, _ in self._running.values()}
+        ready = []
+        present = set()
+        for d in self.dirs:
+            for path in d.rglob("*"):
+                if path.suffix.lower() not in REPORT_EXTENSIONS or str(path) in in_flight:
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue  # removed while scanning
+                if self.checkpoint.is_done(path, stat):
+                    continue
+                present.add(path)
+                key = (stat.st_size, stat.st_mtime)
+                seen = self._pending.get(path)
+                if seen is None or seen[:2] != key:
+                    self._pending[path] = (*key, now)
+                elif now - seen[2] >= self.settle and stat.st_size > 0:
+                    ready.append((path, stat))
+        for path in set(self._pending) - present:
+            del self._pending[path]
+        return ready
+
+    def _submit(self, pool, path: Path, stat):
+        self._pending.pop(path, None)
+        digest = pipeline.content_hash(path.read_bytes())
+        if any(digest == d for _, _, d in self._running.values()):
+            return  # same content in flight; picked up again (and skipped) on a later scan
+        if digest in self.checkpoint.hashes:
+            logger.info(f"Skipping {path.name}: already processed (same content)")
+            self.checkpoint.mark(path, stat, digest, "success")
+            return
+        future = pool.submit(process_file, str(path), digest)
+        self._running[future] = (path, stat, digest)
+
+    def _collect(self, done):
+        for future in done:
+            path, stat, digest = self._running.pop(future)
+            try:
+                record = future.result()
+            except BrokenProcessPool:
+                # Every report in flight fails when one worker dies; retry them in a new pool
+                self._broken = True
+                self._crashes[path] = self._crashes.get(path, 0) + 1
+                if self._crashes[path] < MAX_POOL_CRASHES:
+                    self._retry.append((path, stat, digest))
+                    continue
+                record = {"file": str(path), "sha256": digest, "status": "error",
+                          "error": "worker process died"}
+            except Exception as e:
+                # Worker crashed; record the failure so the file is not retried until it changes
+                record = {"file": str(path), "sha256": digest, "status": "error", "error": str(e)}
+            self._crashes.pop(path, None)
+            # The JSONL sink flushes every record, so the checkpoint never runs ahead of the output
+            self.sink.write(record)
+            self.checkpoint.mark(path, stat, digest, record["status"])
+            self.processed += 1
+            logger.info(f"{record['status']}: {path.name} ({record.get('elapsed_ms', '?')} ms)")
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_watch_worker)
+
+    def _restart(self, pool):
+        """Replace a broken pool and resubmit the reports that were in flight in it."""
+        # A broken pool fails all of its futures at once
+        self._collect(wait(list(self._running)).done)
+        pool.shutdown(wait=False)
+        retry, self._retry = self._retry, []
+        self._broken = False
+        logger.warning(f"A worker process died; restarting the pool and retrying {len(retry)} report(s)")
+        pool = self._new_pool()
+        for path, stat, digest in retry:
+            self._running[pool.submit(process_file, str(path), digest)] = (path, stat, digest)
+        return pool
+
+    def run(self):
+        max_in_flight = self.workers * 2
+        pool = self._new_pool()
+        try:
+            while not self._stopping or self._running:
+                if not self._stopping and len(self._running) < max_in_flight:
+                    for path, stat in self.scan():
+                        if len(self._running) >= max_in_flight:
+                            break
+                        try:
+                            self._submit(pool, path, stat)
+                        except OSError as e:
+                            logger.warning(f"Could not read {path}: {str(e)}")
+                        except BrokenProcessPool:
+                            # Picked up again by a later scan
+                            self._broken = True
+                            break
+                if self._running:
+                    done, _ = wait(list(self._running), timeout=self.interval, return_when=FIRST_COMPLETED)
+                    self._collect(done)
+                elif not self._broken:
+                    time.sleep(self.interval)
+                if self._broken:
+                    pool = self._restart(pool)
+        finally:
+            pool.shutdown()
+        self.sink.close()
+        self.checkpoint.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch directories and analyze new blood reports")
+    parser.add_argument("dirs", nargs="+", help="Directories to watch (recursively)")
+    parser.add_argument("-o", "--output", default="data/ingest.jsonl",
+                        help="Output JSONL file (Parquet is only written on exit, so batch.py only)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument("-w", "--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Worker processes (default: half the CPUs)")
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="Seconds a file must stay unchanged before it is read")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between directory scans")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    for d in args.dirs:
+        if not Path(d).is_dir():
+            parser.error(f"not a directory: {d}")
+    if str(args.output).lower().endswith(".parquet"):
+        parser.error("watch only writes JSONL output; use batch.py for Parquet")
+
+    checkpoint = Checkpoint(args.checkpoint or f"{args.output}.checkpoint.json")
+    watcher = FolderWatcher(args.dirs, open_sink(args.output), checkpoint,
+                            args.workers, args.settle, args.interval)
+    signal.signal(signal.SIGINT, watcher.stop)
+    signal.signal(signal.SIGTERM, watcher.stop)
+    logger.info(f"Watching {', '.join(args.dirs)} with {args.workers} worker(s)")
+    watcher.run()
+    logger.info(f"Stopped, {watcher.processed} report(s) processed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Backend access for the Streamlit frontend.
+
+Streamlit re-runs the whole script on every widget interaction, so the HTTP
+session (and its connection pool) is cached as a resource and the health
+check is cached for a few seconds instead of being re-sent on every rerun.
+Analysis results are kept in a size-bounded LRU (an OrderedDict held with
+st.cache_resource, shared across sessions) keyed by file hash; st.cache_data
+would pickle the report on every read.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HEALTH_TTL_SECONDS = int(os.getenv("HEALTH_TTL_SECONDS", "15"))
+POOL_SIZE = int(os.getenv("API_POOL_SIZE", "20"))
+REPORT_CACHE_SIZE = 128
+
+
+def get_api_url():
+    try:
+        return st.secrets.get("api_url", "http://127.0.0.1:8000")
+    except Exception:
+        return os.getenv("API_URL", "http://127.0.0.1:8000")
+
+
+API_URL = get_api_url()
+
+
+class BackendError(Exception):
+    """Non-200 answer from the backend."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One pooled keep-alive session shared by all users of this Streamlit server."""
+    # Retry connection errors and the "busy" answers admission control gives
+    # before any OCR runs (429/503, waiting out their Retry-After), so retrying
+    # uploads is safe. A 502/504 may come after the OCR ran and is not retried.
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=(429, 503),
+        allowed_methods=frozenset({"GET", "POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=HEALTH_TTL_SECONDS, show_spinner=False)
+def check_health() -> str:
+    """Return "ok", "error" or "unreachable", cached for HEALTH_TTL_SECONDS."""
+    try:
+        response = get_session().get(f"{API_URL}/", timeout=5)
+        return "ok" if response.status_code == 200 else "error"
+    except requests.exceptions.RequestException:
+        return "unreachable"
+
+
+def analyze(values: dict, timeout: int = 30) -> requests.Response:
+    return get_session().post(f"{API_URL}/analyze", json=values, timeout=timeout)
+
+
+@st.cache_resource
+def _report_cache() -> dict:
+    """Full-analysis results shared across sessions, keyed by file hash."""
+    return {"lock": threading.Lock(), "reports": OrderedDict()}
+
+
+def cached_report(file_hash: str):
+    """Return a previously fetched analysis for this file, if any."""
+    cache = _report_cache()
+    with cache["lock"]:
+        report = cache["reports"].get(file_hash)
+        if report is not None:
+            cache["reports"].move_to_end(file_hash)
+        return report
+
+
+def _remember(file_hash: str, report: dict):
+    cache = _report_cache()
+    with cache["lock"]:
+        cache["reports"][file_hash] = report
+        cache["reports"].move_to_end(file_hash)
+        while len(cache["reports"]) > REPORT_CACHE_SIZE:
+            cache["reports"].popitem(last=False)
+
+
+def stream_full_analysis(file_hash: str, file_name: str, mime_type: str, data: bytes, timeout: int = 120):
+    """
+    Yield (event, data) pairs from /full-analysis/stream as the backend progresses.
+
+    The last event is `result` (also cached per file hash) or `error`. A cached
+    report is yielded straight away as `result` without contacting the backend.
+    """
+    report = cached_report(file_hash)
+    if report is not None:
+        yield "result", report
+        return
+    files = {"file": (file_name, data, mime_type)}
+    with get_session().post(f"{API_URL}/full-analysis/stream", files=files,
+                            timeout=timeout, stream=True) as response:
+        if response.status_code != 200:
+            raise BackendError(response.status_code, response.text)
+        event, lines = "message", []
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                lines.append(line[5:].strip())
+            elif not line and lines:
+                payload = json.loads("\n".join(lines))
+                if event == "result":
+                    _remember(file_hash, payload)
+                yield event, payload
+                event, lines = "message", []
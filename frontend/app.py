@@ -5,11 +5,14 @@ import pandas as pd
 from PIL import Image
 import io
 import time
+import hashlib
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+import api_client
+
 # Page configuration
 st.set_page_config(
     page_title="Blood Report Analyzer - Advanced",
@@ -111,10 +114,7 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # API Configuration
-try:
-    API_URL = st.secrets.get("api_url", "http://127.0.0.1:8000")
-except:
-    API_URL = "http://127.0.0.1:8000"
+API_URL = api_client.API_URL
 
 # Initialize session state
 if 'analysis_results' not in st.session_state:
@@ -123,16 +123,43 @@ if 'uploaded_file' not in st.session_state:
     st.session_state.uploaded_file = None
 if 'extracted_text' not in st.session_state:
     st.session_state.extracted_text = ""
+if 'reports' not in st.session_state:
+    st.session_state.reports = {}           # file hash -> /full-analysis response
+if 'analysis_by_hash' not in st.session_state:
+    st.session_state.analysis_by_hash = {}  # file hash -> displayed analysis
+if 'file_hashes' not in st.session_state:
+    st.session_state.file_hashes = {}       # uploader file id -> file hash
+
+# Helper functions
+def get_file_hash(uploaded_file, data: bytes) -> str:
+    """SHA-256 of the upload, computed once per uploaded file."""
+    file_id = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+    if file_id not in st.session_state.file_hashes:
+        st.session_state.file_hashes[file_id] = hashlib.sha256(data).hexdigest()
+    return st.session_state.file_hashes[file_id]
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def make_thumbnail(file_hash: str, _data: bytes, max_size: int = 1200):
+    """Decode and shrink an uploaded image once per file hash (None for PDFs)."""
+    try:
+        img = Image.open(io.BytesIO(_data))
+        img.draft("RGB", (max_size, max_size))  # lets JPEG decode at reduced scale
+        img.thumbnail((max_size, max_size))
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, format="PNG")
+        return buf.getvalue()
+    except Exception:
+        return None
 
-# Helper function
-def extract_text_from_session():
-    """Extract parameter values from session state"""
-    params = {}
-    for key in st.session_state:
-        if key.startswith("param_"):
-            param_name = key.replace("param_", "")
-            params[param_name] = st.session_state[key]
-    return params
+def to_analysis_results(report: dict) -> dict:
+    """Map a /full-analysis response onto the /analyze shape used by the result tabs."""
+    assessment = report.get("health_assessment", {})
+    return {
+        "status": report.get("status"),
+        "comparison": report.get("parameters", {}).get("comparison", {}),
+        "prediction": assessment.get("risk_prediction", {}),
+        "diseases": assessment.get("disease_predictions", {})
+    }
 
 # Title
 col1, col2, col3 = st.columns([1, 2, 1])
@@ -164,23 +191,22 @@ with st.sidebar:
     st.markdown("### ℹ️ How to Use")
     st.markdown("""
     1. **Upload**: Select your blood report image or PDF
-    2. **Review**: Check the extracted text
-    3. **Edit** (Optional): Correct any OCR errors
-    4. **Analyze**: Generate comprehensive analysis
+    2. **Analyze**: Extract and analyze the report in one step
+    3. **Review**: Check the extracted text
+    4. **Edit** (Optional): Correct any OCR errors and re-analyze
     5. **Review Results**: Check parameters, risks, and recommendations
     """)
     
     st.markdown("---")
     st.markdown("### 🔧 System Status")
     
-    # Check backend connection
-    try:
-        response = requests.get(f"{API_URL}/", timeout=5)
-        if response.status_code == 200:
-            st.success("✅ Backend: Connected")
-        else:
-            st.error("❌ Backend: Error")
-    except:
+    # Check backend connection (cached for a few seconds across reruns)
+    backend_status = api_client.check_health()
+    if backend_status == "ok":
+        st.success("✅ Backend: Connected")
+    elif backend_status == "error":
+        st.error("❌ Backend: Error")
+    else:
         st.error("❌ Backend: Not Reachable")
     
     st.markdown("---")
@@ -199,7 +225,8 @@ with st.sidebar:
 # Main content
 if uploaded_file is not None:
     st.session_state.uploaded_file = uploaded_file
-    bytes_data = uploaded_file.read()
+    # getvalue() returns the buffered upload without re-reading the stream
+    bytes_data = uploaded_file.getvalue()
     
     # File validation
     if len(bytes_data) == 0:
@@ -207,102 +234,127 @@ if uploaded_file is not None:
     elif len(bytes_data) > 50 * 1024 * 1024:
         st.error("❌ Error: File size exceeds 50MB limit")
     else:
-        # Step 1: Display file preview
+        file_hash = get_file_hash(uploaded_file, bytes_data)
+        
+        # Step 1: Display file preview (thumbnail is decoded once per file)
         st.markdown("### 📋 Report Preview")
         col1, col2 = st.columns([2, 1])
         
         with col1:
-            try:
-                img = Image.open(io.BytesIO(bytes_data))
-                st.image(img, use_column_width=True, caption="Uploaded Report Image")
-            except Exception as e:
+            thumbnail = make_thumbnail(file_hash, bytes_data)
+            if thumbnail is not None:
+                st.image(thumbnail, use_column_width=True, caption="Uploaded Report Image")
+            else:
                 st.info(f"ℹ️ Image preview not available (PDF detected or unsupported format)")
         
-        # Step 2: Process the file
-        if st.button("📤 Extract Text from Report", use_container_width=True, key="extract_btn"):
-            with st.spinner("🔄 Extracting text using OCR..."):
+        # Step 2: Extract and analyze in one request; results are kept per file hash
+        report = st.session_state.reports.get(file_hash) or api_client.cached_report(file_hash)
+        if report is not None and file_hash not in st.session_state.reports:
+            st.session_state.reports[file_hash] = report
+            st.session_state.analysis_by_hash[file_hash] = to_analysis_results(report)
+        if report is None and st.button("🔍 Extract & Analyze Report", use_container_width=True, key="analyze_btn"):
+            # Progress is streamed from the backend so partial results show up per page
+            with st.status("🔄 Extracting text and analyzing blood parameters...", expanded=True) as status:
                 try:
-                    files = {"file": (uploaded_file.name, bytes_data, uploaded_file.type)}
-                    response = requests.post(
-                        f"{API_URL}/upload-report",
-                        files=files,
+                    partial_placeholder = st.empty()
+                    for event, data in api_client.stream_full_analysis(
+                        file_hash,
+                        uploaded_file.name,
+                        uploaded_file.type,
+                        bytes_data,
                         timeout=120
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        st.session_state.extracted_text = data.get("text", "")
-                        
-                        st.success(f"✅ Extraction Complete! {data.get('parameters_extracted', 0)} parameters found.")
-                        
-                        # Show extracted text
-                        with st.expander("📝 View Extracted Text (Raw OCR Output)", expanded=False):
-                            st.text_area(
-                                "Extracted text from report:",
-                                st.session_state.extracted_text,
-                                height=200,
-                                disabled=True
+                    ):
+                        if event == "pdf_text":
+                            status.write("📄 Text layer found in PDF" if data.get("found") else "📄 No text layer, running OCR on pages")
+                        elif event == "image_decoded":
+                            status.write(f"🖼️ Image decoded ({data.get('width')}×{data.get('height')})")
+                        elif event == "page_rasterized":
+                            status.write(f"🖼️ Page {data.get('page')}/{data.get('pages')} rasterized")
+                        elif event == "page_ocr":
+                            status.write(f"🔤 Page {data.get('page')}/{data.get('pages')} OCR complete")
+                        elif event == "strip_ocr":
+                            status.write(f"🔤 Strip {data.get('strip')}/{data.get('strips')} OCR complete")
+                        elif event == "template":
+                            status.write(f"🧩 Page {data.get('page')} matched lab template {data.get('template')}")
+                        elif event == "rescan":
+                            status.write(f"🔍 Page {data.get('page')}: re-scanned {', '.join(data.get('targets', []))} at high resolution")
+                        elif event == "partial_values" and data.get("values"):
+                            partial_placeholder.dataframe(
+                                pd.DataFrame(list(data["values"].items()), columns=["Parameter", "Value"]),
+                                hide_index=True
                             )
-                        
-                        # Show initial parameters
-                        extracted_params = data.get("values", {})
-                        if extracted_params:
-                            st.markdown("### ✏️ Extracted Blood Parameters")
-                            st.markdown("Review and edit parameters below if needed:")
-                            
-                            col1, col2, col3 = st.columns(3)
-                            cols = [col1, col2, col3]
-                            
-                            # Store edited values in session state
-                            for i, (param, value) in enumerate(extracted_params.items()):
-                                with cols[i % 3]:
-                                    st.session_state[f"param_{param}"] = st.number_input(
-                                        param,
-                                        value=float(value),
-                                        step=0.1,
-                                        format="%.2f",
-                                        key=f"input_{param}"
-                                    )
-                    else:
-                        st.error(f"❌ Backend error: {response.status_code} - {response.text}")
+                        elif event == "error":
+                            raise api_client.BackendError(data.get("status_code", 500), data.get("detail", ""))
+                        elif event == "result":
+                            report = data
+                    
+                    if report is None:
+                        raise api_client.BackendError(502, "Stream ended without a result")
+                    st.session_state.reports[file_hash] = report
+                    st.session_state.analysis_by_hash[file_hash] = to_analysis_results(report)
+                    extracted = report.get("parameters", {}).get("extracted", {})
+                    status.update(label=f"✅ Analysis Complete! {len(extracted)} parameters found.", state="complete", expanded=False)
                 
+                except api_client.BackendError as e:
+                    st.error(f"❌ Backend error: {e.status_code} - {e.detail}")
+                    status.update(label="❌ Analysis failed", state="error")
                 except requests.exceptions.Timeout:
                     st.error("❌ Request timeout. The file may be too large. Please try a smaller file.")
+                    status.update(label="❌ Analysis failed", state="error")
                 except requests.exceptions.ConnectionError:
-                    st.error("❌ Cannot connect to backend. Make sure the API is running on http://127.0.0.1:8000")
+                    st.error(f"❌ Cannot connect to backend. Make sure the API is running on {API_URL}")
+                    status.update(label="❌ Analysis failed", state="error")
                 except Exception as e:
                     st.error(f"❌ Error: {str(e)}")
+                    status.update(label="❌ Analysis failed", state="error")
         
-        # Step 3: Analyze
-        if st.session_state.extracted_text and st.button("🔍 Analyze Report", use_container_width=True, key="analyze_btn"):
-            with st.spinner("🔄 Analyzing blood parameters and predicting diseases..."):
-                try:
-                    # Prepare payload with edited values
-                    payload = {}
-                    extracted_params = extract_text_from_session()
-                    
-                    # Use edited values if available, otherwise use extracted
-                    if extracted_params:
-                        for param in extracted_params.keys():
-                            payload[param] = st.session_state.get(f"param_{param}", extracted_params[param])
-                    
-                    if not payload:
-                        st.warning("⚠️ No parameters found to analyze. Please extract text first.")
-                    else:
-                        response = requests.post(
-                            f"{API_URL}/analyze",
-                            json=payload,
-                            timeout=30
+        if report is not None:
+            st.session_state.extracted_text = report.get("extracted_text", "")
+            
+            # Show extracted text
+            with st.expander("📝 View Extracted Text (Raw OCR Output)", expanded=False):
+                st.text_area(
+                    "Extracted text from report:",
+                    st.session_state.extracted_text,
+                    height=200,
+                    disabled=True
+                )
+            
+            # Step 3: Review and edit parameters; re-analysis only sends values, never the file
+            extracted_params = report.get("parameters", {}).get("extracted", {})
+            if extracted_params:
+                st.markdown("### ✏️ Extracted Blood Parameters")
+                st.markdown("Review and edit parameters below if needed:")
+                
+                col1, col2, col3 = st.columns(3)
+                cols = [col1, col2, col3]
+                
+                edited_params = {}
+                for i, (param, value) in enumerate(extracted_params.items()):
+                    with cols[i % 3]:
+                        edited_params[param] = st.number_input(
+                            param,
+                            value=float(value),
+                            step=0.1,
+                            format="%.2f",
+                            key=f"input_{file_hash[:16]}_{param}"
                         )
-                        
-                        if response.status_code == 200:
-                            st.session_state.analysis_results = response.json()
-                            st.success("✅ Analysis Complete!")
-                        else:
-                            st.error(f"❌ Analysis error: {response.status_code}")
                 
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
+                if st.button("🔁 Re-analyze with Edited Values", use_container_width=True, key="reanalyze_btn"):
+                    with st.spinner("🔄 Analyzing blood parameters and predicting diseases..."):
+                        try:
+                            response = api_client.analyze(edited_params, timeout=30)
+                            
+                            if response.status_code == 200:
+                                st.session_state.analysis_by_hash[file_hash] = response.json()
+                                st.success("✅ Analysis Complete!")
+                            else:
+                                st.error(f"❌ Analysis error: {response.status_code}")
+                        
+                        except Exception as e:
+                            st.error(f"❌ Error: {str(e)}")
+        
+        st.session_state.analysis_results = st.session_state.analysis_by_hash.get(file_hash)
 
 # Display results
 if st.session_state.analysis_results:
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Blood Report Analyzer - Risk Model Compiler
+
+Flattens a trained risk model into plain NumPy arrays that
+ml_service.CompiledModel evaluates without sklearn or joblib:
+
+- decision trees, random forests and extra trees: every tree's nodes
+  concatenated into feature/threshold/left/right/value arrays plus one
+  root index per tree
+- multiclass logistic regression, optionally behind a StandardScaler:
+  mean, scale, coef and intercept
+
+The compiled outputs are checked against sklearn on synthetic panels and
+must match bit for bit, or nothing is written:
+
+    python -m ml_model.compile_model
+
+train_model.py runs this on export; the command above compiles an existing
+predict_model.pkl and records the result in its manifest.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from backend.api.services import ml_service
+
+from . import synthetic_data
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+VERIFY_SAMPLES = 5000
+
+
+def _compile_trees(estimators, classes):
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset = 0
+    depth = 0
+    for est in estimators:
+        tree = est.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        own = np.arange(offset, offset + n)
+        roots.append(offset)
+        # Leaves loop back to themselves and test feature 0, which is harmless
+        feature.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        threshold.append(tree.threshold.astype(np.float64))
+        left.append(np.where(is_leaf, own, tree.children_left + offset).astype(np.int32))
+        right.append(np.where(is_leaf, own, tree.children_right + offset).astype(np.int32))
+        v = tree.value[:, 0, :len(classes)].astype(np.float64)
+        sums = v.sum(axis=1)
+        if sums.max() > 1 + 1e-9:
+            # Older sklearn stores class counts and normalizes in predict_proba
+            sums[sums == 0.0] = 1.0
+            v = v / sums[:, None]
+        value.append(v)
+        depth = max(depth, tree.max_depth)
+        offset += n
+    arrays = {
+        "feature": np.concatenate(feature), "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left), "right": np.concatenate(right),
+        "value": np.concatenate(value), "roots": np.array(roots, dtype=np.int32),
+    }
+    return {"kind": "trees", "depth": int(depth)}, arrays
+
+
+def _compile_linear(model, scaler=None):
+    arrays = {"coef": np.asarray(model.coef_, dtype=np.float64),
+              "intercept": np.asarray(model.intercept_, dtype=np.float64)}
+    if scaler is not None:
+        if scaler.with_mean:
+            arrays["mean"] = np.asarray(scaler.mean_, dtype=np.float64)
+        if scaler.with_std:
+            arrays["scale"] = np.asarray(scaler.scale_, dtype=np.float64)
+    return {"kind": "linear"}, arrays
+
+
+def compile_model(model):
+    """
+    Returns:
+        (meta, arrays) for ml_service.CompiledModel
+
+    Raises:
+        ValueError: the model type is not supported
+    """
+    from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.tree import DecisionTreeClassifier
+
+    final, scaler = model, None
+    if isinstance(model, Pipeline):
+        steps = [step for _, step in model.steps]
+        if len(steps) == 2 and isinstance(steps[0], StandardScaler):
+            scaler, final = steps
+        elif len(steps) == 1:
+            final = steps[0]
+        else:
+            raise ValueError(f"Cannot compile pipeline {[type(s).__name__ for s in steps]}")
+    classes = [str(c) for c in final.classes_]
+    if isinstance(final, DecisionTreeClassifier) and scaler is None:
+        meta, arrays = _compile_trees([final], classes)
+    elif isinstance(final, (RandomForestClassifier, ExtraTreesClassifier)) and scaler is None:
+        meta, arrays = _compile_trees(final.estimators_, classes)
+    elif isinstance(final, LogisticRegression) and len(classes) > 2:
+        # (binary models would need scipy's expit to match sklearn exactly)
+        meta, arrays = _compile_linear(final, scaler)
+    else:
+        raise ValueError(f"Cannot compile {type(final).__name__}")
+    meta.update({"format_version": FORMAT_VERSION, "classes": classes,
+                 "features": list(ml_service.FEATURES), "arrays": sorted(arrays)})
+    return meta, arrays
+
+
+def verify(model, compiled, X):
+    """
+    Raise ValueError unless the compiled model's predictions and probabilities
+    equal sklearn's exactly, row by row and in one batch.
+    """
+    batch_ok = (np.array_equal(model.predict(X), compiled.predict(X))
+                and np.array_equal(model.predict_proba(X), compiled.predict_proba(X)))
+    rows = X[:200]
+    row_ok = all(
+        np.array_equal(model.predict(row), compiled.predict(row))
+        and np.array_equal(model.predict_proba(row), compiled.predict_proba(row))
+        for row in (rows[i:i + 1] for i in range(len(rows)))
+    )
+    if not (batch_ok and row_ok):
+        diff = np.abs(model.predict_proba(X) - compiled.predict_proba(X)).max()
+        raise ValueError(f"Compiled model does not match sklearn (max probability difference {diff:g})")
+
+
+def write_compiled(model, out_dir: Path, X_verify=None) -> dict:
+    """
+    Compile `model` next to its pickle in `out_dir` and verify it.
+
+    Returns:
+        the manifest's "compiled" entry
+    """
+    meta, arrays = compile_model(model)
+    path = out_dir / ml_service.COMPILED_PATH.name
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, array in arrays.items():
+        # Keep each array's memory order: BLAS rounds differently for C and Fortran layouts
+        np.save(tmp / f"{name}.npy", array)
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    if X_verify is None:
+        X_verify, _ = synthetic_data.generate(VERIFY_SAMPLES, seed=1)
+    try:
+        verify(model, ml_service.read_compiled(tmp, mmap=False), X_verify)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+    size_kb = sum(f.stat().st_size for f in path.iterdir()) / 1024
+    return {"dir": path.name, "kind": meta["kind"], "sha256": ml_service.compiled_digest(path),
+            "verified_rows": len(X_verify), "size_kb": round(size_kb, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the risk model to NumPy arrays")
+    parser.add_argument("--model", type=Path, default=ml_service.MODEL_PATH,
+                        help="Pickled model; its manifest is updated if present")
+    parser.add_argument("--verify-samples", type=int, default=VERIFY_SAMPLES)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    import joblib
+    model_bytes = args.model.read_bytes()
+    manifest_path = args.model.with_suffix(".json")
+    manifest = None
+    if manifest_path.exists():
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        ml_service.verify_manifest(manifest, model_bytes)
+    model = joblib.load(args.model)
+
+    X_verify, _ = synthetic_data.generate(args.verify_samples, seed=1)
+    try:
+        compiled = write_compiled(model, args.model.parent, X_verify)
+    except ValueError as e:
+        print(f"error: {str(e)}", file=sys.stderr)
+        return 1
+    print(f"compiled {compiled['kind']} model to {args.model.parent / compiled['dir']} "
+          f"({compiled['size_kb']} KB, matches sklearn on {compiled['verified_rows']} rows)")
+    if manifest is not None:
+        manifest["compiled"] = compiled
+        tmp = manifest_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, manifest_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Labeled synthetic blood panels for training the risk model.
+
+Each parameter is drawn inside its normal range (normal_ranges.json) most of
+the time and below or above it otherwise, so every DISEASE_RULES threshold is
+crossed often. A panel is labeled with the disease the rules score highest,
+or "Normal" when none reaches the rules' 30% confidence cut-off.
+"""
+import numpy as np
+
+from backend.api.services import ml_service
+from backend.api.services.disease_service import predict_diseases
+
+FEATURES = ml_service.FEATURES
+NORMAL_LABEL = ml_service.NORMAL_LABEL
+
+# How far outside the normal range abnormal values go, as multiples of its bounds
+LOW_FACTOR = 0.4
+HIGH_FACTOR = {"WBC": 3.0, "Platelets": 2.0, "Creatinine": 5.0, "SGPT": 6.0, "SGOT": 6.0, "Bilirubin": 8.0}
+DEFAULT_HIGH_FACTOR = 1.5
+
+P_LOW = 0.2
+P_HIGH = 0.2
+
+
+def _bounds(ranges: dict, feature: str, sex: str):
+    r = ranges[feature]
+    return r.get("any") or r[sex]
+
+
+def sample_panel(rng, ranges: dict):
+    """One random panel as {feature: value}."""
+    sex = "male" if rng.random() < 0.5 else "female"
+    panel = {}
+    for feature in FEATURES:
+        low, high = _bounds(ranges, feature, sex)
+        u = rng.random()
+        if u < P_LOW:
+            value = rng.uniform(low * LOW_FACTOR, low)
+        elif u < P_LOW + P_HIGH:
+            value = rng.uniform(high, high * HIGH_FACTOR.get(feature, DEFAULT_HIGH_FACTOR))
+        else:
+            value = rng.uniform(low, high)
+        panel[feature] = round(value, 2)
+    return panel
+
+
+def label_panel(panel: dict) -> str:
+    """Highest-confidence rule-based diagnosis, ties going to the first rule."""
+    # Already sorted by confidence; the sort is stable, so ties keep rule order
+    diseases = predict_diseases(panel)["possible_diseases"]
+    return next(iter(diseases), NORMAL_LABEL)
+
+
+def generate(n: int, seed: int = 0):
+    """
+    Returns:
+        (X, y): float array of shape (n, len(FEATURES)) and a list of n labels
+    """
+    ranges = ml_service.load_ranges()
+    if ranges is None:
+        raise FileNotFoundError(f"Normal ranges not found at {ml_service.RANGES_PATH}")
+    rng = np.random.default_rng(seed)
+    X = np.empty((n, len(FEATURES)))
+    y = []
+    for i in range(n):
+        panel = sample_panel(rng, ranges)
+        X[i] = [panel[f] for f in FEATURES]
+        y.append(label_panel(panel))
+    return X, y
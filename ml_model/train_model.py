@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Blood Report Analyzer - Risk Model Training
+
+Trains candidate classifiers on synthetic panels (see synthetic_data.py),
+benchmarks each one's holdout accuracy, single-row and batch inference
+latency and serialized size, and exports the most accurate model whose
+single-row p95 latency fits the budget (measured on the compiled form
+ml_service runs, see compile_model.py, when the model can be compiled):
+
+    python -m ml_model.train_model --samples 20000 --latency-budget-ms 2
+
+The model is written to backend/api/services/predict_model.pkl with a
+predict_model.json manifest (feature order, classes, SHA-256, sklearn
+version, benchmark results) that ml_service checks before loading it.
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from backend.api.services import ml_service
+
+from . import compile_model, synthetic_data
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUDGET_MS = float(os.getenv("ML_LATENCY_BUDGET_MS", "2"))
+SINGLE_ROW_RUNS = 200
+BATCH_ROWS = 1000
+MANIFEST_VERSION = 1
+
+
+def candidates(seed: int = 0):
+    """Candidate models by name; all are trees, tree ensembles or linear."""
+    from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.tree import DecisionTreeClassifier
+    return {
+        "logistic_regression": make_pipeline(StandardScaler(), LogisticRegression(max_iter=2000)),
+        "decision_tree": DecisionTreeClassifier(max_depth=10, random_state=seed),
+        "random_forest_small": RandomForestClassifier(n_estimators=20, max_depth=10, random_state=seed),
+        "random_forest": RandomForestClassifier(n_estimators=100, random_state=seed),
+        "extra_trees": ExtraTreesClassifier(n_estimators=100, max_depth=16, random_state=seed),
+    }
+
+
+def serialize(model) -> bytes:
+    import joblib
+    buf = io.BytesIO()
+    joblib.dump(model, buf)
+    return buf.getvalue()
+
+
+def _percentile_ms(samples, q):
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def _single_row_times(model, row):
+    times = []
+    for _ in range(SINGLE_ROW_RUNS):
+        start = time.perf_counter()
+        model.predict(row)
+        model.predict_proba(row)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def benchmark_model(model, X_test, y_test):
+    """
+    Accuracy, per-request latency (predict + predict_proba on one row, as
+    ml_service does), batch throughput and size; plus the compiled model's
+    single-row latency when it can be compiled.
+    """
+    from sklearn.metrics import accuracy_score, f1_score
+    predicted = model.predict(X_test)
+    row = X_test[:1].tolist()
+    single = _single_row_times(model, row)
+    batch = X_test[:BATCH_ROWS]
+    start = time.perf_counter()
+    model.predict_proba(batch)
+    batch_s = time.perf_counter() - start
+    try:
+        compiled = ml_service.CompiledModel(*compile_model.compile_model(model))
+        compiled_times = _single_row_times(compiled, row)
+        compiled_p50_ms = _percentile_ms(compiled_times, 50)
+        compiled_p95_ms = _percentile_ms(compiled_times, 95)
+    except ValueError:
+        compiled_p50_ms = compiled_p95_ms = None
+    return {
+        "accuracy": round(float(accuracy_score(y_test, predicted)), 4),
+        "f1_macro": round(float(f1_score(y_test, predicted, average="macro")), 4),
+        "single_p50_ms": _percentile_ms(single, 50),
+        "single_p95_ms": _percentile_ms(single, 95),
+        "batch_us_per_row": round(batch_s / len(batch) * 1e6, 2),
+        "size_kb": round(len(serialize(model)) / 1024, 1),
+        "compiled_p50_ms": compiled_p50_ms,
+        "compiled_p95_ms": compiled_p95_ms,
+    }
+
+
+def serving_p95_ms(result) -> float:
+    """Single-row p95 of what ml_service will run: the compiled model if there is one."""
+    if result.get("compiled_p95_ms") is not None:
+        return result["compiled_p95_ms"]
+    return result["single_p95_ms"]
+
+
+def select(results, latency_budget_ms: float, max_size_kb: float = None):
+    """Name of the most accurate model within budget (faster wins ties), or None."""
+    ok = [
+        (-r["accuracy"], serving_p95_ms(r), name) for name, r in results.items()
+        if serving_p95_ms(r) <= latency_budget_ms and (max_size_kb is None or r["size_kb"] <= max_size_kb)
+    ]
+    return min(ok)[2] if ok else None
+
+
+def export(model, name: str, results, out_dir: Path, training: dict, X_verify=None):
+    """Write the model, its compiled form and the manifest; returns the manifest."""
+    import sklearn
+    out_dir.mkdir(parents=True, exist_ok=True)
+    data = serialize(model)
+    model_path = out_dir / ml_service.MODEL_PATH.name
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "model": name,
+        "file": model_path.name,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "features": list(synthetic_data.FEATURES),
+        "classes": [str(c) for c in model.classes_],
+        "sklearn_version": sklearn.__version__,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "training": training,
+        "benchmark": results,
+    }
+    # Model first: a manifest never points at a file that is not there yet
+    tmp = model_path.with_suffix(".pkl.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, model_path)
+    try:
+        manifest["compiled"] = compile_model.write_compiled(model, out_dir, X_verify)
+    except ValueError as e:
+        logger.warning(f"Model not compiled, ml_service will use the pickle: {str(e)}")
+    manifest_path = out_dir / ml_service.MANIFEST_PATH.name
+    tmp = manifest_path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and export the blood report risk model")
+    parser.add_argument("--samples", type=int, default=20000, help="Synthetic panels to generate")
+    parser.add_argument("--test-size", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-budget-ms", type=float, default=LATENCY_BUDGET_MS,
+                        help="Max single-row p95 latency of the exported model as served")
+    parser.add_argument("--max-size-kb", type=float, default=None)
+    parser.add_argument("--models", nargs="+", help="Only train these candidates")
+    parser.add_argument("--out-dir", type=Path, default=ml_service.MODEL_PATH.parent)
+    parser.add_argument("--dry-run", action="store_true", help="Benchmark without exporting")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from sklearn.model_selection import train_test_split
+
+    models = candidates(args.seed)
+    if args.models:
+        unknown = set(args.models) - set(models)
+        if unknown:
+            parser.error(f"unknown models: {', '.join(sorted(unknown))}; choose from {', '.join(models)}")
+        models = {name: models[name] for name in args.models}
+
+    X, y = synthetic_data.generate(args.samples, args.seed)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=args.test_size, random_state=args.seed, stratify=y
+    )
+    labels, counts = np.unique(y, return_counts=True)
+    logger.info(f"Generated {len(y)} panels: {dict(zip(labels.tolist(), counts.tolist()))}")
+
+    results = {}
+    fitted = {}
+    for name, model in models.items():
+        start = time.perf_counter()
+        model.fit(X_train, y_train)
+        train_s = round(time.perf_counter() - start, 2)
+        fitted[name] = model
+        results[name] = {**benchmark_model(model, X_test, y_test), "train_s": train_s}
+
+    print(f"{'model':<22}{'accuracy':>9}{'f1':>8}{'p50 ms':>9}{'p95 ms':>9}{'batch us':>10}{'size KB':>10}"
+          f"{'compiled p50':>14}")
+    for name, r in results.items():
+        compiled = r["compiled_p50_ms"] if r["compiled_p50_ms"] is not None else "-"
+        print(f"{name:<22}{r['accuracy']:>9}{r['f1_macro']:>8}{r['single_p50_ms']:>9}"
+              f"{r['single_p95_ms']:>9}{r['batch_us_per_row']:>10}{r['size_kb']:>10}{compiled:>14}")
+
+    best = select(results, args.latency_budget_ms, args.max_size_kb)
+    if best is None:
+        print(f"no model fits the {args.latency_budget_ms} ms latency budget", file=sys.stderr)
+        return 1
+    print(f"selected: {best}")
+    if not args.dry_run:
+        training = {"samples": args.samples, "test_size": args.test_size, "seed": args.seed,
+                    "latency_budget_ms": args.latency_budget_ms}
+        export(fitted[best], best, results, args.out_dir, training, X_test)
+        print(f"exported to {args.out_dir / ml_service.MODEL_PATH.name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
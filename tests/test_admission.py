@@ -0,0 +1,25 @@
+from starlette.requests import Request
+
+from backend.api import admission
+from backend.api.admission import AdmissionController, TokenBucket, get_client_id
+
+
+def request_from(host, client_header=None):
+    headers = [] if client_header is None else [(b"x-client-id", client_header.encode())]
+    return Request({"type": "http", "headers": headers, "client": (host, 5000)})
+
+
+def test_client_header_only_trusted_from_proxies(monkeypatch):
+    monkeypatch.setattr(admission, "TRUSTED_PROXIES", {"10.0.0.1"})
+    assert get_client_id(request_from("203.0.113.9", "spoofed")) == "203.0.113.9"
+    assert get_client_id(request_from("10.0.0.1", "alice")) == "alice"
+    assert get_client_id(request_from("10.0.0.1")) == "10.0.0.1"
+
+
+def test_zero_rate_does_not_divide_by_zero():
+    bucket = TokenBucket(0, 1)
+    assert bucket.take() == 0
+    assert bucket.take() > 0
+    controller = AdmissionController(10, 10, 0, 1, 10, 10)
+    for _ in range(5):
+        controller.acquire("client")
@@ -0,0 +1,17 @@
+import pandas as pd
+
+from backend import batch
+
+
+def test_unreadable_file_is_recorded_with_its_hash(tmp_path):
+    record = batch.process_file(str(tmp_path / "gone.pdf"), "abc123")
+    assert record["status"] == "error"
+    assert record["sha256"] == "abc123"
+
+
+def test_parquet_sink_writes_records_without_a_hash(tmp_path):
+    sink = batch.ParquetSink(tmp_path / "out.parquet")
+    sink.write({"file": "a.pdf", "status": "error", "error": "unreadable"})
+    sink.close()
+    df = pd.read_parquet(tmp_path / "out.parquet")
+    assert df["file"].tolist() == ["a.pdf"]
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from backend.api.services import bulk_service, disease_service
+
+ROWS = [
+    {"Hemoglobin": 9.0, "WBC": 13000, "Platelets": 120000, "Creatinine": 1.6,
+     "SGPT": 70, "SGOT": 60, "Bilirubin": 1.5},
+    {"Hemoglobin": 14.0, "WBC": 7000, "Platelets": 250000, "Creatinine": 0.9,
+     "SGPT": 25, "SGOT": 25, "Bilirubin": 0.6},
+    {"Hemoglobin": 11.0, "WBC": 3000, "Platelets": 90000, "Creatinine": 2.5,
+     "SGPT": 120, "SGOT": 30, "Bilirubin": 3.0},
+]
+
+
+def test_batch_diseases_match_per_row_service():
+    batch = bulk_service.predict_diseases(pd.DataFrame(ROWS))
+    for row, (_, out) in zip(ROWS, batch.iterrows()):
+        diseases = disease_service.predict_diseases(row)["possible_diseases"]
+        assert out["possible_diseases"].split(";") == (list(diseases) or [""])
+        if diseases:
+            top, info = next(iter(diseases.items()))
+            assert out["top_disease"] == top
+            assert out["top_confidence"] == info["confidence"]
+            assert out["top_risk_level"] == info["risk_level"]
+        else:
+            assert out["top_risk_level"] == ""
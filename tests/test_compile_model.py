@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from backend.api.services import ml_service
+from ml_model import compile_model, synthetic_data, train_model
+
+MODELS = ["decision_tree", "random_forest_small", "logistic_regression"]
+
+
+@pytest.fixture(scope="module")
+def data():
+    X, y = synthetic_data.generate(3000, seed=0)
+    X_test, _ = synthetic_data.generate(1000, seed=2)
+    return X, y, X_test
+
+
+@pytest.mark.parametrize("name", MODELS)
+def test_compiled_model_matches_sklearn_exactly(name, data, tmp_path):
+    X, y, X_test = data
+    model = train_model.candidates(seed=0)[name].fit(X, y)
+    entry = compile_model.write_compiled(model, tmp_path, X_test)
+    compiled = ml_service.read_compiled(tmp_path / entry["dir"], mmap=False)
+
+    assert np.array_equal(compiled.predict(X_test), model.predict(X_test))
+    assert np.array_equal(compiled.predict_proba(X_test), model.predict_proba(X_test))
+    for i in range(50):
+        row = X_test[i:i + 1]
+        assert np.array_equal(compiled.predict(row), model.predict(row))
+        assert np.array_equal(compiled.predict_proba(row), model.predict_proba(row))
+
+
+def test_unsupported_model_is_refused():
+    from sklearn.naive_bayes import GaussianNB
+    X, y = synthetic_data.generate(200, seed=0)
+    with pytest.raises(ValueError):
+        compile_model.compile_model(GaussianNB().fit(X, y))
@@ -0,0 +1,104 @@
+import asyncio
+import gc
+import io
+import threading
+
+import httpx
+from PIL import Image
+
+from backend.api import main
+from backend.api.services import ocr_service
+from backend.api.services.deadline import OCRCancelled
+
+
+def png_bytes():
+    buf = io.BytesIO()
+    Image.new("RGB", (200, 100), "white").save(buf, "PNG")
+    return buf.getvalue()
+
+
+def upload_scope(path, started, headers=None):
+    """ASGI scope and receive for a report upload whose client leaves once `started` is set."""
+    upload = httpx.Request("POST", f"http://test{path}",
+                           files={"file": ("report.png", png_bytes(), "image/png")}, headers=headers)
+    body = upload.read()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "server": ("test", 80), "client": ("127.0.0.1", 5000),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in upload.headers.items()],
+    }
+    sent_body = False
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client goes away once OCR is running
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        return {"type": "http.disconnect"}
+
+    return scope, receive
+
+
+def test_client_disconnect_cancels_ocr(monkeypatch):
+    started = threading.Event()
+    cancelled = []
+
+    def slow_ocr(content, deadline, *args, **kwargs):
+        started.set()
+        while True:
+            try:
+                deadline.check()
+            except OCRCancelled as e:
+                cancelled.append(e.reason)
+                raise
+            threading.Event().wait(0.05)
+
+    monkeypatch.setattr(ocr_service, "image_to_text", slow_ocr)
+    monkeypatch.setattr(main, "DISCONNECT_POLL_SECONDS", 0.05)
+    scope, receive = upload_scope("/upload-report", started, {"X-Request-Timeout": "10"})
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asyncio.wait_for(main.app(scope, receive, send), timeout=5))
+    assert cancelled == ["client_disconnected"]
+    assert messages[0]["status"] == 499
+
+
+def test_closed_stream_retrieves_cancelled_ocr(monkeypatch):
+    started = threading.Event()
+    finished = threading.Event()
+
+    def slow_ocr(content, deadline, *args, **kwargs):
+        started.set()
+        try:
+            while True:
+                deadline.check()
+                threading.Event().wait(0.02)
+        finally:
+            finished.set()
+
+    monkeypatch.setattr(ocr_service, "image_to_text", slow_ocr)
+    monkeypatch.setattr(main, "HISTORY_ENABLED", False)
+    scope, receive = upload_scope("/full-analysis/stream", started)
+    unretrieved = []
+
+    async def send(message):
+        pass
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: unretrieved.append(context["message"]))
+        await asyncio.wait_for(main.app(scope, receive, send), timeout=5)
+        await loop.run_in_executor(None, finished.wait, 5)
+        await asyncio.sleep(0.1)
+        gc.collect()
+
+    asyncio.run(run())
+    assert finished.is_set()
+    assert not any("never retrieved" in m for m in unretrieved)
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+from PyPDF2 import PdfReader
+
+from backend.api.services.extract_service import extract_key_values
+
+SAMPLE_REPORTS = Path(__file__).resolve().parents[1] / "utils" / "sample_reports"
+
+
+def test_sample_report_keeps_exact_matches():
+    reader = PdfReader(str(SAMPLE_REPORTS / "OCR_Friendly_Blood_Report.pdf"))
+    text = "\n".join(page.extract_text() or "" for page in reader.pages)
+    data = extract_key_values(text)
+    assert data["WBC"] == 6.8
+    assert data["Hemoglobin"] == 14.2
+    assert data["Platelets"] == 245
+
+
+def test_other_test_label_is_not_a_fuzzy_match():
+    assert "WBC" not in extract_key_values("RBC Count: 4.7")
+    assert extract_key_values("RBC Count: 4.7\nWBC Count: 6.8") == {"WBC": 6.8}
+    assert extract_key_values("WBC Count: 6.8\nRBC Count: 4.7") == {"WBC": 6.8}
+
+
+def test_fuzzy_match_does_not_overwrite_exact_match():
+    assert extract_key_values("Hemoglobin 14.2\nHemog1obin 9.1") == {"Hemoglobin": 14.2}
+    assert extract_key_values("Hemog1obin 12.5") == {"Hemoglobin": 12.5}
@@ -0,0 +1,68 @@
+import pytest
+
+from backend.api.services import history_service, ocr_service
+
+
+def result(hemoglobin):
+    return {"file_name": "report.pdf", "parameters": {"extracted": {"Hemoglobin": hemoglobin}, "comparison": {}}}
+
+
+def test_pages_through_reports_sharing_a_date(tmp_path):
+    db = tmp_path / "history.db"
+    for i in range(5):
+        history_service.save_report(result(12 + i), f"hash{i}", "p1", "2024-01-01", db_path=db)
+    seen = []
+    page = history_service.get_history("p1", 2, db_path=db)
+    while page:
+        seen += [r["id"] for r in page]
+        last = page[-1]
+        page = history_service.get_history("p1", 2, last["report_date"], last["id"], db_path=db)
+    assert len(seen) == len(set(seen)) == 5
+
+
+def test_cache_hit_links_report_to_patient(tmp_path):
+    db = tmp_path / "history.db"
+    history_service.save_report(result(13.5), "hash", db_path=db)
+    assert history_service.get_history("p1", db_path=db) == []
+    report_id = history_service.link_report("hash", "p1", "2024-02-03", db_path=db)
+    [row] = history_service.get_history("p1", db_path=db)
+    assert row["id"] == report_id and row["report_date"] == "2024-02-03"
+    [point] = history_service.get_trend("p1", "Hemoglobin", db_path=db)
+    assert point["value"] == 13.5 and point["report_date"] == "2024-02-03"
+    assert history_service.link_report("hash", "p2", db_path=db) is None
+
+
+def test_report_date_must_be_iso():
+    history_service.check_report_date(None)
+    history_service.check_report_date("2024-02-03")
+    with pytest.raises(ValueError):
+        history_service.check_report_date("03/02/2024")
+
+
+def test_result_is_only_reused_under_its_ocr_key(tmp_path):
+    db = tmp_path / "history.db"
+    report_id = history_service.save_report(result(12.0), "hash", "p1", "2024-01-01", "fast", db_path=db)
+    assert history_service.get_by_hash("hash", "fast", db_path=db) is not None
+    assert history_service.get_by_hash("hash", "accurate", db_path=db) is None
+    assert history_service.save_report(result(12.5), "hash", "p2", None, "accurate", db_path=db) == report_id
+    stored = history_service.get_by_hash("hash", "accurate", db_path=db)
+    assert stored["parameters"]["extracted"]["Hemoglobin"] == 12.5
+    [point] = history_service.get_trend("p1", "Hemoglobin", db_path=db)
+    assert point["value"] == 12.5 and point["report_date"] == "2024-01-01"
+
+
+def test_only_clean_ocr_output_is_stored():
+    assert ocr_service.is_clean("--- Page 1 ---\nHemoglobin 13.5")
+    assert not ocr_service.is_clean("Error: Tesseract is not installed or not in PATH.")
+    assert not ocr_service.is_clean("No text detected in image")
+    assert not ocr_service.is_clean("--- Page 1 ---\nHb 13\n\n--- Page 2 (Error) ---\nFailed to process page: x")
+
+
+def test_stored_reports_need_admin_token(monkeypatch):
+    from fastapi.testclient import TestClient
+    from backend.api import main
+    client = TestClient(main.app)
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    for path in ("/reports/abc", "/history/p1", "/history/p1/trend/Hemoglobin"):
+        assert client.get(path).status_code == 403
+        assert client.get(path, headers={"Authorization": "Bearer wrong"}).status_code == 403
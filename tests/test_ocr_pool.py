@@ -0,0 +1,35 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from backend.api.services import ocr_pool, ocr_service
+from backend.api.services.deadline import Deadline, OCRCancelled
+
+
+def slow_ocr(img, config, deadline=None):
+    """Stands in for a Tesseract run that honours its deadline, like _run_tesseract_cli."""
+    end = time.monotonic() + 10
+    while time.monotonic() < end:
+        if deadline is not None:
+            deadline.check()
+        time.sleep(0.02)
+    return []
+
+
+def test_cancel_reaches_strips_running_in_workers(monkeypatch):
+    # Workers are forked after these patches, so they run slow_ocr too
+    monkeypatch.setattr(ocr_service, "run_tesseract_data", slow_ocr)
+    monkeypatch.setattr(ocr_pool, "OCR_PROCESS_WORKERS", 2)
+    ocr_pool.shutdown()
+    deadline = Deadline(None)
+    threading.Timer(0.5, deadline.cancel, ("client_disconnected",)).start()
+    start = time.monotonic()
+    try:
+        with pytest.raises(OCRCancelled):
+            ocr_pool.ocr_strips(Image.new("L", (200, 400), 255), [(0, 200), (200, 400)], "--psm 6", deadline)
+    finally:
+        # Waits for the running strips, which only stop early on the shared flag
+        ocr_pool.shutdown()
+    assert time.monotonic() - start < 5
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from backend.api.services import ocr_scheduler
+from backend.api.services.deadline import Deadline
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.005)
+
+
+def run_contended(scheduler, tasks):
+    """
+    Hold the only slot, queue `tasks` ((name, deadline) in arrival order),
+    then release it and return the order the tasks were served in.
+    """
+    holder = Deadline(None)
+    scheduler.acquire(holder, 1.0)
+    order = []
+
+    def task(name, deadline):
+        scheduler.acquire(deadline, 1.0)
+        order.append(name)
+        scheduler.release()
+
+    threads = []
+    for name, deadline in tasks:
+        thread = threading.Thread(target=task, args=(name, deadline))
+        thread.start()
+        threads.append(thread)
+        queued = len(threads)
+        wait_for(lambda: len(scheduler._queue) == queued)
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_interactive_page_overtakes_queued_batch_pages():
+    scheduler = ocr_scheduler.OCRScheduler(1, {"interactive": 8.0, "batch": 1.0})
+    batch = Deadline(None, "batch")
+    photo = Deadline(None, "interactive")
+    order = run_contended(scheduler, [("pdf1", batch), ("pdf2", batch), ("pdf3", batch), ("photo", photo)])
+    assert order == ["pdf1", "photo", "pdf2", "pdf3"]
+
+
+def test_jobs_sharing_a_flow_are_charged_together():
+    scheduler = ocr_scheduler.OCRScheduler(1, {"interactive": 1.0})
+    flow = ocr_scheduler.Flow()
+    jobs = [Deadline(None, "interactive") for _ in range(3)]
+    for job in jobs:
+        job.flow = flow
+    other = Deadline(None, "interactive")
+    order = run_contended(scheduler, [("a1", jobs[0]), ("a2", jobs[1]), ("a3", jobs[2]), ("b", other)])
+    assert order == ["a1", "b", "a2", "a3"]
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    scheduler = ocr_scheduler.OCRScheduler(1, {"interactive": 1.0})
+    holder = Deadline(None)
+    scheduler.acquire(holder, 1.0)
+    waiter = Deadline(None)
+    errors = []
+
+    def task():
+        try:
+            scheduler.acquire(waiter, 1.0)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=task)
+    thread.start()
+    wait_for(lambda: len(scheduler._queue) == 1)
+    waiter.cancel("client disconnected")
+    thread.join(5)
+    assert errors and not scheduler._queue
+    scheduler.release()
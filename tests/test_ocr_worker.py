@@ -0,0 +1,50 @@
+import io
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from backend import ocr_worker
+from backend.api.services import ocr_scheduler
+from backend.api.services.deadline import Deadline
+
+client = TestClient(ocr_worker.app)
+
+
+@pytest.mark.parametrize("config", [
+    "--oem 1 --psm 6 -c tessedit_char_whitelist=0123456789.,",
+    "--psm 7 -c load_system_dawg=0 -c load_freq_dawg=0",
+])
+def test_profile_variables_are_allowed(config):
+    ocr_worker.check_config(config)
+
+
+@pytest.mark.parametrize("config", [
+    "-c tessedit_write_images=1",
+    "-c debug_file=/tmp/x",
+    "--psm 6 tsv",
+    "--psm",
+    "-c tessedit_char_whitelist",
+    "--tessdata-dir /tmp",
+])
+def test_other_configs_are_refused(config):
+    with pytest.raises(ValueError):
+        ocr_worker.check_config(config)
+    assert client.post("/ocr", params={"config": config}, content=b"").status_code == 400
+
+
+def test_queued_job_gives_up_at_its_timeout(monkeypatch):
+    scheduler = ocr_scheduler.OCRScheduler(1, ocr_scheduler.PRIORITY_WEIGHTS)
+    monkeypatch.setattr(ocr_scheduler, "scheduler", scheduler)
+    scheduler.acquire(Deadline(None), 1.0)
+    png = io.BytesIO()
+    Image.new("RGB", (20, 20), "white").save(png, format="PNG")
+    start = time.monotonic()
+    try:
+        response = client.post("/ocr", content=png.getvalue(), headers={"X-Request-Timeout": "0.3"})
+    finally:
+        scheduler.release()
+    assert response.status_code == 504
+    assert time.monotonic() - start < 2
+    assert not scheduler._queue
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+from backend.api.services import ocr_service, page_dedup
+from backend.api.utils.imagehash import hamming
+from backend.api.utils.mih import MultiIndexHash
+
+
+def test_mih_search_matches_a_linear_scan():
+    rng = random.Random(7)
+    index = MultiIndexHash(64, 4)
+    hashes = {i: rng.getrandbits(64) for i in range(500)}
+    for key, h in hashes.items():
+        index.add(key, h)
+    # Near copies of a stored hash, up to 12 bits away
+    for i in range(20):
+        near = hashes[i]
+        for bit in rng.sample(range(64), rng.randint(0, 12)):
+            near ^= 1 << bit
+        hashes[f"near{i}"] = near
+        index.add(f"near{i}", near)
+    index.remove(3)
+    del hashes[3]
+    for query in [hashes[i] for i in range(20) if i != 3] + [rng.getrandbits(64) for _ in range(20)]:
+        for radius in (0, 6, 12):
+            expected = sorted((hamming(query, h), key) for key, h in hashes.items() if hamming(query, h) <= radius)
+            found = index.search(query, radius)
+            assert [d for d, _ in found] == sorted(d for d, _ in found)
+            assert sorted(found, key=str) == sorted(expected, key=str)
+
+
+WORDS = [
+    {"block_num": 1, "par_num": 1, "line_num": 1, "left": 20, "top": 20, "width": 120, "height": 16,
+     "conf": 95.0, "text": "Hemoglobin"},
+    {"block_num": 1, "par_num": 1, "line_num": 1, "left": 200, "top": 20, "width": 40, "height": 16,
+     "conf": 95.0, "text": "13.5"},
+    {"block_num": 1, "par_num": 1, "line_num": 2, "left": 20, "top": 50, "width": 60, "height": 16,
+     "conf": 95.0, "text": "Platelets"},
+    {"block_num": 1, "par_num": 1, "line_num": 2, "left": 200, "top": 50, "width": 40, "height": 16,
+     "conf": 95.0, "text": "250"},
+]
+
+
+@pytest.fixture
+def page(monkeypatch):
+    monkeypatch.setattr(page_dedup, "_index", page_dedup.PageIndex())
+    img = Image.new("RGB", (400, 300), "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(20, 280, 30):
+        draw.rectangle((20, y, 20 + (y * 7) % 300, y + 14), fill="black")
+    return img
+
+
+def cells_read_as(monkeypatch, values):
+    """Make every value cell read back as the next of `values`, recording the reads."""
+    reads = []
+
+    def read_cell(img, box, deadline=None, config=None):
+        reads.append(box)
+        return values[len(reads) - 1]
+    monkeypatch.setattr(page_dedup, "read_cell", read_cell)
+    return reads
+
+
+def test_duplicate_is_reused_once_every_cell_verifies(monkeypatch, page):
+    text = ocr_service.words_to_text(WORDS)
+    assert text == "Hemoglobin 13.5\nPlatelets 250"
+    page_dedup.remember(page, "--psm 6", "client", text, WORDS)
+    reads = cells_read_as(monkeypatch, [13.5, 250.0])
+    assert page_dedup.lookup(page.copy(), "--psm 6", "client") == text
+    assert len(reads) == 2
+
+
+def test_duplicate_with_another_value_is_rejected(monkeypatch, page):
+    page_dedup.remember(page, "--psm 6", "client", ocr_service.words_to_text(WORDS), WORDS)
+    cells_read_as(monkeypatch, [13.5, 190.0])
+    assert page_dedup.lookup(page.copy(), "--psm 6", "client") is None
+
+
+def test_duplicate_is_not_shared_across_scopes_or_configs(monkeypatch, page):
+    page_dedup.remember(page, "--psm 6", "client", ocr_service.words_to_text(WORDS), WORDS)
+    reads = cells_read_as(monkeypatch, [13.5, 250.0])
+    assert page_dedup.lookup(page, "--psm 6", "other") is None
+    assert page_dedup.lookup(page, "--psm 4", "client") is None
+    assert reads == []
+
+
+def test_miss_runs_tesseract_once(monkeypatch, page):
+    calls = []
+
+    def run_tesseract_data(img, config, deadline=None):
+        calls.append(config)
+        return WORDS
+    monkeypatch.setattr(ocr_service, "run_tesseract_data", run_tesseract_data)
+    monkeypatch.setattr(ocr_service, "run_tesseract", lambda *a, **k: pytest.fail("second OCR pass"))
+    assert page_dedup.ocr_page(page, "--psm 6", "client") == "Hemoglobin 13.5\nPlatelets 250"
+    assert calls == ["--psm 6"] and len(page_dedup._index) == 1
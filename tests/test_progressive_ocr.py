@@ -0,0 +1,24 @@
+from PIL import Image
+
+from backend.api.services import ocr_service, progressive_ocr
+
+# "Hemoglobin" with no value: a line that needs a high-resolution re-scan
+WORDS = [
+    {"block_num": 1, "par_num": 1, "line_num": 1, "left": 20, "top": 20, "width": 120, "height": 16,
+     "conf": 40.0, "text": "Hemoglobin"},
+]
+
+
+def test_missing_high_res_keeps_the_cheap_pass(monkeypatch):
+    seen = []
+
+    def fake_data(img, config, deadline=None):
+        seen.append(img.mode)
+        return WORDS
+
+    monkeypatch.setattr(ocr_service, "run_tesseract_data", fake_data)
+    low = Image.new("RGB", (400, 100), "white")
+    text = progressive_ocr.ocr_page(low, lambda: None, preprocess=["grayscale"])
+    assert text == "Hemoglobin"
+    # The cheap pass ran once, on the preprocessed image
+    assert seen == ["L"]
@@ -0,0 +1,39 @@
+import threading
+import time
+
+import pytest
+
+from backend.api.services import ocr_profiles, remote_ocr
+from backend.api.services.deadline import Deadline, OCRCancelled
+
+
+@pytest.mark.parametrize("psm", [None, 4, 11])
+def test_profiles_are_sent_by_name_with_their_psm(psm):
+    config = ocr_profiles.profile_config(ocr_profiles.DEFAULT_PROFILE, psm)
+    params = remote_ocr._profile_params(config)
+    assert params["profile"] == ocr_profiles.DEFAULT_PROFILE
+    assert ocr_profiles.profile_config(params["profile"], params.get("psm")) == config
+
+
+def test_unknown_config_is_sent_verbatim():
+    assert remote_ocr._profile_params("--oem 0 --psm 6") == {"config": "--oem 0 --psm 6"}
+
+
+def test_cancelled_request_stops_waiting_on_worker():
+    release = threading.Event()
+
+    class SlowSession:
+        def post(self, *args, **kwargs):
+            release.wait(10)
+            raise AssertionError("answer arrived after cancellation")
+
+    tier = remote_ocr.WorkerTier(["http://worker"])
+    tier._session = SlowSession()
+    deadline = Deadline(30)
+    threading.Timer(0.2, deadline.cancel, ("client_disconnected",)).start()
+    start = time.monotonic()
+    with pytest.raises(OCRCancelled):
+        tier.dispatch(b"png", {"kind": "text"}, deadline)
+    assert time.monotonic() - start < 2
+    release.set()
+    tier.stop()
@@ -0,0 +1,39 @@
+import pytest
+from starlette.requests import Request
+
+from backend.api import main
+
+
+def deadline_for(header):
+    headers = [] if header is None else [(b"x-request-timeout", header.encode())]
+    request = Request({"type": "http", "method": "POST", "path": "/upload-report", "headers": headers})
+    return main.request_deadline(request)
+
+
+@pytest.mark.parametrize("header", [None, "0", "-5", "nan", "inf", "abc", "1e9"])
+def test_header_never_lifts_the_server_deadline(header):
+    remaining = deadline_for(header).remaining()
+    assert remaining is not None
+    assert 0 < remaining <= main.REQUEST_DEADLINE_SECONDS
+
+
+def test_header_tightens_the_deadline():
+    assert deadline_for("2").remaining() <= 2
+    assert deadline_for("0").remaining() <= main.MIN_REQUEST_TIMEOUT_SECONDS
+
+
+def request_with(name, value):
+    return Request({"type": "http", "method": "POST", "path": "/upload-report",
+                    "headers": [(name.encode(), value.encode())]})
+
+
+@pytest.mark.parametrize("profile", ["numeric", "numeric_fast", "nope"])
+def test_cell_and_unknown_profiles_are_refused_for_pages(profile):
+    with pytest.raises(main.HTTPException) as e:
+        main.request_profile(request_with("x-ocr-profile", profile))
+    assert e.value.status_code == 400
+
+
+def test_page_profiles_are_accepted():
+    for profile in main.ocr_profiles.PAGE_PROFILES:
+        assert main.request_profile(request_with("x-ocr-profile", profile)) == profile
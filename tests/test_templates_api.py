@@ -0,0 +1,16 @@
+from fastapi.testclient import TestClient
+
+from backend.api import main
+
+client = TestClient(main.app)
+
+
+def test_template_changes_need_admin_token(monkeypatch):
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+    assert client.delete("/templates/abc").status_code == 403
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    assert client.delete("/templates/abc").status_code == 403
+    assert client.delete("/templates/abc", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    response = client.post("/templates", data={"name": "lab"}, files={"file": ("a.png", b"x", "image/png")})
+    assert response.status_code == 403
+    assert client.delete("/templates/abc", headers={"Authorization": "Bearer secret"}).status_code == 404
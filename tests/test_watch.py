@@ -0,0 +1,56 @@
+import os
+
+from backend import watch
+
+
+def die_once(path, sha256=None):
+    """process_file stand-in whose worker process dies the first time it runs."""
+    marker = f"{path}.died"
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return {"file": path, "sha256": sha256, "status": "success"}
+
+
+def always_die(path, sha256=None):
+    os._exit(1)
+
+
+class ListSink:
+    def __init__(self, watcher_ref):
+        self.records = []
+        self.watcher_ref = watcher_ref
+
+    def write(self, record):
+        self.records.append(record)
+        self.watcher_ref[0].stop()
+
+    def close(self):
+        pass
+
+
+def run_watcher(tmp_path, monkeypatch, process_file):
+    monkeypatch.setattr(watch, "process_file", process_file)
+    monkeypatch.setattr(watch, "init_watch_worker", None)
+    scans = tmp_path / "scans"
+    scans.mkdir()
+    (scans / "report.png").write_bytes(b"not really a png")
+    ref = []
+    sink = ListSink(ref)
+    watcher = watch.FolderWatcher([scans], sink, watch.Checkpoint(tmp_path / "checkpoint.json"),
+                                  workers=1, settle=0, interval=0.05)
+    ref.append(watcher)
+    watcher.run()
+    return sink.records, watcher.checkpoint
+
+
+def test_reports_in_a_dead_worker_are_retried(tmp_path, monkeypatch):
+    records, checkpoint = run_watcher(tmp_path, monkeypatch, die_once)
+    assert [r["status"] for r in records] == ["success"]
+    assert [e["status"] for e in checkpoint.files.values()] == ["success"]
+
+
+def test_report_that_keeps_killing_workers_is_recorded_as_error(tmp_path, monkeypatch):
+    records, _ = run_watcher(tmp_path, monkeypatch, always_die)
+    assert [r["status"] for r in records] == ["error"]
+    assert records[0]["error"] == "worker process died"